@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused: 429 when its client is over its rate, 503 when the server is overloaded"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        # Whole seconds, as the Retry-After header wants them
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class RateLimiter:
+    def __init__(self, name: str, rate: float, burst: float, max_clients: int = 10000):
+        """Per-client token buckets refilled at rate requests per second up to burst; rate 0 disables the limit"""
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # client -> (tokens, last refill); the least recently seen clients are forgotten first,
+        # which only ever hands them a full bucket
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, client: str, cost: float = 1.0):
+        """Take cost tokens from the client's bucket, or raise with the time until it holds them"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(client)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return
+            self.limited += 1
+            wait = (cost - bucket[0]) / self.rate
+        metrics.ADMISSION_REJECTIONS.labels(self.name, "rate_limited").inc()
+        raise AdmissionRejected(429, f"Too many {self.name} requests, please slow down", wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited
+        }
+
+class AdmissionPool:
+    def __init__(self, name: str, max_concurrent: int, max_queued: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, retry_after: float = 1.0,
+                 yields_to: Optional[List["AdmissionPool"]] = None, yield_at: Optional[int] = None,
+                 yield_timeout: Optional[float] = None):
+        """Bounded concurrency with a FIFO wait queue, shedding work once the queue is full
+
+        max_queued and queue_timeout of None wait without limit, for background
+        work that must not be dropped. A pool that yields_to others waits before
+        admitting work while any of them has requests waiting or, with yield_at,
+        that many or more active. It waits at most yield_timeout seconds each
+        time, so it is slowed down but never starved.
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.yields_to = yields_to or []
+        self.yield_at = yield_at
+        self.yield_timeout = yield_timeout
+        self.active = 0
+        self._waiters: deque = deque()
+        # Set on the next change to active or queued, for pools that yield to this one. It is
+        # made by the first waiter, inside the running loop: the controller is built when main
+        # is imported, and before Python 3.10 an Event binds to the loop current at creation
+        self._changed: Optional[asyncio.Event] = None
+
+        # Counters
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.yielded = 0
+        self.yield_timeouts = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def check(self):
+        """Shed now if a new request would find the queue full, before any response has started"""
+        if self.max_queued is not None and self.active >= self.max_concurrent and self.queued >= self.max_queued:
+            self.shed += 1
+            metrics.ADMISSION_REJECTIONS.labels(self.name, "queue_full").inc()
+            raise AdmissionRejected(503, f"Server is busy ({self.name} queue full), please retry later", self.retry_after)
+
+    async def acquire(self):
+        await self.defer()
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self._admit()
+            return
+        self.check()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_state()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._withdraw(waiter):
+                return
+            self.timed_out += 1
+            metrics.ADMISSION_REJECTIONS.labels(self.name, "timeout").inc()
+            raise AdmissionRejected(
+                503, f"Server is busy ({self.name} queue wait timed out), please retry later", self.retry_after
+            )
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                # The slot was handed over just as the request went away
+                self.release()
+            raise
+
+    def _outranked_by(self, pool: "AdmissionPool") -> bool:
+        return pool.queued > 0 or (self.yield_at is not None and pool.active >= self.yield_at)
+
+    async def defer(self):
+        """Wait, for at most yield_timeout, until none of the pools this one yields to is busy
+
+        acquire() does this first; work that runs outside the pool's slots, such
+        as PDF extraction feeding it, can call it to back off the same way.
+        """
+        if not any(self._outranked_by(pool) for pool in self.yields_to):
+            return
+        self.yielded += 1
+        deadline = None if self.yield_timeout is None else time.monotonic() + self.yield_timeout
+        for pool in self.yields_to:
+            while self._outranked_by(pool):
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    await asyncio.wait_for(pool._changed_event().wait(), remaining)
+                except asyncio.TimeoutError:
+                    self.yield_timeouts += 1
+                    return
+
+    def _changed_event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _withdraw(self, waiter: asyncio.Future) -> bool:
+        """Leave the queue; False if a slot was already handed to this waiter"""
+        if waiter.done():
+            return False
+        self._waiters.remove(waiter)
+        waiter.cancel()
+        self._update_state()
+        return True
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        self._update_state()
+
+    def release(self):
+        # The slot passes straight to the longest waiting request
+        self.active -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+                break
+        self._update_state()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def guard(self, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Hold a slot for as long as an event stream runs, or end it with an error event if none frees up
+
+        The slot is taken when the stream starts, so a stream that is never
+        iterated holds nothing; check() beforehand turns a full queue into a 503.
+        """
+        iterator = events.__aiter__()
+        try:
+            try:
+                await self.acquire()
+            except AdmissionRejected as e:
+                yield {"type": "error", "content": e.detail, "retry_after": e.retry_after}
+                return
+            try:
+                async for event in iterator:
+                    yield event
+            finally:
+                self.release()
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    def _update_state(self):
+        if self._changed is not None:
+            # Wake the pools waiting on this change; the next waiter makes a fresh event
+            self._changed.set()
+            self._changed = None
+        metrics.ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        metrics.ADMISSION_QUEUED.labels(self.name).set(self.queued)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "yielded": self.yielded,
+            "yield_timeouts": self.yield_timeouts
+        }
+
+class AdmissionController:
+    def __init__(self, query: AdmissionPool, batch: AdmissionPool, ingest: AdmissionPool,
+                 chat_limiter: RateLimiter, upload_limiter: RateLimiter, trust_forwarded: bool = False):
+        """Concurrency pools and per-client rate limits in front of the chat and upload endpoints"""
+        self.query = query
+        self.batch = batch
+        self.ingest = ingest
+        self.chat_limiter = chat_limiter
+        self.upload_limiter = upload_limiter
+        self.trust_forwarded = trust_forwarded
+
+    def client_key(self, request) -> str:
+        """Who a request is rate limited as: its address, or the first X-Forwarded-For hop behind a trusted proxy"""
+        if self.trust_forwarded:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pools": {pool.name: pool.get_stats() for pool in (self.query, self.batch, self.ingest)},
+            "rate_limits": {limiter.name: limiter.get_stats() for limiter in (self.chat_limiter, self.upload_limiter)}
+        }
+
+def create_admission_controller() -> AdmissionController:
+    """Build the pools and rate limits configured by the ADMISSION_*, CHAT_* and UPLOAD_* variables"""
+    query = AdmissionPool(
+        "query",
+        max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENT", "32")),
+        max_queued=int(os.getenv("CHAT_MAX_QUEUED", "64")),
+        queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "10")),
+        retry_after=float(os.getenv("CHAT_RETRY_AFTER_SECONDS", "2"))
+    )
+    batch = AdmissionPool(
+        "batch",
+        max_concurrent=int(os.getenv("CHAT_BATCH_MAX_CONCURRENT", "2")),
+        max_queued=int(os.getenv("CHAT_BATCH_MAX_QUEUED", "4")),
+        queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "10")),
+        retry_after=float(os.getenv("CHAT_BATCH_RETRY_AFTER_SECONDS", "30")),
+        yields_to=[query]
+    )
+    # Ingestion runs in the background and is never shed, only slowed down
+    yield_at = int(os.getenv("INGEST_YIELD_AT_ACTIVE_CHATS", "4"))
+    ingest = AdmissionPool(
+        "ingest",
+        max_concurrent=int(os.getenv(
+            "INGEST_EMBED_CONCURRENCY", str(max(1, int(os.getenv("EMBEDDING_MAX_WORKERS", "2")) - 1))
+        )),
+        yields_to=[query],
+        yield_at=yield_at if yield_at > 0 else None,
+        yield_timeout=float(os.getenv("INGEST_YIELD_TIMEOUT_SECONDS", "2"))
+    )
+    return AdmissionController(
+        query=query,
+        batch=batch,
+        ingest=ingest,
+        chat_limiter=RateLimiter(
+            "chat", float(os.getenv("CHAT_RATE_LIMIT", "5")), float(os.getenv("CHAT_RATE_BURST", "20"))
+        ),
+        upload_limiter=RateLimiter(
+            "upload", float(os.getenv("UPLOAD_RATE_LIMIT", "0.5")), float(os.getenv("UPLOAD_RATE_BURST", "5"))
+        ),
+        trust_forwarded=os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    )
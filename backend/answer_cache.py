@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedAnswer:
+    question: str
+    response: str
+    sources: List[str]
+    embedding: np.ndarray
+    variant: str
+    min_similarity: float
+    terms: FrozenSet[str] = frozenset()
+    created_at: float = field(default_factory=time.time)
+
+class SemanticAnswerCache:
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600,
+                 max_entries: int = 512):
+        """Cache generated answers keyed on the query embedding"""
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        """Drop entries older than the TTL"""
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, embedding, variant: str = "") -> Optional[CachedAnswer]:
+        """Return the most similar cached answer above the threshold"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire()
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry.variant == variant]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([entry.embedding for _, entry in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, embedding, question: str, response: str, sources: List[str],
+              distances: List[float], n_results: int, variant: str = "",
+              terms: Iterable[str] = ()):
+        """Cache an answer together with the retrieval it was built from"""
+        # A new chunk only changes this answer if it would have made the top-k,
+        # i.e. if it is closer to the query than the furthest retrieved chunk
+        if len(distances) < n_results:
+            min_similarity = -1.0
+        else:
+            min_similarity = 1.0 - max(distances)
+
+        entry = CachedAnswer(
+            question=question,
+            response=response,
+            sources=list(sources),
+            embedding=self._normalize(embedding),
+            variant=variant,
+            min_similarity=min_similarity,
+            # Keyword retrieval can surface any new chunk sharing a query term
+            terms=frozenset(terms)
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sources: Iterable[str] = (), embeddings=None, terms: Iterable[str] = ()) -> int:
+        """Drop answers built from changed sources or that new chunks would change"""
+        sources = set(sources)
+        terms = set(terms)
+        with self._lock:
+            if not self._entries:
+                return 0
+
+            keys = list(self._entries.keys())
+            stale = {
+                key for key in keys
+                if sources.intersection(self._entries[key].sources)
+                or not terms.isdisjoint(self._entries[key].terms)
+            }
+
+            if embeddings is not None and len(embeddings):
+                chunks = np.asarray(embeddings, dtype=np.float32)
+                chunks = chunks / np.maximum(np.linalg.norm(chunks, axis=1, keepdims=True), 1e-12)
+                queries = np.stack([self._entries[key].embedding for key in keys])
+                thresholds = np.array([self._entries[key].min_similarity for key in keys], dtype=np.float32)
+                closest = (queries @ chunks.T).max(axis=1)
+                stale.update(key for key, hit in zip(keys, closest >= thresholds) if hit)
+
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers")
+        return len(stale)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache size and hit rate"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "similarity_threshold": self.similarity_threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
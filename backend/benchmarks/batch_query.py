@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Batch query benchmark: POST /chat/batch against a sequential /chat loop.
+
+Starts the server with the in-process mock LLM, uploads a synthetic corpus,
+then answers the same distinct questions twice: one /chat call at a time,
+the way offline evaluation jobs do, and in a single /chat/batch request. The
+answer cache is off, so every question is retrieved and generated. Each LLM
+latency setting is a fresh server:
+
+    python benchmarks/batch_query.py --questions 200 --llm-latency 0:0 200:20
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import WORDS, random_paragraph, write_pdf
+from worker_scaling import upload, wait_for
+
+def sequential(url: str, questions) -> dict:
+    start = time.perf_counter()
+    with httpx.Client(base_url=url, timeout=120.0) as client:
+        for question in questions:
+            client.post("/chat", json={"message": question}).raise_for_status()
+    return {"total_s": round(time.perf_counter() - start, 3)}
+
+def batched(url: str, questions, concurrency: int) -> dict:
+    start = time.perf_counter()
+    first = None
+    answered = 0
+    with httpx.Client(base_url=url, timeout=600.0) as client:
+        body = {"questions": questions, "concurrency": concurrency}
+        with client.stream("POST", "/chat/batch", json=body) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "answer":
+                    answered += 1
+                    if first is None:
+                        first = time.perf_counter() - start
+    if answered != len(questions):
+        raise RuntimeError(f"Batch answered {answered} of {len(questions)} questions")
+    return {"total_s": round(time.perf_counter() - start, 3), "first_answer_s": round(first, 3)}
+
+def run(ttft_ms: float, itl_ms: float, args, pdfs, questions) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            LLM_BACKEND="mock",
+            MOCK_LLM_TTFT_MS=str(ttft_ms),
+            MOCK_LLM_ITL_MS=str(itl_ms),
+            ANSWER_CACHE_ENABLED="false",
+            CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "data"),
+            INGESTION_JOBS_DIRECTORY=os.path.join(workdir, "jobs")
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            wait_for(f"{url}/health/ready", 300, server)
+            with httpx.Client(base_url=url, timeout=60.0) as client:
+                for path in pdfs:
+                    upload(client, path)
+                # Warm up the model before measuring
+                for i in range(5):
+                    client.post("/chat", json={"message": f"warm up {i}"})
+            # Different questions per mode, so neither reuses the other's query embeddings
+            half = len(questions) // 2
+            row = {
+                "ttft_ms": ttft_ms,
+                "itl_ms": itl_ms,
+                "questions": half,
+                "sequential": sequential(url, questions[:half]),
+                "batch": batched(url, questions[half:], args.concurrency)
+            }
+            row["speedup"] = round(row["sequential"]["total_s"] / row["batch"]["total_s"], 2)
+            return row
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch query benchmark")
+    parser.add_argument("--questions", type=int, default=200, help="Questions per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight for the batch")
+    parser.add_argument("--llm-latency", nargs="+", default=["0:0", "200:20"],
+                        help="Mock LLM TTFT_MS:ITL_MS settings to run")
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document")
+    parser.add_argument("--port", type=int, default=8769)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    questions = [
+        f"What does the {' '.join(rng.choice(WORDS) for _ in range(3))} do? #{i}" for i in range(2 * args.questions)
+    ]
+    results = []
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        pdfs = []
+        for i in range(args.documents):
+            path = os.path.join(corpus_dir, f"doc_{i}.pdf")
+            write_pdf(path, args.pages, lambda page: random_paragraph(rng, sentences=12))
+            pdfs.append(path)
+        for setting in args.llm_latency:
+            ttft_ms, itl_ms = (float(value) for value in setting.split(":"))
+            row = run(ttft_ms, itl_ms, args, pdfs, questions)
+            results.append(row)
+            if not args.json:
+                print(f"llm ttft={ttft_ms:g}ms itl={itl_ms:g}ms  {row['questions']} questions: "
+                      f"sequential /chat {row['sequential']['total_s']} s, "
+                      f"/chat/batch {row['batch']['total_s']} s (first answer after "
+                      f"{row['batch']['first_answer_s']} s)  speedup {row['speedup']}x")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
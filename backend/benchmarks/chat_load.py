@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the /chat endpoint.
+
+Fires N concurrent /chat requests at a running backend and reports
+latency percentiles and throughput. Run it once against the old build and
+once against the new one to compare:
+
+    python benchmarks/chat_load.py --url http://localhost:8000 --concurrency 32 --requests 256
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values using nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(latencies: List[float], errors: int, wall_time: float) -> Dict[str, Any]:
+    """Summarize request latencies in milliseconds"""
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+async def run_load(url: str, concurrency: int, total_requests: int, question: str,
+                   timeout: float) -> Dict[str, Any]:
+    """Send total_requests /chat calls with at most concurrency in flight"""
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def one_request(i: int):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json={"message": f"{question} ({i})"})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+        wall_time = time.perf_counter() - start
+
+    return summarize(latencies, errors, wall_time)
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /chat load benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--question", default="What is machine learning?")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_load(args.url, concurrency, args.requests, args.question, args.timeout))
+        result["concurrency"] = concurrency
+        results.append(result)
+        if not args.json:
+            print(f"concurrency={concurrency:<4} p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                  f"throughput={result['throughput_rps']} req/s errors={result['errors']}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
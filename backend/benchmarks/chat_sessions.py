@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Conversation session benchmark.
+
+Ingests the regression benchmark's synthetic corpus into a fresh RAGPipeline
+(mock LLM, answer cache off), then holds scripted conversations: each topic
+is a fact question followed by rephrased follow-ups about the same unit, and
+every conversation moves through several topics. The same turns run twice,
+stateless (no session_id) and as one session per conversation:
+
+    python benchmarks/chat_sessions.py --conversations 20 --topics 3 --follow-ups 3
+
+Reports retrieval time per turn, how many turns skipped retrieval, and
+prompt tokens per turn. The session's prompts carry the history as plain
+questions and answers; "with contexts" estimates the same prompts if every
+earlier turn had also resent the context it was answered from.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from regression import build_corpus
+from synthetic_pdf import write_pdf
+
+# Follow-ups that stay on the topic of the question before them
+FOLLOW_UPS = [
+    "Could you repeat that: {question}",
+    "{question} Please be specific.",
+    "Just to confirm, {question}",
+    "Sorry, once more: {question}"
+]
+
+def conversations(rng: random.Random, questions, count: int, topics: int, follow_ups: int):
+    """Lists of turns, each turn a question; topics are drawn from the corpus questions"""
+    script = []
+    for _ in range(count):
+        turns = []
+        for question, _ in rng.sample(questions, topics):
+            turns.append(question)
+            turns.extend(rng.choice(FOLLOW_UPS).format(question=question) for _ in range(follow_ups))
+        script.append(turns)
+    return script
+
+def summarize(retrieval_ms, prompt_tokens) -> dict:
+    return {
+        "retrieval_p50_ms": round(float(np.percentile(retrieval_ms, 50)), 3),
+        "retrieval_mean_ms": round(float(np.mean(retrieval_ms)), 3),
+        "prompt_tokens_mean": round(float(np.mean(prompt_tokens)), 1) if prompt_tokens else None
+    }
+
+async def run(args, workdir: str) -> dict:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    os.environ["INGESTION_JOBS_DIRECTORY"] = os.path.join(workdir, "jobs")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_TTFT_MS"] = "0"
+    os.environ["MOCK_LLM_ITL_MS"] = "0"
+    os.environ["SESSION_REUSE_SIMILARITY"] = str(args.reuse_similarity)
+    from document_processor import DocumentProcessor
+    from rag_pipeline import RAGPipeline
+
+    rng = random.Random(args.seed)
+    corpus, questions = build_corpus(rng, args.documents, args.pages)
+    paths = []
+    for i, doc_pages in enumerate(corpus):
+        path = os.path.join(workdir, f"manual_{i:03d}.pdf")
+        write_pdf(path, len(doc_pages), lambda page: doc_pages[page])
+        paths.append(path)
+
+    pipeline = RAGPipeline()
+    processor = DocumentProcessor()
+    await processor.initialize_rag_pipeline(pipeline)
+    for path in paths:
+        await processor.process_file(path, os.path.basename(path))
+    processor.shutdown(wait=True)
+    script = conversations(rng, questions, args.conversations, args.topics, args.follow_ups)
+
+    # Embed every question once up front, so neither mode is charged for a cold query embedding cache
+    for turns in script:
+        for question in turns:
+            await pipeline.retrieve(question, args.k)
+
+    stateless_ms = []
+    for turns in script:
+        for question in turns:
+            stages = {}
+            await pipeline.query(question, args.k, trace=stages)
+            stateless_ms.append(stages["retrieval"])
+
+    session_ms, prompt_tokens, with_contexts, skipped = [], [], [], 0
+    for number, turns in enumerate(script):
+        contexts = []
+        for question in turns:
+            stages, turn = {}, {}
+            await pipeline.query(question, args.k, trace=stages, session_id=f"conversation-{number}", turn=turn)
+            session_ms.append(stages["retrieval"])
+            skipped += turn["retrieval_skipped"]
+            prompt_tokens.append(turn["prompt_tokens"])
+            # The turns in the prompt's history are the most recent ones
+            history = contexts[len(contexts) - turn["history_turns"]:] if turn["history_turns"] else []
+            with_contexts.append(turn["prompt_tokens"] + sum(history))
+            contexts.append(turn["context_tokens"])
+    await pipeline.close()
+
+    turns = sum(len(conversation) for conversation in script)
+    return {
+        "turns": turns,
+        "stateless": summarize(stateless_ms, []),
+        "session": {
+            **summarize(session_ms, prompt_tokens),
+            "retrieval_skips": skipped,
+            "skip_rate": round(skipped / turns, 3),
+            "prompt_tokens_with_contexts_mean": round(float(np.mean(with_contexts)), 1)
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation session benchmark")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document; each page holds one fact")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--topics", type=int, default=3, help="Fact questions per conversation")
+    parser.add_argument("--follow-ups", type=int, default=3, help="Rephrased follow-ups after each fact question")
+    parser.add_argument("--reuse-similarity", type=float, default=0.8)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    session = results["session"]
+    print(f"{results['turns']} turns in {args.conversations} conversations")
+    print(f"stateless  retrieval p50 {results['stateless']['retrieval_p50_ms']:>8} ms  "
+          f"mean {results['stateless']['retrieval_mean_ms']:>8} ms")
+    print(f"session    retrieval p50 {session['retrieval_p50_ms']:>8} ms  mean {session['retrieval_mean_ms']:>8} ms  "
+          f"skipped {session['retrieval_skips']} ({session['skip_rate']:.0%})")
+    print(f"prompt tokens per turn: {session['prompt_tokens_mean']} with question/answer history, "
+          f"{session['prompt_tokens_with_contexts_mean']} if history resent contexts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Chunking throughput benchmark.
+
+Compares chunks/sec and MB/sec on a large synthetic corpus for LangChain's
+RecursiveCharacterTextSplitter (the splitter used before the shared chunking
+stage), the offset-reporting RecursiveSplitter and the single-pass
+SentenceSplitter, both on the whole text and streamed page by page:
+
+    python benchmarks/chunking_throughput.py --megabytes 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunking import ChunkingStage, RecursiveSplitter, SentenceSplitter
+from synthetic_pdf import random_paragraph
+
+def build_pages(megabytes: float, seed: int = 0):
+    """Generate roughly megabytes of text split into ~2.5 KB pages"""
+    rng = random.Random(seed)
+    pages, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        page = "\n\n".join(random_paragraph(rng) for _ in range(4))
+        pages.append(page)
+        size += len(page) + 1
+    return pages
+
+def measure(label: str, func, text_size: int, repeat: int):
+    best = float("inf")
+    chunks = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = func()
+        best = min(best, time.perf_counter() - start)
+    return {
+        "splitter": label,
+        "chunks": chunks,
+        "seconds": round(best, 3),
+        "chunks_per_sec": round(chunks / best, 1),
+        "mb_per_sec": round(text_size / 1024 / 1024 / best, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking throughput benchmark")
+    parser.add_argument("--megabytes", type=float, default=20)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--pages-per-batch", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    pages = build_pages(args.megabytes)
+    text = "\n".join(pages)
+
+    langchain_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, length_function=len
+    )
+    recursive = RecursiveSplitter(args.chunk_size, args.chunk_overlap)
+    sentence = SentenceSplitter(args.chunk_size, args.chunk_overlap)
+
+    def streamed(splitter):
+        def run():
+            stage = ChunkingStage(splitter)
+            count = 0
+            for i in range(0, len(pages), args.pages_per_batch):
+                count += len(stage.feed(pages[i:i + args.pages_per_batch]))
+            return count + len(stage.finish())
+        return run
+
+    results = [
+        measure("langchain (previous)", lambda: len(langchain_splitter.split_text(text)), len(text), args.repeat),
+        measure("recursive", lambda: len(recursive.spans(text)), len(text), args.repeat),
+        measure("recursive, streamed", streamed(recursive), len(text), args.repeat),
+        measure("sentence", lambda: len(sentence.spans(text)), len(text), args.repeat),
+        measure("sentence, streamed", streamed(sentence), len(text), args.repeat),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"corpus: {len(text) / 1024 / 1024:.1f} MB, {len(pages)} pages")
+        for result in results:
+            print(f"{result['splitter']:<22} {result['chunks']:>8} chunks  {result['seconds']:7.3f}s  "
+                  f"{result['chunks_per_sec']:>10.1f} chunks/s  {result['mb_per_sec']:6.2f} MB/s")
+
+if __name__ == "__main__":
+    main()
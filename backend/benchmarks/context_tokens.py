@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Context assembly benchmark.
+
+Indexes synthetic documents, asks questions quoting passages (by default half
+of them across a chunk boundary), and compares the prompt context the old code built (the
+top chunks joined verbatim) with the context builder's merged, deduplicated
+and token-budgeted context:
+
+    python benchmarks/context_tokens.py --documents 20 --queries 200 --chunker recursive sentence
+
+Reports prompt tokens per request, tokens saved, merged chunks, distinct
+sources and the time taken to build the context.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph
+
+def build_document(rng: random.Random, doc: int, paragraphs: int) -> str:
+    """Long paragraphs, so chunks end mid-paragraph and overlap their neighbours
+
+    Every sentence carries a unique item code, so a question quoting a passage
+    retrieves the chunks containing it whatever the embedding model.
+    """
+    item = 0
+    parts = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(8, 20)):
+            sentences.append(f"{random_paragraph(rng, sentences=1)} See item {doc}x{item}.")
+            item += 1
+        parts.append(" ".join(sentences))
+    return "\n\n".join(parts)
+
+async def run_chunker(args, chunker: str, workdir: str) -> dict:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, chunker, "chroma_db")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["CONTEXT_MAX_TOKENS"] = str(args.max_tokens)
+    from chunking import create_splitter, split_text
+    from rag_pipeline import RAGPipeline
+
+    pipeline = RAGPipeline()
+    splitter = create_splitter(chunker)
+    rng = random.Random(0)
+    texts, boundaries = {}, {}
+    for doc in range(args.documents):
+        source = f"manual_{doc}.pdf"
+        texts[source] = build_document(rng, doc, args.paragraphs)
+        chunks = split_text(splitter, texts[source])
+        boundaries[source] = [chunk.end for chunk in chunks[:-1]]
+        update = await pipeline.begin_source_update(source)
+        await pipeline.add_chunks(update, chunks)
+        await pipeline.finish_source_update(update)
+
+    counter = pipeline.context_builder.counter
+    raw, built, merged, sources, distinct, build_ms, saved_merged = [], [], [], [], [], [], []
+    for _ in range(args.queries):
+        source = rng.choice(list(texts))
+        if rng.random() < args.boundary_fraction:
+            # Quote the text around the end of a chunk, which its neighbour repeats as overlap
+            center = rng.choice(boundaries[source])
+        else:
+            center = rng.randrange(len(texts[source]))
+        text = texts[source]
+        half = args.question_words // 2
+        before = text[max(0, center - 20 * half):center].split()[-half:]
+        after = text[center:center + 20 * half].split()[:half]
+        question = " ".join(before + after)
+
+        retrieval = await pipeline.retrieve(question, args.n_results)
+        start_time = time.perf_counter()
+        context = pipeline.context_builder.build(retrieval.documents, retrieval.metadatas)
+        build_ms.append((time.perf_counter() - start_time) * 1000)
+
+        raw.append(counter.count("\n\n".join(retrieval.documents)))
+        built.append(context.tokens)
+        merged.append(context.chunks_merged)
+        if context.chunks_merged:
+            saved_merged.append(raw[-1] - built[-1])
+        sources.append(len(retrieval.sources))
+        distinct.append(len(context.sources))
+
+    await pipeline.close()
+    raw_mean, built_mean = float(np.mean(raw)), float(np.mean(built))
+    return {
+        "chunker": chunker,
+        "exact_token_counts": counter.exact,
+        "raw_tokens_mean": round(raw_mean, 1),
+        "context_tokens_mean": round(built_mean, 1),
+        "tokens_saved_pct": round(100 * (raw_mean - built_mean) / raw_mean, 1) if raw_mean else 0.0,
+        "chunks_merged_mean": round(float(np.mean(merged)), 2),
+        "tokens_saved_when_merged_mean": round(float(np.mean(saved_merged)), 1) if saved_merged else 0.0,
+        "sources_listed_mean": round(float(np.mean(sources)), 2),
+        "sources_distinct_mean": round(float(np.mean(distinct)), 2),
+        "build_p50_ms": round(float(np.percentile(build_ms, 50)), 3),
+        "build_p95_ms": round(float(np.percentile(build_ms, 95)), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Context assembly benchmark")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=30, help="Paragraphs per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--question-words", type=int, default=40)
+    parser.add_argument("--boundary-fraction", type=float, default=0.5,
+                        help="Share of questions quoting text across a chunk boundary")
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=2000, help="Context token budget")
+    parser.add_argument("--chunker", nargs="+", default=["recursive", "sentence"])
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for chunker in args.chunker:
+            result = asyncio.run(run_chunker(args, chunker, workdir))
+            results.append(result)
+            if not args.json:
+                print(f"{chunker:<10} prompt tokens {result['raw_tokens_mean']} -> {result['context_tokens_mean']} "
+                      f"({result['tokens_saved_pct']}% saved)  merged chunks {result['chunks_merged_mean']} "
+                      f"(saving {result['tokens_saved_when_merged_mean']} tokens when merged)  "
+                      f"sources {result['sources_listed_mean']} -> {result['sources_distinct_mean']}  "
+                      f"build p50 {result['build_p50_ms']} ms / p95 {result['build_p95_ms']} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Document registry benchmark.
+
+Fills the SQLite document registry with N documents and times lookup by
+name, one page of the listing and the aggregate stats, next to the in-memory
+list the document processor used to keep (linear scan, full copy and full
+sums):
+
+    python benchmarks/document_registry.py --documents 1000 10000 100000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_store import DocumentStore
+
+def timed(func, repeat: int) -> float:
+    """Median milliseconds per call"""
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description="Document registry benchmark")
+    parser.add_argument("--documents", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.documents:
+        names = [f"document_{i:07d}.pdf" for i in range(count)]
+        documents = [{"filename": name, "text_length": 40000, "chunks": 50} for name in names]
+        with tempfile.TemporaryDirectory() as workdir:
+            store = DocumentStore(os.path.join(workdir, "documents.db"))
+            start = time.perf_counter()
+            for name in names:
+                store.upsert(name, 40000, 50, content_hash="0" * 64, size_bytes=250000, pages=20, ingest_ms=900.0)
+            insert_ms = (time.perf_counter() - start) * 1000 / count
+
+            def scan(i):
+                target = names[(i * 7919) % count]
+                next(doc for doc in documents if doc["filename"] == target)
+
+            def list_stats(_):
+                total = len(documents)
+                sum(doc["text_length"] for doc in documents)
+                sum(doc["chunks"] for doc in documents)
+                return total
+
+            row = {
+                "documents": count,
+                "registry_insert_ms": round(insert_ms, 4),
+                "registry_get_ms": timed(lambda i: store.get(names[(i * 7919) % count]), args.repeat),
+                "list_get_ms": timed(scan, args.repeat),
+                "registry_page_ms": timed(lambda i: store.list(args.page_size, (i * 7919) % count), args.repeat),
+                "list_copy_ms": timed(lambda _: documents.copy(), args.repeat),
+                "registry_stats_ms": timed(lambda _: store.stats(), args.repeat),
+                "list_stats_ms": timed(list_stats, args.repeat)
+            }
+            store.close()
+        results.append(row)
+        if not args.json:
+            print(f"documents={count:<7} get {row['registry_get_ms']} ms (list scan {row['list_get_ms']} ms)  "
+                  f"page of {args.page_size} {row['registry_page_ms']} ms (list copy {row['list_copy_ms']} ms)  "
+                  f"stats {row['registry_stats_ms']} ms (list sums {row['list_stats_ms']} ms)  "
+                  f"upsert {row['registry_insert_ms']} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-batching benchmark for query embeddings.
+
+Measures queries/sec through EmbeddingBatcher at several client concurrency
+levels, with batching enabled and with a batch size of one (the old
+behaviour of one encode call per query):
+
+    python benchmarks/embedding_batching.py --clients 1 8 32 128
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer
+
+from rag_pipeline import EmbeddingBatcher
+
+QUESTIONS = [
+    "What is machine learning?",
+    "How does retrieval augmented generation work?",
+    "Explain error code E1042 in the controller manual",
+    "Which part number replaces PN-7731-B?",
+    "Summarize the onboarding policy for contractors",
+    "What are the warranty terms for the pump assembly?",
+]
+
+async def run_clients(batcher: EmbeddingBatcher, clients: int, queries_per_client: int) -> float:
+    """Run clients that each embed queries back to back; return queries/sec"""
+    async def client(client_id: int):
+        for i in range(queries_per_client):
+            await batcher.embed(f"{QUESTIONS[(client_id + i) % len(QUESTIONS)]} #{client_id}-{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    return clients * queries_per_client / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding micro-batching benchmark")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--queries-per-client", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    async def encode(texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return (await loop.run_in_executor(executor, model.encode, texts)).tolist()
+
+    # Warm up the model so the first measurement is not skewed
+    model.encode(QUESTIONS)
+
+    results: List[Dict[str, Any]] = []
+    for clients in args.clients:
+        for label, batch_size in (("unbatched", 1), ("batched", args.batch_size)):
+            batcher = EmbeddingBatcher(encode, max_batch_size=batch_size, max_wait_ms=args.wait_ms)
+            qps = asyncio.run(run_clients(batcher, clients, args.queries_per_client))
+            stats = batcher.get_stats()
+            results.append({
+                "clients": clients,
+                "mode": label,
+                "queries_per_sec": round(qps, 1),
+                "average_batch_size": round(stats["average_batch_size"], 2),
+                "batches": stats["batches"],
+            })
+            if not args.json:
+                print(f"clients={clients:<4} {label:<9} {qps:8.1f} q/s  "
+                      f"avg batch={stats['average_batch_size']:.2f}")
+
+    executor.shutdown()
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Embedding engine benchmark: SentenceTransformer vs. ONNX Runtime vs. int8 ONNX.
+
+Embeds a fixed synthetic corpus with every engine and reports ingest
+throughput, single-query latency, cosine similarity to the SentenceTransformer
+embeddings and recall@5 against SentenceTransformer's top 5, both for new
+queries against the existing (SentenceTransformer-built) collection and for a
+collection re-embedded with the engine:
+
+    python benchmarks/embedding_engines.py --model-path /app/models/all-MiniLM-L6-v2 --threads 1 4
+
+The ONNX exports are written to a temporary directory unless --onnx-dir is given.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph
+
+def build_corpus(documents: int, queries: int):
+    """Chunks of one to eight sentences, and questions quoting part of a random chunk"""
+    rng = random.Random(0)
+    corpus = [random_paragraph(rng, sentences=rng.randint(1, 8)) for _ in range(documents)]
+    questions = []
+    for _ in range(queries):
+        words = rng.choice(corpus).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        questions.append(" ".join(words[start:start + 8]))
+    return corpus, questions
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall_at_k(expected: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(expected, found)]))
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def measure(engine, corpus, questions, batch_size: int) -> dict:
+    engine.encode(corpus[:batch_size])  # warm up
+    start_time = time.perf_counter()
+    corpus_embeddings = np.vstack([
+        engine.encode(corpus[start:start + batch_size]) for start in range(0, len(corpus), batch_size)
+    ])
+    ingest_s = time.perf_counter() - start_time
+
+    latencies, query_embeddings = [], []
+    for question in questions:
+        start_time = time.perf_counter()
+        query_embeddings.append(engine.encode([question])[0])
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return {
+        "corpus": normalize(np.asarray(corpus_embeddings, dtype=np.float32)),
+        "queries": normalize(np.asarray(query_embeddings, dtype=np.float32)),
+        "texts_per_s": round(len(corpus) / ingest_s, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding engine benchmark")
+    parser.add_argument("--model-path", default=os.getenv("EMBEDDING_MODEL_PATH", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--onnx-dir", help="Where to export the ONNX models (default: a temporary directory)")
+    parser.add_argument("--engines", nargs="+", default=["sentence-transformers", "onnx", "onnx-int8"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="Intra-op threads per engine run")
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--length-bucket", type=int, default=16)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    import torch
+    from embedding_engine import SentenceTransformerEngine, compare_embeddings, load_onnx_engine
+
+    corpus, questions = build_corpus(args.documents, args.queries)
+    model_dir = args.model_path
+    with tempfile.TemporaryDirectory() as workdir:
+        if not os.path.isdir(model_dir):
+            model_dir = os.path.join(workdir, "model")
+            SentenceTransformerEngine(args.model_path).model.save(model_dir)
+        onnx_dir = args.onnx_dir or os.path.join(workdir, "onnx")
+
+        reference = None
+        results = []
+        for engine_name in args.engines:
+            for threads in args.threads:
+                if engine_name == "sentence-transformers":
+                    torch.set_num_threads(threads)
+                    engine = SentenceTransformerEngine(model_dir, threads=threads, batch_size=args.batch_size)
+                else:
+                    engine = load_onnx_engine(
+                        model_dir, onnx_dir, quantize=engine_name == "onnx-int8", min_cosine=0.0,
+                        threads=threads, batch_size=args.batch_size, length_bucket=args.length_bucket
+                    )
+                run = measure(engine, corpus, questions, args.batch_size)
+                if reference is None:
+                    reference = run
+                expected = top_k(reference["queries"], reference["corpus"], args.k)
+                similarity = compare_embeddings(reference["corpus"], run["corpus"])
+                row = {
+                    "engine": engine_name,
+                    "threads": threads,
+                    "texts_per_s": run["texts_per_s"],
+                    "query_p50_ms": run["query_p50_ms"],
+                    "query_p95_ms": run["query_p95_ms"],
+                    "min_cosine": similarity["min_cosine"],
+                    "mean_cosine": similarity["mean_cosine"],
+                    # New queries against the collection as it was built
+                    "recall_existing_collection": round(recall_at_k(expected, top_k(run["queries"], reference["corpus"], args.k)), 4),
+                    # Collection re-embedded with this engine
+                    "recall_reindexed": round(recall_at_k(expected, top_k(run["queries"], run["corpus"], args.k)), 4),
+                    "padding_ratio": engine.get_stats().get("padding_ratio")
+                }
+                results.append(row)
+                if not args.json:
+                    print(f"{engine_name:<21} threads {threads:<2} {row['texts_per_s']:>7} texts/s  "
+                          f"query p50 {row['query_p50_ms']} ms / p95 {row['query_p95_ms']} ms  "
+                          f"cosine min {row['min_cosine']} mean {row['mean_cosine']}  "
+                          f"recall@{args.k} {row['recall_existing_collection']} (existing) "
+                          f"{row['recall_reindexed']} (reindexed)")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
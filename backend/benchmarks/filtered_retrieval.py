@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Filtered retrieval benchmark.
+
+Grows a collection of synthetic documents (100 chunks each) and measures
+retrieval latency unfiltered, scoped to one or ten documents through the
+in-memory prefilter, and scoped to one document through a Chroma `where`
+clause (the path broad filters fall back to). Scoped queries are measured
+cold (the document's embeddings are loaded into the per-source vector cache
+first) and warm:
+
+    python benchmarks/filtered_retrieval.py --sizes 5000 20000 50000
+
+Chunk and query embeddings are random unit vectors so that collections of
+this size can be built without running the embedding model; only retrieval
+is measured.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph
+
+CHUNKS_PER_DOCUMENT = 100
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3)
+
+async def grow(pipeline, Chunk, start_doc: int, end_doc: int, rng: random.Random, vectors: np.random.Generator):
+    """Index documents [start_doc, end_doc) with random embeddings"""
+    dimension = pipeline.embedding_model.get_sentence_embedding_dimension()
+
+    async def random_embeddings(texts):
+        matrix = vectors.standard_normal((len(texts), dimension)).astype(np.float32)
+        return (matrix / np.linalg.norm(matrix, axis=1, keepdims=True)).tolist()
+
+    pipeline._embed_documents = random_embeddings
+    for doc in range(start_doc, end_doc):
+        source = f"manual_{doc}.pdf"
+        update = await pipeline.begin_source_update(source)
+        chunks = [
+            Chunk(index=i, text=f"{source} part {i}. {random_paragraph(rng, 3)}", start=i * 500, end=i * 500 + 400,
+                  page=i // 4 + 1, page_end=i // 4 + 1)
+            for i in range(CHUNKS_PER_DOCUMENT)
+        ]
+        await pipeline.add_chunks(update, chunks)
+        await pipeline.finish_source_update(update)
+
+async def measure(pipeline, filters_for, queries: int, vectors: np.random.Generator) -> dict:
+    dimension = pipeline.embedding_model.get_sentence_embedding_dimension()
+    latencies = []
+    for i in range(queries):
+        query_embedding = vectors.standard_normal(dimension).astype(np.float32).tolist()
+
+        async def embed_query(question, embedding=query_embedding):
+            return embedding
+
+        pipeline._embed_query = embed_query
+        start = time.perf_counter()
+        await pipeline.retrieve(f"part {i} pump warranty", 5, filters=filters_for(i))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95)}
+
+async def run(args, workdir: str) -> list:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    from chunking import Chunk
+    from rag_pipeline import RAGPipeline
+    from scoped_search import RetrievalFilter, SourceVectorCache
+
+    pipeline = RAGPipeline()
+    exact_limit = pipeline.prefilter_exact_max_chunks
+    rng = random.Random(0)
+    vectors = np.random.default_rng(0)
+
+    results = []
+    documents = 0
+    for size in sorted(args.sizes):
+        target = max(1, size // CHUNKS_PER_DOCUMENT)
+        await grow(pipeline, Chunk, documents, target, rng, vectors)
+        documents = target
+
+        def one_source(i):
+            return RetrievalFilter(sources=[f"manual_{i % documents}.pdf"])
+
+        def ten_sources(i):
+            return RetrievalFilter(sources=[f"manual_{(i + j) % documents}.pdf" for j in range(10)])
+
+        row = {"chunks": pipeline.collection.count()}
+        pipeline.prefilter_exact_max_chunks = exact_limit
+        row["unfiltered"] = await measure(pipeline, lambda i: None, args.queries, vectors)
+        pipeline.source_vectors = SourceVectorCache(pipeline.source_vectors.max_chunks)
+        row["one_source_cold"] = await measure(pipeline, one_source, args.queries, vectors)
+        row["one_source"] = await measure(pipeline, one_source, args.queries, vectors)
+        row["ten_sources"] = await measure(pipeline, ten_sources, args.queries, vectors)
+        # Force the Chroma where-clause path for comparison
+        pipeline.prefilter_exact_max_chunks = 0
+        row["one_source_chroma_where"] = await measure(pipeline, one_source, args.queries, vectors)
+        pipeline.prefilter_exact_max_chunks = exact_limit
+        results.append(row)
+
+        if not args.json:
+            print(f"{row['chunks']:>7} chunks  " + "  ".join(
+                f"{mode} p50 {row[mode]['p50_ms']:.2f} / p95 {row[mode]['p95_ms']:.2f} ms"
+                for mode in ("unfiltered", "one_source_cold", "one_source", "ten_sources", "one_source_chroma_where")
+            ))
+
+    await pipeline.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered retrieval benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 50000],
+                        help="Collection sizes in chunks")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Hybrid retrieval benchmark.
+
+Indexes a synthetic corpus in which every chunk mentions an error code and a
+part number, then asks for those identifiers. Reports hit@k and per-leg
+latency for dense-only retrieval and for dense + BM25 with reciprocal rank
+fusion:
+
+    python benchmarks/hybrid_retrieval.py --chunks 5000 --queries 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph
+
+def build_corpus(chunks: int, seed: int = 0):
+    """Chunks of filler text, each with a unique error code and part number"""
+    rng = random.Random(seed)
+    texts, identifiers = [], []
+    for i in range(chunks):
+        error_code = f"E{rng.randint(1000, 9999)}-{i}"
+        part_number = f"PN-{rng.randint(10000, 99999)}-{chr(65 + i % 26)}{i}"
+        paragraph = random_paragraph(rng, sentences=4)
+        texts.append(f"{paragraph} Error {error_code} requires replacing part {part_number}. {random_paragraph(rng, 2)}")
+        identifiers.append((error_code, part_number))
+    return texts, identifiers
+
+async def run(args, workdir: str) -> list:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    from langchain.schema import Document
+    from rag_pipeline import RAGPipeline, LatencyStats
+
+    pipeline = RAGPipeline()
+    texts, identifiers = build_corpus(args.chunks)
+    documents = [Document(page_content=text, metadata={"source": f"manual_{i}.pdf"}) for i, text in enumerate(texts)]
+    for start in range(0, len(documents), 500):
+        await pipeline.add_documents(documents[start:start + 500])
+
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        target = rng.randrange(args.chunks)
+        error_code, part_number = identifiers[target]
+        question = rng.choice([
+            f"What does error {error_code} mean?",
+            f"Which chunk mentions part {part_number}?",
+        ])
+        queries.append((question, f"manual_{target}.pdf"))
+
+    results = []
+    for mode in ("dense", "hybrid"):
+        pipeline.hybrid_search_enabled = mode == "hybrid"
+        pipeline.retrieval_latency = LatencyStats()
+        hits = 0
+        for question, source in queries:
+            retrieval = await pipeline.retrieve(question, args.k)
+            hits += source in retrieval.sources
+        results.append({
+            "mode": mode,
+            f"hit_at_{args.k}": round(hits / len(queries), 3),
+            "latency": pipeline.retrieval_latency.get_stats()
+        })
+
+    results.append({"bm25_index": pipeline.bm25_index.get_stats()})
+    await pipeline.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid retrieval benchmark")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results[:-1]:
+        latency = result["latency"]
+        legs = "  ".join(
+            f"{stage} p50 {latency[stage]['p50_ms']:.2f} / p95 {latency[stage]['p95_ms']:.2f} ms"
+            for stage in ("dense_ms", "sparse_ms", "retrieval_ms") if stage in latency
+        )
+        print(f"{result['mode']:<7} hit@{args.k} {result[f'hit_at_{args.k}']:.3f}  {legs}")
+    print(f"BM25 index: {results[-1]['bm25_index']}")
+
+if __name__ == "__main__":
+    main()
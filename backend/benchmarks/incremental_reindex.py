@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Incremental re-indexing benchmark.
+
+Ingests a synthetic PDF of roughly --chunks chunks, then re-ingests it after
+editing a single page and after dropping the last pages. Reports how many
+chunks each pass embedded, updated in place and deleted, and how long it took:
+
+    python benchmarks/incremental_reindex.py --chunks 1000
+    CHUNKER=sentence python benchmarks/incremental_reindex.py --chunks 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph, write_pdf
+
+# Synthetic pages hold about 3.5 chunks with the default chunk size
+CHUNKS_PER_PAGE = 3.5
+
+def page_text(edited_page: int = -1):
+    def text(page_num: int) -> str:
+        # Every page is seeded by its number, so untouched pages are identical across versions
+        rng = random.Random(page_num if page_num != edited_page else -1 - page_num)
+        return "\n\n".join(random_paragraph(rng) for _ in range(5))
+    return text
+
+async def run(chunks: int, workdir: str) -> list:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    from document_processor import DocumentProcessor
+    from rag_pipeline import RAGPipeline
+
+    pipeline = RAGPipeline()
+    processor = DocumentProcessor()
+    await processor.initialize_rag_pipeline(pipeline)
+
+    pages = max(2, round(chunks / CHUNKS_PER_PAGE))
+    path = os.path.join(workdir, "manual.pdf")
+    versions = [
+        ("initial ingest", pages, page_text()),
+        ("unchanged re-upload", pages, page_text()),
+        ("one page edited", pages, page_text(edited_page=pages // 2)),
+        ("last 5% of pages removed", pages - max(1, pages // 20), page_text(edited_page=pages // 2)),
+    ]
+
+    results = []
+    for label, page_count, text in versions:
+        write_pdf(path, page_count, page_text=text)
+        start = time.perf_counter()
+        result = await processor.process_file(path, "manual.pdf")
+        result["version"] = label
+        result["wall_time_s"] = round(time.perf_counter() - start, 3)
+        results.append(result)
+
+    processor.shutdown(wait=True)
+    await pipeline.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental re-indexing benchmark")
+    parser.add_argument("--chunks", type=int, default=1000, help="Approximate chunks in the document")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # A fresh embedding cache, so the initial ingest really embeds every chunk
+        os.environ["EMBEDDING_CACHE_DIRECTORY"] = os.path.join(workdir, "embedding_cache")
+        results = asyncio.run(run(args.chunks, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'version':<26} {'chunks':>7} {'embedded':>9} {'updated':>8} {'unchanged':>10} {'deleted':>8} {'time':>9}")
+    for result in results:
+        print(f"{result['version']:<26} {result['chunks_created']:>7} {result['chunks_added']:>9} "
+              f"{result['chunks_updated']:>8} {result['chunks_unchanged']:>10} {result['chunks_deleted']:>8} "
+              f"{result['wall_time_s']:>8.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+LLM backend throughput benchmark.
+
+Starts the bundled mock LLM server (or uses --base-url) and drives the
+OpenAI-compatible backend directly at increasing concurrency, reporting
+throughput, time to first token and completion latency percentiles, once
+over the pooled keep-alive client and once opening a new connection per
+request:
+
+    python benchmarks/llm_backend.py --concurrency 1 8 32 128 --requests 256
+
+With --error-rate the mock answers that fraction of requests with 503, which
+the backend's retries should hide from callers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+import openai
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_load import percentile
+from llm_backend import OpenAICompatibleBackend
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful AI assistant."},
+    {"role": "user", "content": "Why does the pump controller report a valve fault?"}
+]
+
+def start_mock_server(args) -> subprocess.Popen:
+    """Run mock_llm_server.py on a free port and wait until it answers"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "mock_llm_server.py"), "--port", str(port),
+         "--ttft-ms", str(args.ttft_ms), "--itl-ms", str(args.itl_ms), "--tokens", str(args.tokens),
+         "--error-rate", str(args.error_rate)],
+        cwd=BACKEND_DIR
+    )
+    args.base_url = f"http://127.0.0.1:{port}/v1"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock LLM server did not start")
+
+def make_backend(args, concurrency: int, keep_alive: bool) -> OpenAICompatibleBackend:
+    backend = OpenAICompatibleBackend(api_key="mock", model="mock", base_url=args.base_url,
+                                      max_connections=concurrency, max_retries=args.max_retries)
+    if not keep_alive:
+        # Same backend, but every request opens (and closes) its own connection
+        backend.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=0),
+            timeout=backend.http_client.timeout
+        )
+        backend.client = openai.AsyncOpenAI(api_key="mock", base_url=args.base_url,
+                                            http_client=backend.http_client, max_retries=0)
+    return backend
+
+async def run_load(args, concurrency: int, keep_alive: bool) -> Dict[str, Any]:
+    backend = make_backend(args, concurrency, keep_alive)
+    semaphore = asyncio.Semaphore(concurrency)
+    first_tokens: List[float] = []
+    latencies: List[float] = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                first = None
+                async for _ in backend.stream(MESSAGES):
+                    if first is None:
+                        first = time.perf_counter() - start
+                first_tokens.append(first or 0.0)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(args.requests)))
+    wall_time = time.perf_counter() - start
+    stats = backend.get_stats()
+    await backend.close()
+
+    def ms(values: List[float], pct: float) -> float:
+        return round(percentile(values, pct) * 1000, 1)
+
+    return {
+        "concurrency": concurrency,
+        "keep_alive": keep_alive,
+        "requests": args.requests,
+        "errors": errors,
+        "retries": stats["retries"],
+        "throughput_rps": round(len(latencies) / wall_time, 2),
+        "first_token_p50_ms": ms(first_tokens, 50),
+        "first_token_p99_ms": ms(first_tokens, 99),
+        "p50_ms": ms(latencies, 50),
+        "p95_ms": ms(latencies, 95),
+        "p99_ms": ms(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM backend throughput benchmark")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint; the mock server is started when omitted")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--itl-ms", type=float, default=5)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    process = start_mock_server(args) if not args.base_url else None
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for keep_alive in (True, False):
+                result = asyncio.run(run_load(args, concurrency, keep_alive))
+                results.append(result)
+                if not args.json:
+                    print(f"concurrency={concurrency:<4} {'pooled ' if keep_alive else 'no-reuse'}  "
+                          f"throughput={result['throughput_rps']} req/s  "
+                          f"first token p50={result['first_token_p50_ms']}ms p99={result['first_token_p99_ms']}ms  "
+                          f"latency p50={result['p50_ms']}ms p99={result['p99_ms']}ms  "
+                          f"errors={result['errors']} retries={result['retries']}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Metrics overhead benchmark.
+
+Times the instrumentation one question adds (observing every stage of the
+retrieval and generation, the chunk and token counters and a Server-Timing
+header), with stage metrics on and off. Unless --skip-server is given it then
+starts uvicorn twice, with METRICS_ENABLED true and false, uploads a synthetic
+corpus and compares /chat throughput and latency:
+
+    python benchmarks/metrics_overhead.py --calls 100000 --concurrency 16 --requests 512
+
+Generation uses the in-process mock LLM backend with no added latency and the
+answer cache is off, so the overhead is measured against the cheapest
+possible request.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+from chat_load import run_load
+from synthetic_pdf import random_paragraph, write_pdf
+from worker_scaling import upload, wait_for
+
+# Timings of a hybrid retrieval with reranking, as the pipeline reports them
+RETRIEVAL_TIMINGS = {
+    "embedding_ms": 5.7, "dense_ms": 12.3, "sparse_ms": 2.1, "fusion_ms": 0.2,
+    "rerank_ms": 40.5, "retrieval_ms": 61.0
+}
+
+def instrument_question():
+    """What the pipeline records for one answered question"""
+    stages = metrics.retrieval_stages(RETRIEVAL_TIMINGS)
+    stages.update({"context": 0.4, "generate": 850.0, "total": 912.0})
+    metrics.observe_stages("query", stages)
+    metrics.CHUNKS.labels("query", "retrieved").inc(5)
+    metrics.TOKENS.labels("context").inc(1200)
+    metrics.TOKENS.labels("completion").inc(180)
+    metrics.server_timing(stages)
+
+def instrumentation_us(calls: int, enabled: bool) -> float:
+    """Microseconds per question"""
+    metrics.METRICS_ENABLED = enabled
+    start = time.perf_counter()
+    for _ in range(calls):
+        instrument_question()
+    return round((time.perf_counter() - start) * 1e6 / calls, 2)
+
+def serve(enabled: bool, args, workdir: str, pdfs) -> dict:
+    env = dict(
+        os.environ,
+        LLM_BACKEND="mock",
+        MOCK_LLM_TTFT_MS="0",
+        MOCK_LLM_ITL_MS="0",
+        ANSWER_CACHE_ENABLED="false",
+        METRICS_ENABLED="true" if enabled else "false",
+        CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "data"),
+        INGESTION_JOBS_DIRECTORY=os.path.join(workdir, "jobs")
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        wait_for(f"{url}/health/ready", 300, server)
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            for path in pdfs:
+                upload(client, path)
+        # Warm up the embedding model and connection pool before measuring
+        asyncio.run(run_load(url, args.concurrency, args.concurrency, args.question, 120.0))
+        result = asyncio.run(run_load(url, args.concurrency, args.requests, args.question, 120.0))
+        result["metrics_enabled"] = enabled
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("--calls", type=int, default=100000, help="Questions to instrument in the microbenchmark")
+    parser.add_argument("--skip-server", action="store_true", help="Only run the microbenchmark")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document")
+    parser.add_argument("--question", default="What is the calibration procedure?")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = {
+        "instrumentation_us": {
+            "enabled": instrumentation_us(args.calls, True),
+            "disabled": instrumentation_us(args.calls, False)
+        },
+        "server": []
+    }
+    if not args.json:
+        print(f"instrumentation per question: {results['instrumentation_us']['enabled']} us with stage metrics, "
+              f"{results['instrumentation_us']['disabled']} us without")
+
+    if not args.skip_server:
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            pdfs = []
+            for i in range(args.documents):
+                path = os.path.join(corpus_dir, f"doc_{i}.pdf")
+                write_pdf(path, args.pages, lambda page: random_paragraph(rng, sentences=12))
+                pdfs.append(path)
+            for enabled in (False, True):
+                with tempfile.TemporaryDirectory() as workdir:
+                    row = serve(enabled, args, workdir, pdfs)
+                results["server"].append(row)
+                if not args.json:
+                    print(f"metrics={'on ' if enabled else 'off'} throughput={row['throughput_rps']} req/s "
+                          f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms errors={row['errors']}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
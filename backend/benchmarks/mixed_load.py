@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Mixed load benchmark for admission control.
+
+Starts the backend twice, once with admission control effectively off
+(unbounded pools, no rate limits) and once with it on, and runs the same
+three phases against each:
+
+  chat     closed-loop chat users alone, for a baseline
+  ingest   the same chat users while large PDFs are being ingested
+  burst    many chats at once, far more than the query pool admits
+
+    python benchmarks/mixed_load.py --users 16 --duration 20 --ingest-documents 4 --ingest-pages 600
+
+Every simulated user and uploader sends its own X-Forwarded-For address
+(RATE_LIMIT_TRUST_FORWARDED=true), so the per-client limits apply to each
+as they would to separate clients. Reports chat latency percentiles per
+phase, ingestion pages per second, and how many requests were refused
+with 429 or 503 or dropped without a response. Generation uses the
+in-process mock LLM backend with the answer cache off.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_load import percentile
+from synthetic_pdf import random_paragraph, write_pdf
+from worker_scaling import upload, wait_for
+
+def client_address(number: int) -> str:
+    return f"10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}"
+
+async def chat_users(client: httpx.AsyncClient, users: int, duration: float, think: float, question: str) -> dict:
+    """Closed-loop users, each sending a chat and pausing think seconds after the answer, for duration seconds"""
+    latencies, refused = [], {}
+    deadline = time.perf_counter() + duration
+
+    async def user(number: int):
+        headers = {"X-Forwarded-For": client_address(number)}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat", json={"message": f"{question} ({number})"}, headers=headers)
+            except httpx.TransportError:
+                refused["dropped"] = refused.get("dropped", 0) + 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                refused[response.status_code] = refused.get(response.status_code, 0) + 1
+            await asyncio.sleep(think)
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return summarize(latencies, refused)
+
+async def chat_burst(client: httpx.AsyncClient, requests: int, question: str) -> dict:
+    """Send requests chats at once, each from its own address"""
+    latencies, refused, retry_after = [], {}, set()
+
+    async def one(number: int):
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                "/chat", json={"message": f"{question} ({number})"},
+                headers={"X-Forwarded-For": client_address(100000 + number)}
+            )
+        except httpx.TransportError:
+            refused["dropped"] = refused.get("dropped", 0) + 1
+            return
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            refused[response.status_code] = refused.get(response.status_code, 0) + 1
+            retry_after.add(response.headers.get("retry-after"))
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return {**summarize(latencies, refused), "retry_after": sorted(value for value in retry_after if value)}
+
+async def ingest(client: httpx.AsyncClient, paths, pages: int) -> dict:
+    """Upload every PDF, each from its own address, and wait until all are ingested"""
+    start = time.perf_counter()
+    jobs = []
+    for number, path in enumerate(paths):
+        with open(path, "rb") as f:
+            response = await client.post(
+                "/upload", files={"file": (os.path.basename(path), f.read(), "application/pdf")},
+                headers={"X-Forwarded-For": client_address(200000 + number)}
+            )
+        response.raise_for_status()
+        jobs.append(response.json()["job_id"])
+    pending = set(jobs)
+    while pending:
+        for job_id in list(pending):
+            status = (await client.get(f"/jobs/{job_id}")).json()["status"]
+            if status == "completed":
+                pending.discard(job_id)
+            elif status in ("failed", "cancelled"):
+                raise RuntimeError(f"Ingestion job {job_id} {status}")
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 2), "pages_per_second": round(len(paths) * pages / elapsed, 1)}
+
+def summarize(latencies, refused) -> dict:
+    return {
+        "answered": len(latencies),
+        # Status codes of refused requests; "dropped" counts connections that failed without a response
+        "refused": {str(status): count for status, count in refused.items()},
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0
+    }
+
+async def phases(url: str, args, ingest_paths) -> dict:
+    limits = httpx.Limits(max_connections=args.burst + args.users + 8)
+    async with httpx.AsyncClient(base_url=url, timeout=120.0, limits=limits) as client:
+        results = {"chat": await chat_users(client, args.users, args.duration, args.think, args.question)}
+        ingestion = asyncio.create_task(ingest(client, ingest_paths, args.ingest_pages))
+        # Let the uploads reach the embedding stage before measuring
+        await asyncio.sleep(1.0)
+        results["ingest"] = await chat_users(client, args.users, args.duration, args.think, args.question)
+        results["ingestion"] = await ingestion
+        results["burst"] = await chat_burst(client, args.burst, args.question)
+    return results
+
+def run(mode: str, args, workdir: str, corpus, ingest_paths) -> dict:
+    env = dict(
+        os.environ,
+        LLM_BACKEND="mock",
+        MOCK_LLM_TTFT_MS=str(args.ttft_ms),
+        MOCK_LLM_ITL_MS=str(args.itl_ms),
+        ANSWER_CACHE_ENABLED="false",
+        CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+        INGESTION_JOBS_DIRECTORY=os.path.join(workdir, "jobs"),
+        INGESTION_MAX_CONCURRENT_JOBS=str(len(ingest_paths)),
+        RATE_LIMIT_TRUST_FORWARDED="true"
+    )
+    if mode == "unbounded":
+        env.update(
+            CHAT_MAX_CONCURRENT="1000000",
+            INGEST_EMBED_CONCURRENCY="1000000",
+            INGEST_YIELD_AT_ACTIVE_CHATS="0",
+            CHAT_RATE_LIMIT="0",
+            UPLOAD_RATE_LIMIT="0"
+        )
+    else:
+        env.update(
+            CHAT_MAX_CONCURRENT=str(args.max_concurrent),
+            CHAT_MAX_QUEUED=str(args.max_queued),
+            INGEST_YIELD_AT_ACTIVE_CHATS=str(args.yield_at),
+            INGEST_YIELD_TIMEOUT_SECONDS=str(args.yield_timeout)
+        )
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        wait_for(f"{url}/health/ready", 300, server)
+        with httpx.Client(base_url=url, timeout=60.0, headers={"X-Forwarded-For": client_address(300000)}) as client:
+            for path in corpus:
+                upload(client, path)
+        result = asyncio.run(phases(url, args, ingest_paths))
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            result["admission"] = client.get("/health").json()["admission"]
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat latency under ingestion and overload, with and without admission control")
+    parser.add_argument("--modes", nargs="+", default=["unbounded", "admission"], choices=["unbounded", "admission"])
+    parser.add_argument("--users", type=int, default=16, help="Closed-loop chat users")
+    parser.add_argument("--think", type=float, default=0.25, help="Seconds each user pauses between chats")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per chat phase")
+    parser.add_argument("--burst", type=int, default=400, help="Chats sent at once in the burst phase")
+    parser.add_argument("--max-concurrent", type=int, default=32, help="CHAT_MAX_CONCURRENT with admission on")
+    parser.add_argument("--max-queued", type=int, default=64, help="CHAT_MAX_QUEUED with admission on")
+    parser.add_argument("--yield-at", type=int, default=4, help="INGEST_YIELD_AT_ACTIVE_CHATS with admission on")
+    parser.add_argument("--yield-timeout", type=float, default=2.0, help="INGEST_YIELD_TIMEOUT_SECONDS with admission on")
+    parser.add_argument("--documents", type=int, default=5, help="Documents in the corpus being chatted about")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per corpus document")
+    parser.add_argument("--ingest-documents", type=int, default=4, help="Documents uploaded during the ingest phase")
+    parser.add_argument("--ingest-pages", type=int, default=600, help="Pages per uploaded document")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="Mock LLM time to first token")
+    parser.add_argument("--itl-ms", type=float, default=20.0, help="Mock LLM time between tokens")
+    parser.add_argument("--question", default="What is the calibration procedure?")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        corpus, ingest_paths = [], []
+        for i in range(args.documents):
+            path = os.path.join(corpus_dir, f"doc_{i}.pdf")
+            write_pdf(path, args.pages, lambda page: random_paragraph(rng, sentences=12))
+            corpus.append(path)
+        for i in range(args.ingest_documents):
+            path = os.path.join(corpus_dir, f"upload_{i}.pdf")
+            write_pdf(path, args.ingest_pages, lambda page: random_paragraph(rng, sentences=12))
+            ingest_paths.append(path)
+
+        for mode in args.modes:
+            with tempfile.TemporaryDirectory() as workdir:
+                results[mode] = run(mode, args, workdir, corpus, ingest_paths)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for mode, result in results.items():
+        print(f"{mode}:")
+        for phase in ("chat", "ingest", "burst"):
+            row = result[phase]
+            print(f"  {phase:<7} answered={row['answered']:<5} p50={row['p50_ms']}ms p95={row['p95_ms']}ms "
+                  f"p99={row['p99_ms']}ms max={row['max_ms']}ms refused={row['refused']}")
+        print(f"  ingestion of {args.ingest_documents} x {args.ingest_pages} pages: "
+              f"{result['ingestion']['seconds']} s, {result['ingestion']['pages_per_second']} pages/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+PDF ingestion benchmark.
+
+Generates large synthetic PDFs and ingests them with the streaming,
+page-parallel DocumentProcessor and with the previous in-memory approach
+(whole file in memory, sequential extraction, string concatenation).
+Each run happens in a fresh subprocess so peak RSS is measured per mode:
+
+    python benchmarks/pdf_ingestion.py --pages 500 --docs 3
+    python benchmarks/pdf_ingestion.py --pages 500 --embed   # include embedding and Chroma writes
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import write_pdf
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its reaped children in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+def current_rss_mb() -> float:
+    """Current resident set size of this process in MB"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def run_legacy(paths, embed: bool) -> dict:
+    """Ingest the way the processor used to: bytes in memory, sequential pages"""
+    import PyPDF2
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+    pipeline = None
+    if embed:
+        from rag_pipeline import RAGPipeline
+        pipeline = RAGPipeline()
+
+    chunks = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        reader = PyPDF2.PdfReader(BytesIO(content))
+        text = ""
+        for page_num in range(len(reader.pages)):
+            text += reader.pages[page_num].extract_text() + "\n"
+        doc_chunks = splitter.split_text(text.strip())
+        chunks += len(doc_chunks)
+        if pipeline:
+            from langchain.schema import Document
+            document = Document(page_content=text.strip(), metadata={"source": os.path.basename(path)})
+            asyncio.run(pipeline.add_documents([document]))
+    return {"wall_time_s": time.perf_counter() - start, "chunks": chunks}
+
+def run_streaming(paths, embed: bool) -> dict:
+    """Ingest with the streaming, page-parallel DocumentProcessor"""
+    from document_processor import DocumentProcessor
+
+    async def ingest():
+        processor = DocumentProcessor()
+        if embed:
+            from rag_pipeline import RAGPipeline
+            await processor.initialize_rag_pipeline(RAGPipeline())
+        chunks = 0
+        start = time.perf_counter()
+        for path in paths:
+            result = await processor.process_file(path, os.path.basename(path))
+            chunks += result["chunks_created"]
+        elapsed = time.perf_counter() - start
+        processor.shutdown(wait=True)
+        return {"wall_time_s": elapsed, "chunks": chunks}
+
+    return asyncio.run(ingest())
+
+def run_single(mode: str, paths, embed: bool):
+    # Import the processor in both modes so baseline memory is comparable
+    import document_processor  # noqa: F401
+
+    baseline = current_rss_mb()
+    runner = run_streaming if mode == "streaming" else run_legacy
+    result = runner(paths, embed)
+    result["mode"] = mode
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    result["ingest_rss_mb"] = round(result["peak_rss_mb"] - baseline, 1)
+    result["wall_time_s"] = round(result["wall_time_s"], 3)
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF ingestion benchmark")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--docs", type=int, default=1)
+    parser.add_argument("--embed", action="store_true", help="Also embed and write chunks to Chroma")
+    parser.add_argument("--modes", nargs="+", default=["legacy", "streaming"])
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single, args.paths, args.embed)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for i in range(args.docs):
+            path = os.path.join(workdir, f"synthetic_{args.pages}p_{i}.pdf")
+            write_pdf(path, args.pages, seed=i)
+            paths.append(path)
+        size_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+
+        env = dict(os.environ, CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"))
+        results = []
+        for mode in args.modes:
+            command = [sys.executable, os.path.abspath(__file__), "--single", mode, "--paths", *paths]
+            if args.embed:
+                command.append("--embed")
+            output = subprocess.run(command, check=True, capture_output=True, text=True, env=env, cwd=BACKEND_DIR)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            result["pages"] = args.pages * args.docs
+            result["pages_per_sec"] = round(result["pages"] / result["wall_time_s"], 1)
+            results.append(result)
+            if not args.json:
+                print(f"{mode:<10} {result['wall_time_s']:8.2f}s  {result['pages_per_sec']:8.1f} pages/s  "
+                      f"peak RSS {result['peak_rss_mb']:8.1f} MB (+{result['ingest_rss_mb']:.1f} MB while ingesting)  chunks={result['chunks']}  "
+                      f"(input {size_mb:.1f} MB)")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval benchmark and regression check.
+
+Generates a synthetic PDF corpus in which every page states one fact about
+a uniquely named unit (its service code, torque, firmware and so on), plus
+one question per fact. The corpus is ingested through DocumentProcessor
+into a fresh RAGPipeline, then every question is retrieved and answered. No server or network is needed;
+answers come from the in-process mock LLM with no added latency.
+
+Reports ingest pages/sec and chunks/sec, retrieval and query p50/p95/p99,
+recall@1 and recall@k (a hit is a retrieved chunk containing the fact's
+value) and peak memory, and compares them with a stored baseline. Any metric
+that is worse than the baseline by more than its tolerance fails the run
+with exit code 1:
+
+    python benchmarks/regression.py --update-baseline  # record this machine's numbers
+    python benchmarks/regression.py                    # compare with benchmarks/baseline.json
+    python benchmarks/regression.py --output results.json
+
+Timings, memory and recall depend on the machine and the embedding model, so
+no baseline is shipped; record one with the real model where the check runs.
+Without a baseline the check exits with code 2 before running, unless
+--allow-missing-baseline asks for the numbers alone.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_ingestion import current_rss_mb, peak_rss_mb
+from synthetic_pdf import random_paragraph, write_pdf
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Whether each metric should go up or down, and the default allowed regression:
+# relative for timings and memory, absolute for recall
+METRICS = {
+    "ingest_pages_per_sec": ("higher", 0.3),
+    "ingest_chunks_per_sec": ("higher", 0.3),
+    "retrieval_p50_ms": ("lower", 0.5),
+    "retrieval_p95_ms": ("lower", 0.5),
+    "retrieval_p99_ms": ("lower", 1.0),
+    "query_p50_ms": ("lower", 0.5),
+    "query_p95_ms": ("lower", 0.5),
+    "query_p99_ms": ("lower", 1.0),
+    "recall_at_1": ("higher", 0.02),
+    "recall_at_k": ("higher", 0.02),
+    "peak_rss_mb": ("lower", 0.25),
+    "ingest_rss_mb": ("lower", 0.5)
+}
+ABSOLUTE_TOLERANCE = {"recall_at_1", "recall_at_k"}
+
+SYLLABLES = ["ka", "lo", "mer", "tiv", "zan", "quo", "rim", "bex", "sol", "dra", "vun", "pel"]
+
+# How a fact is stated on its page and asked about, with the value it is checked by
+FACTS = [
+    ("The service code for the {name} unit is SC-{number}.", "Which service code does the {name} unit use?",
+     "SC-{number}"),
+    ("Tighten the {name} housing bolts to {number} newton millimetres.", "How tight should the {name} bolts be?",
+     "{number} newton"),
+    ("Firmware build {number} is required before pairing a {name} controller.",
+     "What firmware must a {name} controller run?", "build {number}"),
+    ("Replacement {name} filters ship with part number PN{number}.", "What is the part number of a {name} filter?",
+     "PN{number}"),
+    ("Warranty claims for a {name} pump need authorization ticket {number}.",
+     "Which ticket authorizes {name} pump warranty claims?", "ticket {number}")
+]
+
+def build_corpus(rng: random.Random, documents: int, pages: int):
+    """Text of every page and one (question, answer) pair per page"""
+    corpus, questions = [], []
+    used = set()
+    for doc in range(documents):
+        doc_pages = []
+        for page in range(pages):
+            name = "".join(rng.choice(SYLLABLES) for _ in range(4))
+            while name in used:
+                name = "".join(rng.choice(SYLLABLES) for _ in range(4))
+            used.add(name)
+            statement, question, answer = rng.choice(FACTS)
+            fields = {"name": name, "number": rng.randint(100000, 999999)}
+            fact = statement.format(**fields)
+            # The fact sits somewhere among filler paragraphs, so it is not always at a chunk boundary
+            paragraphs = [random_paragraph(rng, sentences=6) for _ in range(4)]
+            paragraphs.insert(rng.randint(0, len(paragraphs)), fact)
+            doc_pages.append("\n\n".join(paragraphs))
+            questions.append((question.format(**fields), answer.format(**fields)))
+        corpus.append(doc_pages)
+    return corpus, questions
+
+def percentile_ms(values, q: float) -> float:
+    return round(float(np.percentile(values, q)), 3)
+
+async def run(args, workdir: str) -> dict:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    os.environ["INGESTION_JOBS_DIRECTORY"] = os.path.join(workdir, "jobs")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_TTFT_MS"] = "0"
+    os.environ["MOCK_LLM_ITL_MS"] = "0"
+    from document_processor import DocumentProcessor
+    from rag_pipeline import RAGPipeline
+
+    rng = random.Random(args.seed)
+    corpus, questions = build_corpus(rng, args.documents, args.pages)
+    paths = []
+    for i, doc_pages in enumerate(corpus):
+        path = os.path.join(workdir, f"manual_{i:03d}.pdf")
+        write_pdf(path, len(doc_pages), lambda page: doc_pages[page])
+        paths.append(path)
+
+    pipeline = RAGPipeline()
+    processor = DocumentProcessor()
+    await processor.initialize_rag_pipeline(pipeline)
+    baseline_rss = current_rss_mb()
+
+    chunks = 0
+    start = time.perf_counter()
+    for path in paths:
+        result = await processor.process_file(path, os.path.basename(path))
+        chunks += result["chunks_created"]
+    ingest_s = time.perf_counter() - start
+    processor.shutdown(wait=True)
+    ingest_rss = peak_rss_mb() - baseline_rss
+
+    # Warm up, so the first questions are not charged for it
+    for i in range(10):
+        await pipeline.retrieve(f"Warm up question {i}", args.k)
+
+    # Each question is embedded once; a second pass would be served from the query embedding cache
+    retrieval_ms, query_ms, hits_at_1, hits_at_k = [], [], 0, 0
+    for question, answer in questions:
+        stages = {}
+        await pipeline.query(question, args.k, trace=stages)
+        retrieval_ms.append(stages["retrieval"])
+        query_ms.append(stages["total"])
+        retrieval = await pipeline.retrieve(question, args.k)
+        found = [answer in " ".join(document.split()) for document in retrieval.documents]
+        hits_at_1 += any(found[:1])
+        hits_at_k += any(found)
+    await pipeline.close()
+
+    total_pages = args.documents * args.pages
+    return {
+        "ingest_pages_per_sec": round(total_pages / ingest_s, 2),
+        "ingest_chunks_per_sec": round(chunks / ingest_s, 2),
+        "retrieval_p50_ms": percentile_ms(retrieval_ms, 50),
+        "retrieval_p95_ms": percentile_ms(retrieval_ms, 95),
+        "retrieval_p99_ms": percentile_ms(retrieval_ms, 99),
+        "query_p50_ms": percentile_ms(query_ms, 50),
+        "query_p95_ms": percentile_ms(query_ms, 95),
+        "query_p99_ms": percentile_ms(query_ms, 99),
+        "recall_at_1": round(hits_at_1 / len(questions), 4),
+        "recall_at_k": round(hits_at_k / len(questions), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "ingest_rss_mb": round(ingest_rss, 1),
+        "chunks": chunks
+    }
+
+def compare(results: dict, baseline: dict):
+    """One row per metric, and whether any of them regressed"""
+    tolerances = {metric: tolerance for metric, (_, tolerance) in METRICS.items()}
+    tolerances.update(baseline.get("tolerances", {}))
+    rows, failed = [], False
+    for metric, (direction, _) in METRICS.items():
+        if metric not in baseline["metrics"]:
+            continue
+        expected, actual, tolerance = baseline["metrics"][metric], results[metric], tolerances[metric]
+        if metric in ABSOLUTE_TOLERANCE:
+            limit = expected - tolerance if direction == "higher" else expected + tolerance
+        else:
+            limit = expected * (1 - tolerance) if direction == "higher" else expected * (1 + tolerance)
+        regressed = actual < limit if direction == "higher" else actual > limit
+        failed = failed or regressed
+        change = (actual - expected) / expected * 100 if expected else 0.0
+        rows.append({
+            "metric": metric, "baseline": expected, "current": actual, "limit": round(limit, 4),
+            "change_pct": round(change, 1), "status": "REGRESSED" if regressed else "ok"
+        })
+    return rows, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark and regression check")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document; each page holds one fact")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="Without a baseline, print the results and exit 0 instead of failing")
+    parser.add_argument("--output", help="Also write the results and comparison to this JSON file")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    config = {"documents": args.documents, "pages": args.pages, "k": args.k, "seed": args.seed}
+    if not args.update_baseline and not args.allow_missing_baseline and not os.path.exists(args.baseline):
+        # Nothing to compare with must not look like a pass
+        print(f"No baseline at {args.baseline}; record one with --update-baseline, "
+              f"or pass --allow-missing-baseline to only print the results", file=sys.stderr)
+        sys.exit(2)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    if args.update_baseline:
+        tolerances = {metric: tolerance for metric, (_, tolerance) in METRICS.items()}
+        if os.path.exists(args.baseline):
+            # Keep tolerances that were tuned by hand
+            with open(args.baseline) as f:
+                tolerances.update(json.load(f).get("tolerances", {}))
+        with open(args.baseline, "w") as f:
+            json.dump({"config": config, "metrics": results, "tolerances": tolerances}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    report = {"config": config, "metrics": results, "comparison": [], "regressed": False}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Baseline {args.baseline} was recorded with {baseline.get('config')}, not {config}", file=sys.stderr)
+            sys.exit(2)
+        report["comparison"], report["regressed"] = compare(results, baseline)
+    elif not args.json:
+        print(f"No baseline at {args.baseline}; results were not checked")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif report["comparison"]:
+        for row in report["comparison"]:
+            print(f"{row['metric']:<22} baseline {row['baseline']:>10}  current {row['current']:>10}  "
+                  f"({row['change_pct']:+.1f}%)  {row['status']}")
+    else:
+        for metric, value in results.items():
+            print(f"{metric:<22} {value}")
+
+    if report["regressed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
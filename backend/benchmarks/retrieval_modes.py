@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Retrieval mode benchmark: similarity vs. MMR vs. cross-encoder reranking.
+
+Builds topics that each consist of one passage repeated in several
+near-identical versions (as when revisions of a manual are uploaded side by
+side) plus a few distinct passages on the same topic. Asks about every topic
+and reports, per mode, how many of the top results are redundant copies,
+how many distinct passages are covered, and per-stage latency:
+
+    python benchmarks/retrieval_modes.py --topics 200 --duplicates 4 --facets 3
+
+Reranking is skipped when the cross-encoder cannot be loaded.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import random_paragraph
+
+def build_corpus(rng: random.Random, topics: int, duplicates: int, facets: int):
+    """Chunk texts with their (topic, passage) labels; passage 0 is the duplicated one"""
+    texts, labels, questions = [], [], []
+    for topic in range(topics):
+        keyword = f"subsystem{topic}"
+        base = f"The {keyword} {random_paragraph(rng, sentences=3)}"
+        for version in range(duplicates):
+            texts.append(f"{base} Revision {version + 1}.")
+            labels.append((topic, 0))
+        for facet in range(1, facets + 1):
+            texts.append(f"The {keyword} {random_paragraph(rng, sentences=3)}")
+            labels.append((topic, facet))
+        questions.append(f"How does the {keyword} work? {' '.join(base.split()[2:8])}")
+    return texts, labels, questions
+
+def percentiles(values):
+    if not values:
+        return None
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3), "p95_ms": round(float(np.percentile(values, 95)), 3)}
+
+async def run(args, workdir: str) -> list:
+    os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(workdir, "chroma_db")
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    from langchain.schema import Document
+    from rag_pipeline import RAGPipeline
+    from reranking import RetrievalOptions
+
+    pipeline = RAGPipeline()
+    rng = random.Random(0)
+    texts, labels, questions = build_corpus(rng, args.topics, args.duplicates, args.facets)
+    documents = [
+        Document(page_content=text, metadata={"source": f"topic_{topic}_passage_{passage}_{i}.pdf"})
+        for i, (text, (topic, passage)) in enumerate(zip(texts, labels))
+    ]
+    for start in range(0, len(documents), 500):
+        await pipeline.add_documents(documents[start:start + 500])
+    label_of = {text: label for text, label in zip(texts, labels)}
+    # Warm up, so the first mode is not charged for it
+    for question in questions[:10]:
+        await pipeline.retrieve(question, args.k)
+
+    modes = [
+        ("similarity", RetrievalOptions(mode="similarity", candidates=args.candidates)),
+        ("mmr", RetrievalOptions(mode="mmr", mmr_lambda=args.mmr_lambda, candidates=args.candidates)),
+        ("rerank", RetrievalOptions(mode="similarity", rerank=True, candidates=args.candidates)),
+        ("mmr+rerank", RetrievalOptions(mode="mmr", rerank=True, mmr_lambda=args.mmr_lambda, candidates=args.candidates)),
+    ]
+
+    results = []
+    for name, options in modes:
+        if options.rerank:
+            # Loads the model on first use
+            await asyncio.get_running_loop().run_in_executor(None, pipeline.reranker._load)
+            if not pipeline.reranker.available:
+                print(f"{name:<11} skipped: reranker unavailable")
+                continue
+        returned, redundant, covered, on_topic = [], [], [], []
+        stages = {"retrieval_ms": [], "mmr_ms": [], "rerank_ms": []}
+        for topic, question in enumerate(questions):
+            retrieval = await pipeline.retrieve(question, args.k, options=options)
+            passages = [label_of.get(document) for document in retrieval.documents]
+            topic_passages = [label for label in passages if label and label[0] == topic]
+            returned.append(len(passages))
+            redundant.append(len(topic_passages) - len(set(topic_passages)))
+            covered.append(len(set(topic_passages)))
+            on_topic.append(len(topic_passages))
+            for stage in stages:
+                if stage in retrieval.timings:
+                    stages[stage].append(retrieval.timings[stage])
+
+        row = {
+            "mode": name,
+            "results_mean": round(float(np.mean(returned)), 2),
+            "on_topic_mean": round(float(np.mean(on_topic)), 2),
+            "redundant_mean": round(float(np.mean(redundant)), 2),
+            "distinct_passages_mean": round(float(np.mean(covered)), 2),
+            **{stage: percentiles(values) for stage, values in stages.items() if values}
+        }
+        results.append(row)
+        if not args.json:
+            latency = "  ".join(f"{stage} p50 {row[stage]['p50_ms']} / p95 {row[stage]['p95_ms']}"
+                                for stage in stages if stage in row)
+            print(f"{name:<11} results {row['results_mean']}  redundant {row['redundant_mean']}  "
+                  f"distinct passages {row['distinct_passages_mean']}/{args.facets + 1}  {latency}")
+
+    await pipeline.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval mode benchmark")
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=4, help="Near-identical versions of each topic's main passage")
+    parser.add_argument("--facets", type=int, default=3, help="Distinct passages per topic")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--mmr-lambda", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(run(args, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
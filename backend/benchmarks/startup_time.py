@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark.
+
+Measures import time of the app and of its heavy dependencies, each in a fresh
+interpreter, then starts the server in every startup mode and polls the
+liveness and readiness probes to report time-to-live and time-to-ready:
+
+    python benchmarks/startup_time.py --runs 3 --mode eager background
+
+Set EMBEDDING_MODEL_PATH to a saved copy of the model to measure the image
+setup; otherwise the model is loaded from the Hugging Face cache (or
+downloaded, which then dominates the numbers).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["main", "rag_pipeline", "sentence_transformers", "chromadb", "langchain.text_splitter"]
+
+def import_time(module: str) -> float:
+    """Seconds to import module in a fresh interpreter"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def start_server(mode: str, port: int, workdir: str, warmup: bool) -> dict:
+    """Start uvicorn and poll the probes until ready; times are from process spawn"""
+    env = dict(
+        os.environ,
+        STARTUP_MODE=mode,
+        EMBEDDING_WARMUP=str(warmup).lower(),
+        CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "chroma_db"),
+        INGESTION_JOBS_DIRECTORY=os.path.join(workdir, "jobs")
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{port}"
+    live = ready = None
+    not_ready_status = None
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while ready is None:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {process.returncode} in {mode} mode")
+                if time.perf_counter() - start > 300:
+                    raise RuntimeError(f"Server not ready after 300 s in {mode} mode")
+                try:
+                    if live is None and client.get(f"{base}/health/live").status_code == 200:
+                        live = time.perf_counter() - start
+                    response = client.get(f"{base}/health/ready")
+                    if response.status_code == 200:
+                        ready = time.perf_counter() - start
+                    elif not_ready_status is None:
+                        # What a request arriving while the model loads gets back
+                        not_ready_status = client.get(f"{base}/documents").status_code
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.02)
+            startup = client.get(f"{base}/health").json()["startup"]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {"live_s": live, "ready_s": ready, "while_loading_status": not_ready_status, "timings": startup["timings"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--mode", nargs="+", default=["eager", "background"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the warm-up encode")
+    parser.add_argument("--skip-imports", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = {"imports": {}, "startup": {}}
+    if not args.skip_imports:
+        for module in MODULES:
+            times = [import_time(module) for _ in range(args.runs)]
+            results["imports"][module] = round(statistics.median(times), 3)
+            if not args.json:
+                print(f"import {module:<24} {results['imports'][module]:.3f} s (median of {args.runs})")
+
+    for mode in args.mode:
+        runs = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                runs.append(start_server(mode, args.port, workdir, not args.no_warmup))
+        phases = sorted({phase for run in runs for phase in run["timings"]})
+        row = {
+            "live_s": round(statistics.median(run["live_s"] for run in runs), 3),
+            "ready_s": round(statistics.median(run["ready_s"] for run in runs), 3),
+            "while_loading_status": runs[0]["while_loading_status"],
+            "timings_ms": {
+                phase: round(statistics.median(run["timings"].get(phase, 0.0) for run in runs), 1)
+                for phase in phases
+            }
+        }
+        results["startup"][mode] = row
+        if not args.json:
+            breakdown = "  ".join(f"{phase} {value}" for phase, value in row["timings_ms"].items())
+            print(f"{mode:<10} live {row['live_s']:.2f} s  ready {row['ready_s']:.2f} s  "
+                  f"requests while loading -> {row['while_loading_status']}  ({breakdown})")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
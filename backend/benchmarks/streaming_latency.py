@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Streaming latency benchmark for /chat/stream.
+
+Opens concurrent SSE streams against a running backend and reports time to
+first byte, time to the sources event, time to first token, inter-token
+latency and total stream time. Point the backend at the local mock LLM server
+so generation timing is controlled:
+
+    python mock_llm_server.py --port 8001 --ttft-ms 300 --itl-ms 20 --tokens 64 &
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://localhost:8001/v1 uvicorn main:app --port 8000 &
+    python benchmarks/streaming_latency.py --url http://localhost:8000 --concurrency 1 8 32
+
+With --disconnect-after N every client hangs up after N content events;
+with --mock-url the mock server's counters then show the upstream
+completions that were cancelled.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from chat_load import percentile
+
+async def one_stream(client: httpx.AsyncClient, question: str,
+                     disconnect_after: Optional[int]) -> Dict[str, Any]:
+    """Consume one SSE stream and record when each kind of event arrived"""
+    start = time.perf_counter()
+    result = {"ttfb": None, "sources": None, "first_token": None, "token_times": [], "heartbeats": 0}
+    async with client.stream("POST", "/chat/stream", json={"message": question}) as response:
+        response.raise_for_status()
+        event_data = []
+        async for line in response.aiter_lines():
+            now = time.perf_counter() - start
+            if result["ttfb"] is None:
+                result["ttfb"] = now
+            if line.startswith(": "):
+                result["heartbeats"] += 1
+            elif line.startswith("data: "):
+                event_data.append(line[6:])
+            elif not line and event_data:
+                event = json.loads("\n".join(event_data))
+                event_data = []
+                if event.get("type") == "sources" and result["sources"] is None:
+                    result["sources"] = now
+                elif event.get("type") == "content":
+                    if result["first_token"] is None:
+                        result["first_token"] = now
+                    result["token_times"].append(now)
+                    if disconnect_after and len(result["token_times"]) >= disconnect_after:
+                        break
+                elif event.get("type") == "error":
+                    raise RuntimeError(event.get("content"))
+    result["total"] = time.perf_counter() - start
+    return result
+
+async def run_streams(url: str, concurrency: int, total: int, question: str, timeout: float,
+                      disconnect_after: Optional[int]) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results, errors = [], 0
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def worker(i: int):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    # Distinct questions so the answer cache does not serve them
+                    results.append(await one_stream(client, f"{question} ({i} {time.time()})", disconnect_after))
+                except (httpx.HTTPError, RuntimeError):
+                    errors += 1
+
+        await asyncio.gather(*(worker(i) for i in range(total)))
+
+    def ms(values: List[float]) -> Dict[str, float]:
+        return {
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+        }
+
+    gaps = [
+        later - earlier
+        for result in results
+        for earlier, later in zip(result["token_times"], result["token_times"][1:])
+    ]
+    return {
+        "concurrency": concurrency,
+        "streams": len(results),
+        "errors": errors,
+        "ttfb": ms([r["ttfb"] for r in results if r["ttfb"] is not None]),
+        "sources": ms([r["sources"] for r in results if r["sources"] is not None]),
+        "first_token": ms([r["first_token"] for r in results if r["first_token"] is not None]),
+        "inter_token": ms(gaps),
+        "total": ms([r["total"] for r in results]),
+        "heartbeats": sum(r["heartbeats"] for r in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat/stream latency benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--question", default="Why does the pump controller report a valve fault?")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--disconnect-after", type=int, help="Hang up after this many content events")
+    parser.add_argument("--mock-url", help="Mock LLM server to read cancellation counters from")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_streams(args.url, concurrency, args.requests, args.question,
+                                         args.timeout, args.disconnect_after))
+        results.append(result)
+        if not args.json:
+            print(f"concurrency={concurrency:<4} ttfb p50={result['ttfb']['p50_ms']}ms  "
+                  f"sources p50={result['sources']['p50_ms']}ms  "
+                  f"first token p50={result['first_token']['p50_ms']}ms p95={result['first_token']['p95_ms']}ms  "
+                  f"inter-token p50={result['inter_token']['p50_ms']}ms p95={result['inter_token']['p95_ms']}ms  "
+                  f"errors={result['errors']}")
+
+    if args.mock_url:
+        # Give the backend a moment to propagate disconnects upstream
+        time.sleep(1)
+        mock_stats = httpx.get(f"{args.mock_url}/stats").json()
+        results.append({"mock_llm": mock_stats})
+        if not args.json:
+            print(f"mock LLM: {mock_stats}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Minimal synthetic PDF writer for benchmarks.
+
+Writes plain-text PDFs page by page straight to disk, so documents with
+thousands of pages can be generated without any PDF library and without
+holding the document in memory.
+"""
+
+import random
+from typing import Callable, List, Optional
+
+WORDS = (
+    "system data model query index vector token latency throughput cache batch "
+    "document page chunk embedding retrieval answer context source policy manual "
+    "controller sensor pump valve assembly warranty service network storage memory "
+    "process worker request response error signal report customer release version"
+).split()
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def random_paragraph(rng: random.Random, sentences: int = 6) -> str:
+    """Return a paragraph of random filler sentences"""
+    parts = []
+    for _ in range(sentences):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+        parts.append(" ".join(words).capitalize() + ".")
+    return " ".join(parts)
+
+def wrap_lines(text: str, width: int = 90) -> List[str]:
+    """Wrap text into lines of at most width characters"""
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+def write_pdf(path: str, pages: int, page_text: Optional[Callable[[int], str]] = None,
+              seed: int = 0) -> None:
+    """Write a PDF with the given number of pages of text"""
+    rng = random.Random(seed)
+    if page_text is None:
+        page_text = lambda page_num: "\n\n".join(random_paragraph(rng) for _ in range(5))
+
+    # Object layout: 1 catalog, 2 pages tree, 3 font, then a (page, content) pair per page
+    offsets = {}
+    page_ids = [4 + 2 * i for i in range(pages)]
+
+    with open(path, "wb") as f:
+        def write_object(obj_id: int, body: bytes):
+            offsets[obj_id] = f.tell()
+            f.write(f"{obj_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("latin-1"))
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        for page_num, page_id in enumerate(page_ids):
+            lines = []
+            for paragraph in page_text(page_num).split("\n"):
+                lines.extend(wrap_lines(paragraph) or [""])
+            operators = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+            operators.extend(f"({_escape(line)}) '" for line in lines[:70])
+            operators.append("ET")
+            stream = "\n".join(operators).encode("latin-1", errors="replace")
+
+            write_object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+            ).encode("latin-1"))
+            write_object(page_id + 1, f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1")
+                         + stream + b"\nendstream")
+
+        xref_offset = f.tell()
+        total_objects = 3 + 2 * pages
+        f.write(f"xref\n0 {total_objects + 1}\n".encode("latin-1"))
+        f.write(b"0000000000 65535 f \n")
+        for obj_id in range(1, total_objects + 1):
+            f.write(f"{offsets[obj_id]:010d} 00000 n \n".encode("latin-1"))
+        f.write(f"trailer\n<< /Size {total_objects + 1} /Root 1 0 R >>\n"
+                f"startxref\n{xref_offset}\n%%EOF\n".encode("latin-1"))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+In-process vector index benchmark.
+
+For each collection size, fills either a Chroma collection (the current
+path) or the in-process VectorIndex (exact float32, exact float16 and HNSW)
+with the same synthetic, clustered embeddings. It then reports dense-search
+latency, recall@k against exact search, build time, process memory growth
+and, for the index tier, the size of its arrays. Each engine and size runs
+in its own subprocess, so the memory of one does not count against another:
+
+    python benchmarks/vector_index.py --chunks 10000 100000 1000000
+
+Chroma queries return text and metadata with the neighbours. With the index
+tier those come from a Chroma get by id, so the Chroma run also times that
+get, and the tier's total is search plus get.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pdf_ingestion import current_rss_mb
+
+ENGINES = ["chroma", "exact", "exact-float16", "hnsw"]
+
+def embedding_batches(count: int, dimension: int, batch_size: int = 5000, clusters: int = 256, seed: int = 0):
+    """Clustered unit vectors, generated batch by batch so the whole set is never held at once"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        batch = centers[rng.integers(0, clusters, size)] + 0.6 * rng.normal(size=(size, dimension)).astype(np.float32)
+        batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+        yield start, batch
+
+def query_vectors(queries: int, dimension: int, clusters: int = 256) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    rng = np.random.default_rng(1)
+    batch = centers[rng.integers(0, clusters, queries)] + 0.6 * rng.normal(size=(queries, dimension)).astype(np.float32)
+    return batch / np.linalg.norm(batch, axis=1, keepdims=True)
+
+def percentiles(samples) -> dict:
+    return {"p50_ms": round(float(np.percentile(samples, 50)), 3), "p95_ms": round(float(np.percentile(samples, 95)), 3)}
+
+def exact_neighbours(args, queries: np.ndarray) -> list:
+    """Ground truth top-k ids per query, by brute force over every batch"""
+    best_scores = np.full((len(queries), args.k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), args.k), dtype=np.int64)
+    for start, batch in embedding_batches(args.single_chunks, args.dimension):
+        scores = np.concatenate([best_scores, queries @ batch.T], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(batch)), (len(queries), len(batch)))], axis=1)
+        top = np.argpartition(-scores, args.k, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return [{f"chunk_{i}" for i in row} for row in best_ids]
+
+def run_single(args):
+    queries = query_vectors(args.queries, args.dimension)
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    get_samples = []
+    index_mb = None
+
+    if args.single == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        workdir = tempfile.mkdtemp()
+        client = chromadb.PersistentClient(path=workdir, settings=Settings(anonymized_telemetry=False))
+        collection = client.get_or_create_collection(name="knowledge_base", metadata={"hnsw:space": "cosine"})
+        for offset, batch in embedding_batches(args.single_chunks, args.dimension):
+            ids = [f"chunk_{offset + i}" for i in range(len(batch))]
+            collection.add(
+                ids=ids, embeddings=batch.tolist(), documents=[f"text of {chunk_id}" for chunk_id in ids],
+                metadatas=[{"source": f"doc_{(offset + i) // 100}.pdf"} for i in range(len(batch))]
+            )
+        build_s = time.perf_counter() - start
+
+        def search(query):
+            results = collection.query(
+                query_embeddings=[query.tolist()], n_results=args.k, include=["documents", "metadatas", "distances"]
+            )
+            return results["ids"][0]
+
+        def fetch(ids):
+            collection.get(ids=ids, include=["documents", "metadatas"])
+    else:
+        from vector_index import VectorIndex
+        index = VectorIndex(
+            args.dimension,
+            mode="hnsw" if args.single == "hnsw" else "exact",
+            dtype="float16" if args.single == "exact-float16" else "float32"
+        )
+        for offset, batch in embedding_batches(args.single_chunks, args.dimension):
+            index.add([f"chunk_{offset + i}" for i in range(len(batch))], batch)
+        build_s = time.perf_counter() - start
+
+        def search(query):
+            return [chunk_id for chunk_id, _ in index.search(query, args.k)]
+
+        fetch = None
+        index_mb = index.memory_bytes() / 1024 / 1024
+
+    memory_mb = current_rss_mb() - baseline
+    # Warm up: Chroma loads its HNSW segment on the first query
+    for query in queries[:5]:
+        search(query)
+    samples, found = [], []
+    for query in queries:
+        query_start = time.perf_counter()
+        found.append(search(query))
+        samples.append((time.perf_counter() - query_start) * 1000)
+        if fetch is not None:
+            fetch_start = time.perf_counter()
+            fetch(found[-1])
+            get_samples.append((time.perf_counter() - fetch_start) * 1000)
+
+    truth = exact_neighbours(args, queries)
+    recall = float(np.mean([len(truth_ids & set(ids)) / args.k for truth_ids, ids in zip(truth, found)]))
+    result = {
+        "engine": args.single,
+        "chunks": args.single_chunks,
+        "build_s": round(build_s, 1),
+        "memory_mb": round(max(memory_mb, current_rss_mb() - baseline), 1),
+        "search": percentiles(samples),
+        "recall_at_k": round(recall, 4)
+    }
+    if index_mb is not None:
+        result["index_mb"] = round(index_mb, 1)
+    if get_samples:
+        result["get_by_id"] = percentiles(get_samples)
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process vector index benchmark")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument("--dimension", type=int, default=384, help="all-MiniLM-L6-v2 embeddings have 384")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="Neighbours per query; the dense leg asks for HYBRID_CANDIDATES")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--single-chunks", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    results = []
+    for chunks in args.chunks:
+        get_by_id = None
+        for engine in args.engines:
+            command = [
+                sys.executable, os.path.abspath(__file__), "--single", engine, "--single-chunks", str(chunks),
+                "--dimension", str(args.dimension), "--queries", str(args.queries), "--k", str(args.k)
+            ]
+            output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=BACKEND_DIR)
+            row = json.loads(output.stdout.strip().splitlines()[-1])
+            get_by_id = row.get("get_by_id", get_by_id)
+            results.append(row)
+            if not args.json:
+                extra = f"  (get by id p50 {get_by_id['p50_ms']} ms)" if engine == "chroma" and get_by_id else ""
+                print(f"chunks={chunks:<8} {engine:<14} search p50 {row['search']['p50_ms']:>8} ms  "
+                      f"p95 {row['search']['p95_ms']:>8} ms  recall@{args.k} {row['recall_at_k']:.3f}  "
+                      f"RSS growth {row['memory_mb']:>7} MB  build {row['build_s']} s{extra}"
+                      + (f"  index {row['index_mb']} MB" if "index_mb" in row else ""))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
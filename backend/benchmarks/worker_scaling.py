@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Multi-worker scaling benchmark.
+
+Starts a Chroma server, then for each worker count starts uvicorn with that
+many workers sharing it, uploads a synthetic corpus, and reports /chat
+throughput and latency. It then uploads one more document and measures how
+long after its ingestion job completes every worker answers scoped chats
+from it (new connections are spread over the workers by the kernel):
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --concurrency 32 --requests 512
+
+Generation uses the in-process mock LLM backend with no added latency (set
+MOCK_LLM_TTFT_MS / MOCK_LLM_ITL_MS to simulate a model) and the answer cache
+is off, so the numbers are retrieval and serving only.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_load import run_load
+from synthetic_pdf import random_paragraph, write_pdf
+
+def wait_for(url: str, timeout: float, process=None):
+    start = time.perf_counter()
+    with httpx.Client(timeout=1.0) as client:
+        while time.perf_counter() - start < timeout:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Process exited with code {process.returncode}")
+            try:
+                if client.get(url).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout} s")
+
+def upload(client: httpx.Client, path: str, timeout: float = 300) -> float:
+    """Upload a PDF and wait for its ingestion job; returns the time the job completed"""
+    with open(path, "rb") as f:
+        job = client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")}).json()
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        status = client.get(f"/jobs/{job['job_id']}").json()["status"]
+        if status == "completed":
+            return time.perf_counter()
+        if status in ("failed", "cancelled"):
+            raise RuntimeError(f"Ingestion of {path} {status}")
+        time.sleep(0.05)
+    raise RuntimeError(f"Ingestion of {path} did not finish in {timeout} s")
+
+def propagation_time(url: str, path: str, probes: int, timeout: float = 60) -> float:
+    """Seconds from the job completing until the first of probes consecutive scoped chats that find the new document"""
+    source = os.path.basename(path)
+    # No keep-alive, so consecutive probes land on different workers
+    limits = httpx.Limits(max_keepalive_connections=0)
+    with httpx.Client(base_url=url, timeout=60.0, limits=limits) as client:
+        completed = upload(client, path)
+        consecutive = 0
+        visible_since = completed
+        while consecutive < probes:
+            sent = time.perf_counter()
+            if sent - completed > timeout:
+                raise RuntimeError(f"{source} not visible on every worker after {timeout} s")
+            response = client.post("/chat", json={"message": "zebracode calibration", "filters": {"sources": [source]}})
+            if source not in response.json().get("sources", []):
+                consecutive = 0
+            else:
+                if consecutive == 0:
+                    visible_since = sent
+                consecutive += 1
+        return visible_since - completed
+
+def run(workers: int, args, workdir: str, pdfs, probe_pdf: str) -> dict:
+    chroma = subprocess.Popen(
+        ["chroma", "run", "--path", os.path.join(workdir, "chroma_server"), "--port", str(args.chroma_port)],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    env = dict(
+        os.environ,
+        LLM_BACKEND="mock",
+        MOCK_LLM_TTFT_MS=os.getenv("MOCK_LLM_TTFT_MS", "0"),
+        MOCK_LLM_ITL_MS=os.getenv("MOCK_LLM_ITL_MS", "0"),
+        ANSWER_CACHE_ENABLED="false",
+        CHROMA_SERVER_HOST="127.0.0.1",
+        CHROMA_SERVER_PORT=str(args.chroma_port),
+        CHROMA_PERSIST_DIRECTORY=os.path.join(workdir, "data"),
+        INGESTION_JOBS_DIRECTORY=os.path.join(workdir, "jobs"),
+        WEB_CONCURRENCY=str(workers)
+    )
+    server = None
+    try:
+        wait_for(f"http://127.0.0.1:{args.chroma_port}/api/v1/heartbeat", 60, chroma)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        url = f"http://127.0.0.1:{args.port}"
+        wait_for(f"{url}/health/ready", 300, server)
+        # Every worker must be up before the load starts, not just the first to answer
+        time.sleep(args.settle)
+        with httpx.Client(base_url=url, timeout=60.0) as client:
+            for path in pdfs:
+                upload(client, path)
+
+        result = asyncio.run(run_load(url, args.concurrency, args.requests, args.question, 120.0))
+        result["workers"] = workers
+        result["propagation_ms"] = round(propagation_time(url, probe_pdf, probes=max(4, 2 * workers)) * 1000, 1)
+        return result
+    finally:
+        for process in (server, chroma):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker scaling benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10, help="Pages per document")
+    parser.add_argument("--question", default="What is the calibration procedure?")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--chroma-port", type=int, default=8767)
+    parser.add_argument("--settle", type=float, default=5.0, help="Seconds to let every worker finish starting")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = []
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        pdfs = []
+        for i in range(args.documents):
+            path = os.path.join(corpus_dir, f"doc_{i}.pdf")
+            write_pdf(path, args.pages, lambda page: random_paragraph(rng, sentences=12))
+            pdfs.append(path)
+        probe_pdf = os.path.join(corpus_dir, "probe.pdf")
+        write_pdf(probe_pdf, 1, lambda page: "The zebracode calibration procedure requires a torque wrench.")
+
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as workdir:
+                row = run(workers, args, workdir, pdfs, probe_pdf)
+            results.append(row)
+            if not args.json:
+                print(f"workers={workers:<2} throughput={row['throughput_rps']} req/s p50={row['p50_ms']}ms "
+                      f"p95={row['p95_ms']}ms errors={row['errors']} new upload visible on all workers "
+                      f"after {row['propagation_ms']} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Identifiers such as ERR-404, X12.5 or pump_v2 are kept whole and also split into their parts
+TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+PART = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "will with what which who how when where why do does can i you we they".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased BM25 terms of a text"""
+    terms = []
+    for token in TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in PART.findall(token) if part not in STOPWORDS)
+    return terms
+
+class BM25Index:
+    def __init__(self, directory: str, k1: float = 1.2, b: float = 0.75):
+        """In-process BM25 inverted index with array-backed postings"""
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+
+        # Documents are numbered in insertion order; removed ones are tombstoned until compaction
+        self._doc_ids: List[str] = []
+        self._doc_numbers: Dict[str, int] = {}
+        self._doc_lengths = array("i")
+        self._alive = bytearray()
+        self._live_count = 0
+        self._total_length = 0
+
+        # Postings per term: parallel arrays of document numbers and term frequencies
+        self._terms: Dict[str, int] = {}
+        self._posting_docs: List[array] = []
+        self._posting_tfs: List[array] = []
+
+        self._dirty = False
+        self.last_saved = time.time()
+
+        os.makedirs(directory, exist_ok=True)
+        # Worker processes sharing the directory save and load under this lock
+        self.lock_path = os.path.join(directory, "index.lock")
+        with file_lock(self.lock_path):
+            self._load()
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    def __contains__(self, chunk_id: str) -> bool:
+        with self._lock:
+            number = self._doc_numbers.get(chunk_id)
+            return number is not None and bool(self._alive[number])
+
+    def add(self, ids: List[str], texts: List[str]) -> Set[str]:
+        """Index chunks, replacing any with the same id; returns the terms they contain"""
+        added_terms = set()
+        tokenized = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            for chunk_id, counts in zip(ids, tokenized):
+                self._remove_locked(chunk_id)
+                number = len(self._doc_ids)
+                self._doc_ids.append(chunk_id)
+                self._doc_numbers[chunk_id] = number
+                length = sum(counts.values())
+                self._doc_lengths.append(length)
+                self._alive.append(1)
+                self._live_count += 1
+                self._total_length += length
+
+                for term, tf in counts.items():
+                    term_id = self._terms.get(term)
+                    if term_id is None:
+                        term_id = len(self._posting_docs)
+                        self._terms[term] = term_id
+                        self._posting_docs.append(array("i"))
+                        self._posting_tfs.append(array("i"))
+                    self._posting_docs[term_id].append(number)
+                    self._posting_tfs[term_id].append(tf)
+                added_terms.update(counts)
+            self._dirty = True
+        return added_terms
+
+    def remove(self, ids: Iterable[str]) -> int:
+        """Remove chunks from the index"""
+        with self._lock:
+            removed = sum(self._remove_locked(chunk_id) for chunk_id in ids)
+            if removed:
+                self._dirty = True
+        return removed
+
+    def _remove_locked(self, chunk_id: str) -> bool:
+        number = self._doc_numbers.pop(chunk_id, None)
+        if number is None:
+            return False
+        self._alive[number] = 0
+        self._live_count -= 1
+        self._total_length -= self._doc_lengths[number]
+        return True
+
+    def search(self, query: str, k: int = 10, allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Return the k best (chunk id, score) pairs for a query, optionally only among allowed_ids"""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._live_count:
+                return []
+
+            n_docs = len(self._doc_ids)
+            average_length = self._total_length / self._live_count
+            lengths = np.frombuffer(self._doc_lengths, dtype=np.int32).astype(np.float32)
+            norms = self.k1 * (1 - self.b + self.b * lengths / max(average_length, 1e-9))
+            scores = np.zeros(n_docs, dtype=np.float32)
+
+            for term in terms:
+                term_id = self._terms.get(term)
+                if term_id is None:
+                    continue
+                docs = np.array(self._posting_docs[term_id], dtype=np.int32)
+                tfs = np.array(self._posting_tfs[term_id], dtype=np.float32)
+                # Tombstoned postings still count towards the document frequency until compaction
+                df = len(docs)
+                idf = math.log(1 + (self._live_count - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norms[docs])
+
+            scores[np.frombuffer(self._alive, dtype=np.uint8) == 0] = 0
+            if allowed_ids is not None:
+                # Prefilter: everything outside the allowed set is dropped before ranking
+                allowed = np.zeros(n_docs, dtype=bool)
+                numbers = [self._doc_numbers[chunk_id] for chunk_id in allowed_ids if chunk_id in self._doc_numbers]
+                allowed[np.array(numbers, dtype=np.int64)] = True
+                scores[~allowed] = 0
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+            ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._doc_ids[number], float(scores[number])) for number in ranked]
+
+    def _compact_locked(self):
+        """Drop tombstoned documents and renumber the rest"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+
+        self._doc_ids = [chunk_id for chunk_id, keep in zip(self._doc_ids, alive) if keep]
+        self._doc_numbers = {chunk_id: number for number, chunk_id in enumerate(self._doc_ids)}
+        self._doc_lengths = array("i", np.frombuffer(self._doc_lengths, dtype=np.int32)[alive].tobytes())
+        self._alive = bytearray(b"\x01" * len(self._doc_ids))
+
+        terms, posting_docs, posting_tfs = {}, [], []
+        for term, term_id in self._terms.items():
+            docs = np.array(self._posting_docs[term_id], dtype=np.int32)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            terms[term] = len(posting_docs)
+            posting_docs.append(array("i", renumber[docs[keep]].astype(np.int32).tobytes()))
+            posting_tfs.append(array("i", np.array(self._posting_tfs[term_id], dtype=np.int32)[keep].tobytes()))
+        self._terms, self._posting_docs, self._posting_tfs = terms, posting_docs, posting_tfs
+
+    def save(self, force: bool = False):
+        """Write the index to disk as one flat postings array plus per-term offsets"""
+        with self._lock:
+            if not self._dirty and not force:
+                return
+            if len(self._doc_ids) > self._live_count:
+                self._compact_locked()
+
+            terms = list(self._terms)
+            term_ids = [self._terms[term] for term in terms]
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(self._posting_docs[term_id]) for term_id in term_ids])
+            docs = np.frombuffer(b"".join(self._posting_docs[term_id].tobytes() for term_id in term_ids), dtype=np.int32)
+            tfs = np.frombuffer(b"".join(self._posting_tfs[term_id].tobytes() for term_id in term_ids), dtype=np.int32)
+
+            arrays_path = os.path.join(self.directory, "postings.npz")
+            meta_path = os.path.join(self.directory, "index.json")
+            with file_lock(self.lock_path):
+                with open(arrays_path + ".tmp", "wb") as f:
+                    np.savez(f, offsets=offsets, docs=docs, tfs=tfs,
+                             doc_lengths=np.frombuffer(self._doc_lengths, dtype=np.int32))
+                with open(meta_path + ".tmp", "w") as f:
+                    json.dump({"k1": self.k1, "b": self.b, "doc_ids": self._doc_ids, "terms": terms}, f)
+                # The metadata names the arrays it belongs to, so it is replaced last
+                os.replace(arrays_path + ".tmp", arrays_path)
+                os.replace(meta_path + ".tmp", meta_path)
+            self._dirty = False
+            self.last_saved = time.time()
+
+    def _load(self):
+        arrays_path = os.path.join(self.directory, "postings.npz")
+        meta_path = os.path.join(self.directory, "index.json")
+        if not (os.path.exists(arrays_path) and os.path.exists(meta_path)):
+            return
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arrays = np.load(arrays_path)
+            offsets, docs, tfs = arrays["offsets"], arrays["docs"], arrays["tfs"]
+            doc_lengths = arrays["doc_lengths"]
+            if len(meta["terms"]) + 1 != len(offsets) or len(meta["doc_ids"]) != len(doc_lengths):
+                raise ValueError("postings and index metadata do not match")
+        except Exception as e:
+            logger.error(f"Could not load BM25 index from {self.directory}, starting empty: {e}")
+            return
+
+        self._doc_ids = meta["doc_ids"]
+        self._doc_numbers = {chunk_id: number for number, chunk_id in enumerate(self._doc_ids)}
+        self._doc_lengths = array("i", doc_lengths.astype(np.int32).tobytes())
+        self._alive = bytearray(b"\x01" * len(self._doc_ids))
+        self._live_count = len(self._doc_ids)
+        self._total_length = int(doc_lengths.sum())
+        self._terms = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        self._posting_docs = [array("i", docs[start:end].tobytes()) for start, end in zip(offsets[:-1], offsets[1:])]
+        self._posting_tfs = [array("i", tfs[start:end].tobytes()) for start, end in zip(offsets[:-1], offsets[1:])]
+        logger.info(f"Loaded BM25 index with {self._live_count} chunks and {len(self._terms)} terms")
+
+    def clear(self):
+        """Drop every document from the index"""
+        with self._lock:
+            self._doc_ids, self._doc_numbers = [], {}
+            self._doc_lengths, self._alive = array("i"), bytearray()
+            self._live_count = self._total_length = 0
+            self._terms, self._posting_docs, self._posting_tfs = {}, [], []
+            self._dirty = True
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get index size figures"""
+        with self._lock:
+            postings = sum(len(docs) for docs in self._posting_docs)
+            return {
+                "chunks": self._live_count,
+                "tombstoned_chunks": len(self._doc_ids) - self._live_count,
+                "terms": len(self._terms),
+                "postings": postings,
+                "postings_bytes": postings * 8
+            }
@@ -0,0 +1,180 @@
+import bisect
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Span = Tuple[int, int]
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    start: int
+    end: int
+    page: int
+    page_end: int
+
+class RecursiveSplitter:
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        """LangChain's recursive character splitter, reporting character offsets"""
+        # Imported here so that importing this module does not pull in langchain
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+
+    def spans(self, text: str) -> List[Span]:
+        """Split text and return the (start, end) offset of every chunk"""
+        spans = []
+        cursor = 0
+        for piece in self._splitter.split_text(text):
+            start = text.find(piece, cursor)
+            if start < 0:
+                start = cursor
+            spans.append((start, start + len(piece)))
+            cursor = start + 1
+        return spans
+
+class SentenceSplitter:
+    # A sentence end (with optional closing quote or bracket) or a blank line
+    BOUNDARY = re.compile(r"[.!?][\"')\]]?\s+|\n\s*\n")
+    # Greedy prefix, so a match ends at the last boundary before endpos
+    LAST_BOUNDARY = re.compile(r"(?s:.*)(?:[.!?][\"')\]]?\s+|\n\s*\n)")
+    NON_SPACE = re.compile(r"\S")
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        """Cut chunks at sentence boundaries, jumping a whole chunk at a time"""
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _skip_space(self, text: str, pos: int) -> int:
+        match = self.NON_SPACE.search(text, pos)
+        return match.start() if match else len(text)
+
+    def spans(self, text: str) -> List[Span]:
+        """Split text and return the (start, end) offset of every chunk"""
+        spans = []
+        n = len(text)
+        start = self._skip_space(text, 0)
+        while start < n:
+            limit = start + self.chunk_size
+            if limit >= n:
+                end = n
+            else:
+                # Each window is matched once from its end, instead of once per separator
+                match = self.LAST_BOUNDARY.match(text, start, limit)
+                if match and match.end() > start + self.chunk_overlap:
+                    end = match.end()
+                else:
+                    space = text.rfind(" ", start + 1, limit)
+                    end = space if space > start else limit
+
+            chunk_end = end
+            while chunk_end > start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_end > start:
+                spans.append((start, chunk_end))
+            if end >= n:
+                break
+
+            # Restart at the first sentence that begins inside the overlap window
+            next_start = end
+            if self.chunk_overlap:
+                match = self.BOUNDARY.search(text, max(start + 1, chunk_end - self.chunk_overlap), chunk_end)
+                if match:
+                    next_start = match.end()
+            start = self._skip_space(text, next_start)
+        return spans
+
+SPLITTERS = {
+    "recursive": RecursiveSplitter,
+    "sentence": SentenceSplitter,
+}
+
+def create_splitter(name: str = None, chunk_size: int = None, chunk_overlap: int = None):
+    """Create the splitter configured by CHUNKER, CHUNK_SIZE and CHUNK_OVERLAP"""
+    name = name or os.getenv("CHUNKER", "recursive")
+    if name not in SPLITTERS:
+        raise ValueError(f"Unknown chunker '{name}', expected one of {sorted(SPLITTERS)}")
+    return SPLITTERS[name](
+        chunk_size=chunk_size or int(os.getenv("CHUNK_SIZE", "1000")),
+        chunk_overlap=chunk_overlap if chunk_overlap is not None else int(os.getenv("CHUNK_OVERLAP", "200"))
+    )
+
+class ChunkingStage:
+    def __init__(self, splitter):
+        """Chunk a document fed page by page, tracking offsets and page numbers"""
+        self.splitter = splitter
+        self.text_length = 0
+        self._buffer = ""
+        self._buffer_start = 0
+        self._page_starts: List[int] = []
+        self._next_index = 0
+
+    def feed(self, page_texts: List[str]) -> List[Chunk]:
+        """Add the next pages and return every chunk that can no longer change"""
+        parts = []
+        for text in page_texts:
+            # Pages are joined with a newline, as if the whole document were one string
+            if self.text_length:
+                parts.append("\n")
+                self.text_length += 1
+            self._page_starts.append(self.text_length)
+            parts.append(text)
+            self.text_length += len(text)
+        self._buffer += "".join(parts)
+        return self._emit(final=False)
+
+    def finish(self) -> List[Chunk]:
+        """Return the chunks left in the buffer at the end of the document"""
+        return self._emit(final=True)
+
+    def _emit(self, final: bool) -> List[Chunk]:
+        spans = self.splitter.spans(self._buffer)
+
+        # The last chunk may still grow with the next page, so it stays buffered
+        if not final:
+            if not spans:
+                return []
+            carry_from = spans[-1][0]
+            spans = spans[:-1]
+        else:
+            carry_from = len(self._buffer)
+
+        chunks = []
+        for start, end in spans:
+            text = self._buffer[start:end]
+            if not text.strip():
+                continue
+            start += self._buffer_start
+            end += self._buffer_start
+            chunks.append(Chunk(
+                index=self._next_index,
+                text=text,
+                start=start,
+                end=end,
+                page=self._page_at(start),
+                page_end=self._page_at(max(start, end - 1))
+            ))
+            self._next_index += 1
+
+        self._buffer = self._buffer[carry_from:]
+        self._buffer_start += carry_from
+        return chunks
+
+    def _page_at(self, offset: int) -> int:
+        """1-based page number containing a document offset"""
+        return max(1, bisect.bisect_right(self._page_starts, offset))
+
+def split_text(splitter, text: str) -> List[Chunk]:
+    """Chunk a whole document held in memory"""
+    stage = ChunkingStage(splitter)
+    return stage.feed([text]) + stage.finish()
@@ -0,0 +1,224 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Roughly one token per word or punctuation mark, which is close to BPE counts for English prose
+APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+class TokenCounter:
+    def __init__(self, model: str = "gpt-3.5-turbo"):
+        """Count prompt tokens with the model's tiktoken encoding, or approximately without it"""
+        self.model = model
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # tiktoken missing, or its encoding file not cached and not downloadable
+            logger.warning(f"tiktoken unavailable ({type(e).__name__}), approximating token counts")
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(APPROX_TOKEN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text within max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        matches = list(APPROX_TOKEN.finditer(text))
+        return text if len(matches) <= max_tokens else text[:matches[max_tokens - 1].end()]
+
+@dataclass
+class Passage:
+    """Contiguous text of one source, assembled from one or more retrieved chunks"""
+    source: str
+    text: str
+    rank: int
+    chunk_indexes: List[int] = field(default_factory=list)
+    start: Optional[int] = None
+    end: Optional[int] = None
+    page: Optional[int] = None
+    page_end: Optional[int] = None
+
+
+@dataclass
+class BuiltContext:
+    """Prompt context packed into a token budget"""
+    text: str
+    sources: List[str]
+    passages: List[Passage]
+    tokens: int
+    # Tokens the retrieved chunks would have taken joined verbatim
+    raw_tokens: int
+    chunks_used: int
+    chunks_merged: int
+    chunks_dropped: int
+    truncated: bool
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.tokens
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "context_tokens": self.tokens,
+            "raw_tokens": self.raw_tokens,
+            "tokens_saved": self.tokens_saved,
+            "chunks_used": self.chunks_used,
+            "chunks_merged": self.chunks_merged,
+            "chunks_dropped": self.chunks_dropped,
+            "truncated": self.truncated
+        }
+
+class ContextBuilder:
+    def __init__(self, max_tokens: int = 2000, counter: Optional[TokenCounter] = None,
+                 min_truncated_tokens: int = 64, max_overlap_chars: int = 2000):
+        """Merge adjacent chunks, strip their overlap and pack the passages into a token budget"""
+        self.max_tokens = max_tokens
+        self.counter = counter or TokenCounter()
+        self.min_truncated_tokens = min_truncated_tokens
+        self.max_overlap_chars = max_overlap_chars
+
+        # Counters
+        self.requests = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+        self.truncations = 0
+
+    def build(self, documents: List[str], metadatas: List[Dict[str, Any]]) -> BuiltContext:
+        """Assemble context from chunks in rank order"""
+        raw_tokens = self.counter.count("\n\n".join(documents)) if documents else 0
+        passages, merged = self._merge(documents, metadatas)
+
+        parts, used, tokens, truncated = [], [], 0, False
+        separator_tokens = self.counter.count("\n\n")
+        for passage in passages:
+            cost = self.counter.count(passage.text) + (separator_tokens if parts else 0)
+            if tokens + cost <= self.max_tokens:
+                parts.append(passage.text)
+                used.append(passage)
+                tokens += cost
+                continue
+            # Fill what is left of the budget with the start of the best passage that does not fit
+            remaining = self.max_tokens - tokens - (separator_tokens if parts else 0)
+            if remaining >= self.min_truncated_tokens:
+                text = self.counter.truncate(passage.text, remaining)
+                if text.strip():
+                    parts.append(text)
+                    used.append(passage)
+                    tokens = self.counter.count("\n\n".join(parts))
+                    truncated = True
+            break
+
+        used_chunks = sum(len(passage.chunk_indexes) for passage in used)
+        sources = list(dict.fromkeys(passage.source for passage in used))
+        context = BuiltContext(
+            text="\n\n".join(parts),
+            sources=sources,
+            passages=used,
+            tokens=tokens,
+            raw_tokens=raw_tokens,
+            chunks_used=used_chunks,
+            chunks_merged=merged,
+            chunks_dropped=len(documents) - used_chunks,
+            truncated=truncated
+        )
+
+        self.requests += 1
+        self.tokens_used += context.tokens
+        self.tokens_saved += context.tokens_saved
+        self.truncations += int(truncated)
+        return context
+
+    def _merge(self, documents: List[str], metadatas: List[Dict[str, Any]]) -> Tuple[List[Passage], int]:
+        """Join chunks that are neighbours in the same source; passages keep their best chunk's rank"""
+        by_source: Dict[str, List[Tuple[int, str, Dict[str, Any]]]] = {}
+        for rank, (text, metadata) in enumerate(zip(documents, metadatas)):
+            by_source.setdefault(metadata.get("source", "unknown"), []).append((rank, text, metadata))
+
+        passages, merged = [], 0
+        for source, chunks in by_source.items():
+            chunks.sort(key=lambda chunk: self._position(chunk[2], chunk[0]))
+            current = None
+            for rank, text, metadata in chunks:
+                index = metadata.get("chunk_index")
+                if current is not None and self._adjacent(current, index, metadata):
+                    current.text = self._join(current, text, metadata)
+                    current.rank = min(current.rank, rank)
+                    current.chunk_indexes.append(index)
+                    end = metadata.get("end_offset")
+                    current.end = max(current.end, end) if current.end is not None and end is not None else end
+                    current.page_end = metadata.get("page_end") or current.page_end
+                    merged += 1
+                    continue
+                current = Passage(
+                    source=source,
+                    text=text,
+                    rank=rank,
+                    chunk_indexes=[index],
+                    start=metadata.get("start_offset"),
+                    end=metadata.get("end_offset"),
+                    page=metadata.get("page"),
+                    page_end=metadata.get("page_end")
+                )
+                passages.append(current)
+
+        passages.sort(key=lambda passage: passage.rank)
+        return passages, merged
+
+    @staticmethod
+    def _position(metadata: Dict[str, Any], rank: int) -> Tuple[int, int]:
+        if metadata.get("start_offset") is not None:
+            return (metadata["start_offset"], 0)
+        if metadata.get("chunk_index") is not None:
+            return (metadata["chunk_index"], 0)
+        return (1 << 62, rank)
+
+    @staticmethod
+    def _adjacent(current: Passage, index: Optional[int], metadata: Dict[str, Any]) -> bool:
+        start = metadata.get("start_offset")
+        if current.end is not None and start is not None and start <= current.end:
+            return True
+        last = current.chunk_indexes[-1]
+        return last is not None and index is not None and index == last + 1
+
+    def _join(self, current: Passage, text: str, metadata: Dict[str, Any]) -> str:
+        """Append a neighbouring chunk without the span both chunks contain"""
+        start = metadata.get("start_offset")
+        if current.end is not None and start is not None:
+            # Offsets are exact document positions, so the overlap is known
+            overlap = current.end - start
+            if overlap >= len(text):
+                return current.text
+            # Consecutive chunks without overlap are separated by whitespace the splitter dropped
+            return current.text + text[overlap:] if overlap > 0 else current.text + "\n" + text
+        # Older chunks without offsets: find the longest suffix that the next chunk starts with
+        limit = min(len(current.text), len(text), self.max_overlap_chars)
+        for size in range(limit, 0, -1):
+            if current.text.endswith(text[:size]):
+                return current.text + text[size:]
+        return current.text + "\n" + text
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_tokens": self.max_tokens,
+            "exact_token_counts": self.counter.exact,
+            "requests": self.requests,
+            "tokens_used": self.tokens_used,
+            "tokens_saved": self.tokens_saved,
+            "truncations": self.truncations
+        }
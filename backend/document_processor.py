@@ -1,111 +1,240 @@
 import os
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional
 import asyncio
-from io import BytesIO
-import PyPDF2
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import hashlib
+import multiprocessing
+import time
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from rag_pipeline import RAGPipeline
+from chunking import Chunk, ChunkingStage, create_splitter
+from pdf_extraction import count_pages, extract_page_range
+import metrics
 
 logger = logging.getLogger(__name__)
 
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, read in blocks so large uploads are never held in memory"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 class DocumentProcessor:
     def __init__(self):
         """Initialize the document processor"""
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+        self.chunker = create_splitter()
         self.rag_pipeline = None
-        self.processed_documents = []
+        # Shared with the other worker processes; set with the RAG pipeline
+        self.document_store = None
         
+        # Pages are extracted in parallel worker processes and consumed in
+        # batches, so only a bounded window of page text is held in memory
+        self.page_batch_size = int(os.getenv("PDF_PAGE_BATCH_SIZE", "16"))
+        self.extract_workers = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+        self.max_inflight_batches = self.extract_workers * 2
+        self.spool_directory = os.getenv("UPLOAD_SPOOL_DIRECTORY") or tempfile.gettempdir()
+        self._extract_executor = None
+
     async def initialize_rag_pipeline(self, rag_pipeline: RAGPipeline):
         """Initialize the RAG pipeline reference"""
         self.rag_pipeline = rag_pipeline
+        self.chunker = rag_pipeline.chunker
+        self.document_store = rag_pipeline.document_store
+
+    def _get_extract_executor(self) -> ProcessPoolExecutor:
+        """Create the extraction process pool on first use"""
+        if self._extract_executor is None:
+            # Spawned workers only import pdf_extraction, never torch or chromadb
+            self._extract_executor = ProcessPoolExecutor(
+                max_workers=self.extract_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._extract_executor
 
     async def process_document(self, file_content: bytes, filename: str) -> Dict[str, Any]:
-        """Process a document and add it to the knowledge base"""
+        """Process in-memory PDF bytes and add them to the knowledge base"""
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=self.spool_directory)
         try:
-            # Extract text from PDF
-            text = await self._extract_text_from_pdf(file_content)
+            with os.fdopen(fd, "wb") as f:
+                f.write(file_content)
+            return await self.process_file(path, filename)
+        finally:
+            os.remove(path)
+
+    async def process_file(self, path: str, filename: str,
+                           progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Stream a spooled PDF through extraction, chunking and embedding"""
+        def report(**fields):
+            if progress:
+                progress(fields)
+        
+        chunk_count = 0
+        update = None
+        start_time = time.perf_counter()
+        try:
+            # Diff against what the collection already holds for this document
+            if self.rag_pipeline:
+                update = await self.rag_pipeline.begin_source_update(filename)
             
-            if not text.strip():
-                raise ValueError("No text content found in the document")
+            # Milliseconds per stage; the pipeline adds embedding, storage and finalizing
+            stages = update.stages if update else defaultdict(float)
+            loop = asyncio.get_running_loop()
+            executor = self._get_extract_executor()
+            stage_start = time.perf_counter()
+            total_pages = await loop.run_in_executor(executor, count_pages, path)
+            report(stage="extracting", pages_total=total_pages)
             
-            # Create document object
-            document = Document(
-                page_content=text,
-                metadata={
-                    "source": filename,
-                    "type": "pdf",
-                    "processed_at": str(asyncio.get_event_loop().time())
-                }
-            )
+            stage = ChunkingStage(self.chunker)
+            pages_done = 0
             
-            # Add to RAG pipeline
-            if self.rag_pipeline:
-                await self.rag_pipeline.add_documents([document], {"filename": filename})
+            async for page_texts in self._iter_page_batches(path, total_pages):
+                # Only the time spent waiting for extraction, which otherwise overlaps embedding
+                stages["extract"] += (time.perf_counter() - stage_start) * 1000
+                pages_done += len(page_texts)
+                chunk_start = time.perf_counter()
+                chunks = stage.feed(page_texts)
+                stages["chunk"] += (time.perf_counter() - chunk_start) * 1000
+                if chunks:
+                    report(stage="embedding", pages_done=pages_done)
+                    chunk_count += await self._store_chunks(update, chunks, filename)
+                report(stage="extracting", pages_done=pages_done, chunks_embedded=chunk_count)
+                stage_start = time.perf_counter()
             
-            # Track processed document
-            self.processed_documents.append({
-                "filename": filename,
-                "text_length": len(text),
-                "chunks": len(self.text_splitter.split_documents([document]))
-            })
+            chunk_count += await self._store_chunks(update, stage.finish(), filename)
+            text_length = stage.text_length
+            
+            if chunk_count == 0:
+                raise ValueError("No text content found in the document")
+            
+            report(stage="finalizing", chunks_embedded=chunk_count)
+            changes = {}
+            if update:
+                # The source stays locked until the registry records this version too,
+                # so a delete waiting for it removes both
+                changes = await self.rag_pipeline.finish_source_update(update, release=False)
             
-            logger.info(f"Successfully processed document: {filename}")
+            # Track processed document, replacing an earlier version
+            if self.document_store:
+                content_hash = await loop.run_in_executor(None, file_digest, path)
+                await loop.run_in_executor(
+                    None, lambda: self.document_store.upsert(
+                        filename, text_length, chunk_count, content_hash=content_hash,
+                        size_bytes=os.path.getsize(path), pages=total_pages,
+                        ingest_ms=(time.perf_counter() - start_time) * 1000
+                    )
+                )
+            stages["total"] = (time.perf_counter() - start_time) * 1000
+            metrics.observe_stages("process_document", stages)
+            
+            logger.info(f"Successfully processed document: {filename} ({total_pages} pages, {chunk_count} chunks)")
             
             return {
                 "filename": filename,
-                "text_length": len(text),
-                "chunks_created": len(self.text_splitter.split_documents([document])),
+                "text_length": text_length,
+                "pages": total_pages,
+                "chunks_created": chunk_count,
+                **changes,
                 "status": "success"
             }
-            
-        except Exception as e:
+        
+        except (Exception, asyncio.CancelledError) as e:
+            if not isinstance(e, asyncio.CancelledError):
+                metrics.ERRORS.labels("process_document").inc()
             logger.error(f"Error processing document {filename}: {e}")
+            # Remove the chunks this run added so no partial document is left behind
+            if update:
+                await self.rag_pipeline.abort_source_update(update)
             raise
+        finally:
+            if update:
+                self.rag_pipeline.release_source_update(update)
 
-    async def _extract_text_from_pdf(self, file_content: bytes) -> str:
-        """Extract text content from PDF bytes"""
+    async def _iter_page_batches(self, path: str, total_pages: int):
+        """Yield page text batches in order while later batches extract in parallel"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_extract_executor()
+        starts = iter(range(0, total_pages, self.page_batch_size))
+        pending = deque()
+        
+        def submit_next() -> bool:
+            start = next(starts, None)
+            if start is None:
+                return False
+            end = min(start + self.page_batch_size, total_pages)
+            pending.append(loop.run_in_executor(executor, extract_page_range, path, start, end))
+            return True
+        
+        for _ in range(self.max_inflight_batches):
+            if not submit_next():
+                break
+        
         try:
-            pdf_file = BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
-            
-            return text.strip()
-            
+            while pending:
+                page_texts = await pending.popleft()
+                ingest_pool = self.rag_pipeline.ingest_pool if self.rag_pipeline else None
+                if ingest_pool is not None:
+                    # Extraction competes with chats for CPU too, so it backs off with the ingest pool
+                    await ingest_pool.defer()
+                submit_next()
+                yield page_texts
         except Exception as e:
-            logger.error(f"Error extracting text from PDF: {e}")
             raise ValueError(f"Failed to extract text from PDF: {str(e)}")
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _store_chunks(self, update, chunks: List[Chunk], filename: str) -> int:
+        """Hand a batch of chunks to the RAG pipeline"""
+        if chunks and update:
+            await self.rag_pipeline.add_chunks(update, chunks, {"filename": filename})
+        return len(chunks)
 
-    async def list_documents(self) -> List[Dict[str, Any]]:
-        """List all processed documents"""
-        return self.processed_documents.copy()
+    async def delete_document(self, filename: str) -> int:
+        """Remove a document and all of its chunks from the knowledge base"""
+        deleted = await self.rag_pipeline.delete_source(filename) if self.rag_pipeline else 0
+        if self.document_store:
+            await asyncio.get_running_loop().run_in_executor(None, self.document_store.delete, filename)
+        return deleted
+
+    async def list_documents(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """List processed documents in upload order, a page at a time"""
+        if not self.document_store:
+            return []
+        return await asyncio.get_running_loop().run_in_executor(None, self.document_store.list, limit, offset)
 
     async def get_document_info(self, filename: str) -> Dict[str, Any]:
         """Get information about a specific document"""
-        for doc in self.processed_documents:
-            if doc["filename"] == filename:
-                return doc
-        return {"error": "Document not found"}
+        doc = None
+        if self.document_store:
+            doc = await asyncio.get_running_loop().run_in_executor(None, self.document_store.get, filename)
+        return doc or {"error": "Document not found"}
 
     def get_processing_stats(self) -> Dict[str, Any]:
         """Get processing statistics"""
-        total_docs = len(self.processed_documents)
-        total_text_length = sum(doc["text_length"] for doc in self.processed_documents)
-        total_chunks = sum(doc["chunks"] for doc in self.processed_documents)
+        # Totals are maintained by the registry, so this does not scan the documents
+        stats = self.document_store.stats() if self.document_store else {
+            "documents": 0, "size_bytes": 0, "pages": 0, "text_length": 0, "chunks": 0, "ingest_ms": 0.0
+        }
+        total_docs = stats["documents"]
+        total_text_length = stats["text_length"]
+        total_chunks = stats["chunks"]
         
         return {
             "total_documents": total_docs,
             "total_text_length": total_text_length,
             "total_chunks": total_chunks,
+            "total_pages": stats["pages"],
+            "total_size_bytes": stats["size_bytes"],
             "average_text_length": total_text_length / total_docs if total_docs > 0 else 0,
-            "average_chunks_per_doc": total_chunks / total_docs if total_docs > 0 else 0
+            "average_chunks_per_doc": total_chunks / total_docs if total_docs > 0 else 0,
+            "average_ingest_ms": stats["ingest_ms"] / total_docs if total_docs > 0 else 0
         }
+
+    def shutdown(self, wait: bool = False):
+        """Stop the extraction worker processes"""
+        if self._extract_executor is not None:
+            self._extract_executor.shutdown(wait=wait, cancel_futures=True)
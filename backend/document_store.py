@@ -0,0 +1,208 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = [
+    "filename", "content_hash", "size_bytes", "pages", "text_length", "chunks",
+    "ingest_ms", "created_at", "updated_at"
+]
+
+# Running totals kept by triggers, so stats never scan the documents table
+TOTAL_FIELDS = ["documents", "size_bytes", "pages", "text_length", "chunks", "ingest_ms"]
+
+class DocumentStore:
+    def __init__(self, db_path: str, change_log_size: int = 10000):
+        """Registry of ingested documents and a log of collection changes in SQLite, shared by every worker process"""
+        self.db_path = db_path
+        self.change_log_size = change_log_size
+        self._lock = threading.Lock()
+        # Writers from other processes hold the database briefly; wait for them instead of failing
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Worker processes starting together must not migrate the schema at the same time
+        with file_lock(db_path + ".lock"):
+            self._create_schema()
+
+    def _create_schema(self):
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                filename TEXT PRIMARY KEY,
+                text_length INTEGER NOT NULL,
+                chunks INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Registries created before documents recorded hashes, sizes and timings
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        for column, definition in [("content_hash", "TEXT"), ("size_bytes", "INTEGER NOT NULL DEFAULT 0"),
+                                   ("pages", "INTEGER NOT NULL DEFAULT 0"), ("ingest_ms", "REAL NOT NULL DEFAULT 0"),
+                                   ("created_at", "REAL")]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_updated ON documents (updated_at, filename)")
+        self._create_totals()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                action TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _create_totals(self):
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_totals'"
+        ).fetchone()
+        if exists:
+            return
+        self._conn.execute(f"""
+            CREATE TABLE document_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                {", ".join(f"{field} REAL NOT NULL DEFAULT 0" for field in TOTAL_FIELDS)}
+            )
+        """)
+        # Seeded from whatever the registry already holds; kept current by the triggers from then on
+        self._conn.execute(
+            f"INSERT INTO document_totals (id, {', '.join(TOTAL_FIELDS)}) SELECT 0, COUNT(*), "
+            "COALESCE(SUM(size_bytes), 0), COALESCE(SUM(pages), 0), COALESCE(SUM(text_length), 0), "
+            "COALESCE(SUM(chunks), 0), COALESCE(SUM(ingest_ms), 0) FROM documents"
+        )
+        added = ", ".join(f"{field} = {field} + NEW.{field}" for field in TOTAL_FIELDS[1:])
+        removed = ", ".join(f"{field} = {field} - OLD.{field}" for field in TOTAL_FIELDS[1:])
+        self._conn.execute(f"""
+            CREATE TRIGGER documents_insert AFTER INSERT ON documents BEGIN
+                UPDATE document_totals SET documents = documents + 1, {added} WHERE id = 0;
+            END
+        """)
+        self._conn.execute(f"""
+            CREATE TRIGGER documents_delete AFTER DELETE ON documents BEGIN
+                UPDATE document_totals SET documents = documents - 1, {removed} WHERE id = 0;
+            END
+        """)
+        changed = ", ".join(f"{field} = {field} - OLD.{field} + NEW.{field}" for field in TOTAL_FIELDS[1:])
+        self._conn.execute(f"""
+            CREATE TRIGGER documents_update AFTER UPDATE ON documents BEGIN
+                UPDATE document_totals SET {changed} WHERE id = 0;
+            END
+        """)
+
+    def upsert(self, filename: str, text_length: int, chunks: int, content_hash: Optional[str] = None,
+               size_bytes: int = 0, pages: int = 0, ingest_ms: float = 0.0):
+        """Record an ingested document, replacing an earlier version but keeping when it was first added"""
+        now = time.time()
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, which would delete the row and lose created_at
+            self._conn.execute(
+                f"INSERT INTO documents ({', '.join(DOCUMENT_FIELDS)}) VALUES ({', '.join('?' for _ in DOCUMENT_FIELDS)}) "
+                "ON CONFLICT (filename) DO UPDATE SET content_hash = excluded.content_hash, "
+                "size_bytes = excluded.size_bytes, pages = excluded.pages, text_length = excluded.text_length, "
+                "chunks = excluded.chunks, ingest_ms = excluded.ingest_ms, updated_at = excluded.updated_at",
+                (filename, content_hash, size_bytes, pages, text_length, chunks, ingest_ms, now, now)
+            )
+            self._conn.commit()
+
+    def delete(self, filename: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+            self._conn.commit()
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(DOCUMENT_FIELDS)} FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """Documents in upload order, one page at a time"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(DOCUMENT_FIELDS)} FROM documents ORDER BY updated_at, filename LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(TOTAL_FIELDS)} FROM document_totals WHERE id = 0").fetchone()
+        totals = dict(row)
+        return {
+            field: value if field == "ingest_ms" else int(value)
+            for field, value in totals.items()
+        }
+
+    def reconcile(self, sources: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        """Make the registry match the collection: sources maps each source to its chunks, text length and upload time"""
+        now = time.time()
+        added = removed = updated = 0
+        with self._lock:
+            try:
+                registered = {
+                    row["filename"]: row["chunks"]
+                    for row in self._conn.execute("SELECT filename, chunks FROM documents")
+                }
+                for filename in registered.keys() - sources.keys():
+                    self._conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+                    removed += 1
+                for filename, source in sources.items():
+                    if filename not in registered:
+                        # Ingested before the registry existed; hash, size and timings are unknown
+                        self._conn.execute(
+                            "INSERT INTO documents (filename, text_length, chunks, created_at, updated_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (filename, source["text_length"], source["chunks"],
+                             source.get("uploaded_at") or now, source.get("uploaded_at") or now)
+                        )
+                        added += 1
+                    elif registered[filename] != source["chunks"]:
+                        self._conn.execute(
+                            "UPDATE documents SET chunks = ? WHERE filename = ?", (source["chunks"], filename)
+                        )
+                        updated += 1
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return {"added": added, "removed": removed, "updated": updated}
+
+    def record_change(self, source: str, action: str, origin: str) -> int:
+        """Log that a source changed in the collection, so other workers can refresh it"""
+        with self._lock:
+            seq = self._conn.execute(
+                "INSERT INTO changes (source, action, origin, created_at) VALUES (?, ?, ?, ?)",
+                (source, action, origin, time.time())
+            ).lastrowid
+            # Workers that fall further behind than the log reaches reload everything
+            self._conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - self.change_log_size,))
+            self._conn.commit()
+        return seq
+
+    def latest_change(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(MAX(seq), 0) AS seq FROM changes").fetchone()
+        return row["seq"]
+
+    def changes_since(self, seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Changes after seq, and whether the log still reaches back that far"""
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(seq) AS seq FROM changes").fetchone()["seq"]
+            rows = self._conn.execute(
+                "SELECT seq, source, action, origin FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        complete = oldest is None or oldest <= seq + 1
+        return [dict(row) for row in rows], complete
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import metrics
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_name: str, dimension: int, lru_size: int = 1024):
+        """Content-addressed embedding cache backed by a memory-mapped float32 file"""
+        self.model_name = model_name
+        self.dimension = dimension
+        self.lru_size = lru_size
+        self.directory = os.path.join(directory, hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12])
+        os.makedirs(self.directory, exist_ok=True)
+
+        # vectors.f32 holds one row per entry; keys.txt holds the row's key on the matching line
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.txt")
+        # Worker processes sharing the directory append under this lock
+        self.lock_path = os.path.join(self.directory, "cache.lock")
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._rows = 0
+        self._keys_offset = 0
+        self._vectors: Optional[np.memmap] = None
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.lru_hits = 0
+        self.lru_misses = 0
+
+        with file_lock(self.lock_path):
+            self._load()
+
+    def _load(self):
+        """Load the key index and drop any partially written trailing rows"""
+        keys: List[str] = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="ascii") as f:
+                keys = [line.strip() for line in f if line.strip()]
+
+        row_bytes = self.dimension * 4
+        stored_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys), stored_rows)
+
+        if rows != len(keys) or rows != stored_rows:
+            logger.warning(f"Embedding cache at {self.directory} was truncated to {rows} consistent rows")
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+            with open(self.keys_path, "w", encoding="ascii") as f:
+                f.writelines(f"{key}\n" for key in keys[:rows])
+            keys = keys[:rows]
+
+        self._index = {key: row for row, key in enumerate(keys)}
+        self._rows = len(keys)
+        self._keys_offset = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+        logger.info(f"Loaded embedding cache with {len(self._index)} entries")
+
+    def key(self, text: str) -> str:
+        """Hash the model name and text into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _read_new_keys(self):
+        """Index rows other worker processes appended since the keys file was last read"""
+        size = os.path.getsize(self.keys_path) if os.path.exists(self.keys_path) else 0
+        if size <= self._keys_offset:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read(size - self._keys_offset)
+        # Only whole lines; a key is written after its row, so its row is complete
+        data = data[:data.rfind(b"\n") + 1]
+        for key in data.decode("ascii").splitlines():
+            self._index.setdefault(key, self._rows)
+            self._rows += 1
+        self._keys_offset += len(data)
+
+    def _mapped_vectors(self) -> np.memmap:
+        """Return a memory map covering every stored row"""
+        rows = self._rows
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                      shape=(rows, self.dimension))
+        return self._vectors
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up stored embeddings; missing entries are None"""
+        with self._lock:
+            self._read_new_keys()
+            keys = [self.key(text) for text in texts]
+            rows = [self._index.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            vectors = self._mapped_vectors() if found else None
+
+            results: List[Optional[np.ndarray]] = []
+            for row in rows:
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.array(vectors[row]))
+        metrics.EMBEDDING_CACHE_LOOKUPS.labels("documents", "hit").inc(len(found))
+        metrics.EMBEDDING_CACHE_LOOKUPS.labels("documents", "miss").inc(len(rows) - len(found))
+        return results
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """Append embeddings for texts that are not stored yet"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock, file_lock(self.lock_path):
+            self._read_new_keys()
+            new_keys: List[str] = []
+            new_rows: List[np.ndarray] = []
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                if key in self._index or key in new_keys:
+                    continue
+                new_keys.append(key)
+                new_rows.append(embedding)
+
+            if not new_keys:
+                return
+
+            # Vectors are written before keys so a crash never indexes a missing row
+            with open(self.vectors_path, "ab") as f:
+                # Drop rows a writer that crashed left without keys, so rows and key lines stay aligned
+                f.truncate(self._rows * self.dimension * 4)
+                f.write(np.stack(new_rows).tobytes())
+            with open(self.keys_path, "a", encoding="ascii") as f:
+                f.writelines(f"{key}\n" for key in new_keys)
+
+            for key in new_keys:
+                self._index[key] = self._rows
+                self._rows += 1
+            self._keys_offset = os.path.getsize(self.keys_path)
+
+    def get_query(self, text: str) -> Optional[List[float]]:
+        """Look up a query embedding in the in-memory LRU, falling back to disk"""
+        key = self.key(text)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.lru_hits += 1
+                metrics.EMBEDDING_CACHE_LOOKUPS.labels("queries", "hit").inc()
+                return self._lru[key].tolist()
+            self.lru_misses += 1
+            metrics.EMBEDDING_CACHE_LOOKUPS.labels("queries", "miss").inc()
+
+            # A query identical to a stored chunk can reuse its embedding
+            row = self._index.get(key)
+            stored = np.array(self._mapped_vectors()[row]) if row is not None else None
+
+        if stored is not None:
+            self.put_query(text, stored)
+            return stored.tolist()
+        return None
+
+    def put_query(self, text: str, embedding):
+        """Remember a query embedding in the in-memory LRU"""
+        key = self.key(text)
+        with self._lock:
+            self._lru[key] = np.asarray(embedding, dtype=np.float32)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache size and hit rates"""
+        lookups = self.hits + self.misses
+        lru_lookups = self.lru_hits + self.lru_misses
+        return {
+            "entries": len(self._index),
+            "size_bytes": len(self._index) * self.dimension * 4,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "query_lru_entries": len(self._lru),
+            "query_lru_hits": self.lru_hits,
+            "query_lru_misses": self.lru_misses,
+            "query_lru_hit_rate": self.lru_hits / lru_lookups if lru_lookups else 0.0
+        }
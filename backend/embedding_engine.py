@@ -0,0 +1,293 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("sentence-transformers", "onnx", "onnx-int8")
+
+# Exported models must reproduce SentenceTransformer's embeddings of these to within the tolerance
+VERIFICATION_TEXTS = [
+    "What is the maximum operating pressure of the pump?",
+    "Error E42 means the valve stayed closed longer than the configured timeout.",
+    "Reset",
+    "The controller logs every fault with a timestamp, the component involved and the corrective action "
+    "taken, so that service engineers can reconstruct the sequence of events after an outage and decide "
+    "whether the unit has to be replaced or can be recalibrated on site.",
+    "Section 4.2 describes the maintenance schedule: filters are replaced every 500 operating hours, seals "
+    "every 2000 hours and the motor bearings are inspected once a year.",
+    "How do I configure the timeout?",
+    "Part number 7731-B fits models built after 2019.",
+    "Bitte prüfen Sie die Dichtung vor dem Einbau.",
+]
+
+class SentenceTransformerEngine:
+    """Encodes with SentenceTransformer on torch, the original engine"""
+    name = "sentence-transformers"
+
+    def __init__(self, model_name_or_path: str, threads: int = 0, batch_size: int = 32):
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name_or_path)
+        self.threads = threads
+        self.batch_size = batch_size
+        self.cache_name = None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"engine": self.name, "threads": self.threads, "batch_size": self.batch_size}
+
+class OnnxEmbeddingEngine:
+    def __init__(self, onnx_dir: str, quantized: bool = False, threads: int = 0, inter_op_threads: int = 1,
+                 batch_size: int = 32, length_bucket: int = 16):
+        """Runs an exported model with ONNX Runtime; needs neither torch nor transformers at runtime"""
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.onnx_path = os.path.join(onnx_dir, f"model_{'int8' if quantized else 'fp32'}.onnx")
+        with open(os.path.join(onnx_dir, "pipeline.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(onnx_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_length"])
+        self.tokenizer.no_padding()
+        self.threads = threads
+        self.batch_size = batch_size
+        self.length_bucket = max(1, length_bucket)
+        self.cache_name = None
+        self.verification: Optional[Dict[str, float]] = None
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        # Counters
+        self.batches = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def _padded_length(self, length: int) -> int:
+        """Round up to the bucket size, so batches reuse a few tensor shapes"""
+        bucketed = -(-length // self.length_bucket) * self.length_bucket
+        return min(bucketed, self.config["max_length"])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in length-sorted batches, each padded only to its own longest text"""
+        dimension = self.config["dimension"]
+        if not texts:
+            return np.zeros((0, dimension), dtype=np.float32)
+        input_ids = [encoding.ids for encoding in self.tokenizer.encode_batch(list(texts))]
+        lengths = np.array([len(ids) for ids in input_ids])
+        order = np.argsort(-lengths, kind="stable")
+
+        embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            width = self._padded_length(int(lengths[batch].max()))
+            ids = np.full((len(batch), width), self.config["pad_token_id"], dtype=np.int64)
+            mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                ids[row, :lengths[i]] = input_ids[i]
+                mask[row, :lengths[i]] = 1
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feeds)[0]
+            embeddings[batch] = self._pool(hidden, mask)
+
+            self.batches += 1
+            self.tokens += int(mask.sum())
+            self.padded_tokens += ids.size
+
+        if self.config["normalize"]:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.config["pooling"] == "cls":
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "threads": self.threads,
+            "batch_size": self.batch_size,
+            "length_bucket": self.length_bucket,
+            "verification": self.verification,
+            "batches": self.batches,
+            # Share of the encoded positions that were padding
+            "padding_ratio": round(1 - self.tokens / self.padded_tokens, 3) if self.padded_tokens else 0.0
+        }
+
+def _read_pipeline_config(model_dir: str) -> Dict[str, Any]:
+    """Pooling, normalization and sequence length of a saved sentence-transformers model"""
+    config = {"pooling": "mean", "normalize": False, "max_length": 256}
+    path = os.path.join(model_dir, "sentence_bert_config.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            config["max_length"] = json.load(f).get("max_seq_length") or config["max_length"]
+    path = os.path.join(model_dir, "modules.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            modules = json.load(f)
+        for module in modules:
+            if module["type"].endswith("Normalize"):
+                config["normalize"] = True
+            elif module["type"].endswith("Pooling"):
+                with open(os.path.join(model_dir, module["path"], "config.json"), "r", encoding="utf-8") as f:
+                    pooling = json.load(f)
+                # Newer sentence-transformers store the mode by name, older ones as flags
+                mode = pooling.get("pooling_mode") or ("cls" if pooling.get("pooling_mode_cls_token") else "mean")
+                if mode not in ("mean", "cls"):
+                    raise ValueError(f"Unsupported pooling mode for ONNX export: {mode}")
+                config["pooling"] = mode
+    return config
+
+def export_onnx(model_dir: str, onnx_dir: str, quantize: bool = False) -> str:
+    """Export a saved sentence-transformers model's transformer to ONNX, optionally int8-quantized"""
+    os.makedirs(onnx_dir, exist_ok=True)
+    fp32_path = os.path.join(onnx_dir, "model_fp32.onnx")
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        if not tokenizer.is_fast:
+            raise ValueError(f"ONNX export needs a fast tokenizer (tokenizer.json) for {model_dir}")
+        model = AutoModel.from_pretrained(model_dir)
+        model.eval()
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+
+        class HiddenStates(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+        kwargs = {}
+        # Newer torch defaults to the dynamo exporter; the TorchScript one handles these models everywhere
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            kwargs["dynamo"] = False
+        with torch.no_grad():
+            torch.onnx.export(
+                HiddenStates(model), tuple(sample[name] for name in names), fp32_path,
+                input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes,
+                opset_version=14, **kwargs
+            )
+        config = _read_pipeline_config(model_dir)
+        config["dimension"] = model.config.hidden_size
+        config["pad_token_id"] = tokenizer.pad_token_id or 0
+        with open(os.path.join(onnx_dir, "pipeline.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        tokenizer.save_pretrained(onnx_dir)
+
+    if not quantize:
+        return fp32_path
+    int8_path = os.path.join(onnx_dir, "model_int8.onnx")
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+def compare_embeddings(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Cosine similarity between two engines' embeddings of the same texts"""
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = (reference * candidate).sum(axis=1)
+    return {"min_cosine": round(float(cosine.min()), 6), "mean_cosine": round(float(cosine.mean()), 6)}
+
+def load_onnx_engine(model_dir: str, onnx_dir: str, quantize: bool = False, min_cosine: float = 0.98,
+                     **options) -> OnnxEmbeddingEngine:
+    """Export on first use, check the export against SentenceTransformer, and load it"""
+    # Worker processes starting together export once; the others wait and load the result
+    with file_lock(os.path.join(onnx_dir, "export.lock")):
+        export_onnx(model_dir, onnx_dir, quantize)
+        engine = OnnxEmbeddingEngine(onnx_dir, quantized=quantize, **options)
+
+        verification_path = engine.onnx_path[:-len(".onnx")] + ".verification.json"
+        if os.path.exists(verification_path):
+            with open(verification_path, "r", encoding="utf-8") as f:
+                engine.verification = json.load(f)
+        else:
+            reference = SentenceTransformerEngine(model_dir).encode(VERIFICATION_TEXTS)
+            engine.verification = compare_embeddings(reference, engine.encode(VERIFICATION_TEXTS))
+            with open(verification_path, "w", encoding="utf-8") as f:
+                json.dump(engine.verification, f)
+    if engine.verification["min_cosine"] < min_cosine:
+        raise ValueError(
+            f"{engine.name} embeddings differ from SentenceTransformer's: cosine "
+            f"{engine.verification['min_cosine']} < {min_cosine}"
+        )
+    logger.info(f"Loaded {engine.name} embedding engine (cosine to SentenceTransformer >= "
+                f"{engine.verification['min_cosine']})")
+    return engine
+
+def create_embedding_engine(model_name: str, model_path: Optional[str] = None):
+    """Build the engine selected by EMBEDDING_ENGINE; ONNX engines fall back to SentenceTransformer on failure"""
+    engine_name = os.getenv("EMBEDDING_ENGINE", "sentence-transformers").lower()
+    if engine_name not in ENGINES:
+        raise ValueError(f"Unknown EMBEDDING_ENGINE: {engine_name}")
+    threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+    batch_size = int(os.getenv("EMBEDDING_ENGINE_BATCH_SIZE", "32"))
+    source = model_path if model_path and os.path.isdir(model_path) else model_name
+
+    if engine_name != "sentence-transformers":
+        start_time = time.perf_counter()
+        try:
+            onnx_dir = os.path.join(
+                os.getenv("EMBEDDING_ONNX_DIRECTORY", "./onnx_models"),
+                hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+            )
+            model_dir = source
+            if not os.path.isdir(model_dir):
+                # Export needs the model on disk
+                model_dir = os.path.join(onnx_dir, "source")
+                if not os.path.isdir(model_dir):
+                    SentenceTransformerEngine(model_name).model.save(model_dir)
+            engine = load_onnx_engine(
+                model_dir,
+                onnx_dir,
+                quantize=engine_name == "onnx-int8",
+                min_cosine=float(os.getenv("EMBEDDING_MIN_COSINE", "0.98")),
+                threads=threads,
+                inter_op_threads=int(os.getenv("EMBEDDING_INTER_OP_THREADS", "1")),
+                batch_size=batch_size,
+                length_bucket=int(os.getenv("EMBEDDING_LENGTH_BUCKET", "16"))
+            )
+            # Vectors of another engine are only close, so they are cached separately
+            engine.cache_name = f"{model_name}:{engine.name}"
+            logger.info(f"Embedding engine ready in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+            return engine
+        except Exception as e:
+            logger.error(f"Failed to load {engine_name} embedding engine, using sentence-transformers: {e}")
+
+    engine = SentenceTransformerEngine(source, threads=threads, batch_size=batch_size)
+    engine.cache_name = model_name
+    return engine
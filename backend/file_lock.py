@@ -0,0 +1,22 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows); files are then only safe with a single worker process
+    fcntl = None
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on path, shared with other processes, for the duration of the block"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,418 @@
+import asyncio
+import functools
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = [
+    "id", "filename", "path", "status", "stage", "pages_total", "pages_done",
+    "chunks_embedded", "error", "created_at", "started_at", "finished_at"
+]
+
+# Progress is reset when a job goes back to the queue
+REQUEUE_FIELDS = "status = 'queued', stage = 'queued', owner = NULL, pages_done = 0, chunks_embedded = 0"
+
+# Jobs in these states are finished and will not be picked up again
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+# Fields a running job's progress reports change
+PROGRESS_FIELDS = ["stage", "pages_total", "pages_done", "chunks_embedded"]
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs"""
+
+class IngestionJobStore:
+    def __init__(self, db_path: str):
+        """Persist ingestion jobs in a local SQLite database that worker processes claim jobs from"""
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                pages_total INTEGER NOT NULL DEFAULT 0,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Databases created before jobs were shared between worker processes
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in [("owner", "TEXT"), ("heartbeat_at", "REAL"),
+                                   ("cancel_requested", "INTEGER NOT NULL DEFAULT 0")]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def insert(self, job: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' for _ in JOB_FIELDS)})",
+                [job.get(field) for field in JOB_FIELDS]
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            assignments = ", ".join(f"{field} = ?" for field in fields)
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running for owner and return it
+
+        Jobs for a file that another job is still ingesting wait, in any process,
+        so two versions of one document are never diffed against the same chunks.
+        """
+        now = time.time()
+        with self._lock:
+            # Take the write lock up front so two processes cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND filename NOT IN "
+                    "(SELECT filename FROM jobs WHERE status = 'running') ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._conn.rollback()
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'extracting', owner = ?, heartbeat_at = ?, "
+                    "started_at = ? WHERE id = ?",
+                    (owner, now, now, row["id"])
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return dict(job)
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> List[str]:
+        """Extend the lease on running jobs; returns those another process asked to cancel"""
+        if not job_ids:
+            return []
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND id IN ({placeholders})",
+                [time.time(), owner, *job_ids]
+            )
+            self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({placeholders})", job_ids
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def requeue_expired(self, lease_seconds: float) -> int:
+        """Requeue running jobs whose worker stopped sending heartbeats"""
+        with self._lock:
+            count = self._conn.execute(
+                f"UPDATE jobs SET {REQUEUE_FIELDS} WHERE status = 'running' AND heartbeat_at < ?",
+                (time.time() - lease_seconds,)
+            ).rowcount
+            self._conn.commit()
+        return count
+
+    def release(self, owner: str, previous_run: bool = False) -> int:
+        """Requeue the running jobs of a worker that is stopping or, at startup, of its previous run"""
+        query = f"UPDATE jobs SET {REQUEUE_FIELDS} WHERE status = 'running' AND "
+        query += "(owner = ? OR owner IS NULL)" if previous_run else "owner = ?"
+        with self._lock:
+            count = self._conn.execute(query, (owner,)).rowcount
+            self._conn.commit()
+        return count
+
+    def cancel_queued(self, job_id: str) -> bool:
+        """Cancel a job no worker has claimed yet"""
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', stage = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+            self._conn.commit()
+        return count > 0
+
+    def request_cancel(self, job_id: str):
+        """Ask the worker running a job to cancel it"""
+        self.update(job_id, cancel_requested=1, stage="cancelling")
+
+    def count_queued(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class IngestionJobQueue:
+    def __init__(self, document_processor, directory: str, max_concurrent_jobs: int = 2,
+                 max_queued_jobs: int = 32, poll_interval: float = 1.0, lease_seconds: float = 30.0):
+        """Run document ingestion in the background with a bounded worker pool"""
+        self.document_processor = document_processor
+        self.directory = directory
+        self.upload_directory = os.path.join(directory, "uploads")
+        os.makedirs(self.upload_directory, exist_ok=True)
+
+        # The queue lives in the job store, so with several worker processes any of
+        # them can run a job submitted to another
+        self.store = IngestionJobStore(os.path.join(directory, "jobs.db"))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested = set()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # Jobs with progress not yet written to the store, and the task writing it
+        self._dirty_progress = set()
+        self._progress_writers: Dict[str, asyncio.Task] = {}
+
+    def spool_path(self, job_id: str) -> str:
+        """Where the upload for a job is kept until the job finishes"""
+        return os.path.join(self.upload_directory, f"{job_id}.pdf")
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    async def _store(self, func, *args, **kwargs):
+        """Run a job store call off the event loop; another process holding the database lock only stalls this call"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def is_full(self) -> bool:
+        return await self.queue_depth() >= self.max_queued_jobs
+
+    async def queue_depth(self) -> int:
+        return await self._store(self.store.count_queued)
+
+    async def start(self):
+        """Requeue jobs interrupted by a restart and start the workers"""
+        requeued = await self._store(self.store.release, self.owner, previous_run=True)
+        if requeued:
+            logger.info(f"Requeued {requeued} ingestion jobs interrupted by a restart")
+
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_concurrent_jobs)
+        ]
+        self._workers.append(asyncio.create_task(self._monitor()))
+
+    async def stop(self):
+        """Stop the workers and hand their unfinished jobs back to the queue"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await asyncio.gather(*self._progress_writers.values(), return_exceptions=True)
+        await self._store(self.store.release, self.owner)
+        await self._store(self.store.close)
+
+    async def submit(self, job_id: str, path: str, filename: str) -> Dict[str, Any]:
+        """Queue a spooled upload for ingestion"""
+        if await self.is_full():
+            raise QueueFullError("Ingestion queue is full")
+
+        job = {
+            "id": job_id,
+            "filename": filename,
+            "path": path,
+            "status": "queued",
+            "stage": "queued",
+            "pages_total": 0,
+            "pages_done": 0,
+            "chunks_embedded": 0,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+        await self._store(self.store.insert, job)
+        self._wakeup.set()
+        logger.info(f"Queued ingestion job {job_id} for {filename}")
+        return self.describe(job)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job"""
+        job = self._jobs.get(job_id) or await self._store(self.store.get, job_id)
+        if not job:
+            return None
+        if job["status"] in TERMINAL_STATUSES:
+            return self.describe(job)
+
+        task = self._running.get(job_id)
+        if task:
+            self._cancel_requested.add(job_id)
+            job["stage"] = "cancelling"
+            task.cancel()
+        elif await self._store(self.store.cancel_queued, job_id):
+            await self._finish(job, "cancelled")
+        else:
+            # Running in another worker process, which picks this up on its next heartbeat
+            await self._store(self.store.request_cancel, job_id)
+            job = await self._store(self.store.get, job_id)
+        return self.describe(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the current state of a job"""
+        job = self._jobs.get(job_id) or await self._store(self.store.get, job_id)
+        return self.describe(job) if job else None
+
+    async def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """List recent jobs, newest first"""
+        jobs = await self._store(self.store.list, limit)
+        return [self.describe(self._jobs.get(job["id"], job)) for job in jobs]
+
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a job with throughput figures"""
+        end = job["finished_at"] or time.time()
+        elapsed = end - job["started_at"] if job["started_at"] else 0.0
+        return {
+            "job_id": job["id"],
+            "filename": job["filename"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "pages_total": job["pages_total"],
+            "pages_done": job["pages_done"],
+            "chunks_embedded": job["chunks_embedded"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "elapsed_seconds": round(elapsed, 3),
+            "pages_per_second": round(job["pages_done"] / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(job["chunks_embedded"] / elapsed, 2) if elapsed else 0.0
+        }
+
+    async def _finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None):
+        job.update(status=status, stage=status, error=error, finished_at=time.time())
+        # A progress write still in flight must not land after the final state
+        self._dirty_progress.discard(job["id"])
+        writer = self._progress_writers.get(job["id"])
+        if writer:
+            await asyncio.gather(writer, return_exceptions=True)
+        await self._store(self.store.update, job["id"], status=status, stage=status, error=error,
+                          pages_done=job["pages_done"], chunks_embedded=job["chunks_embedded"],
+                          finished_at=job["finished_at"])
+        if os.path.exists(job["path"]):
+            os.remove(job["path"])
+        # Finished jobs are served from the store from now on
+        self._jobs.pop(job["id"], None)
+        # A job for the same file may have been waiting for this one
+        self._wakeup.set()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            try:
+                # Cleared before claiming so a submit in between is not missed
+                self._wakeup.clear()
+                job = await self._store(self.store.claim, self.owner)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if not os.path.exists(job["path"]):
+                    await self._finish(job, "failed", "Upload was lost before processing")
+                    continue
+                await self._run(job)
+            except Exception as e:
+                # The worker stays in the pool; a job it could not finish is requeued once its lease expires
+                logger.error(f"Error in ingestion worker {worker_id}: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _monitor(self):
+        """Renew the leases on running jobs, apply cancels from other processes and requeue abandoned jobs"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                for job_id in await self._store(self.store.heartbeat, self.owner, list(self._running)):
+                    task = self._running.get(job_id)
+                    if task and job_id not in self._cancel_requested:
+                        self._cancel_requested.add(job_id)
+                        task.cancel()
+                requeued = await self._store(self.store.requeue_expired, self.lease_seconds)
+                if requeued:
+                    logger.info(f"Requeued {requeued} ingestion jobs whose worker stopped responding")
+                    self._wakeup.set()
+            except Exception as e:
+                logger.error(f"Error renewing ingestion job leases: {e}")
+
+    async def _run(self, job: Dict[str, Any]):
+        self._jobs[job["id"]] = job
+
+        def on_progress(progress: Dict[str, Any]):
+            # Reports arrive on the event loop; they are written to the store in the background,
+            # and reports made while a write is in flight are coalesced into the next one
+            job.update(progress)
+            self._dirty_progress.add(job["id"])
+            if job["id"] not in self._progress_writers:
+                self._progress_writers[job["id"]] = asyncio.create_task(self._write_progress(job))
+
+        task = asyncio.create_task(
+            self.document_processor.process_file(job["path"], job["filename"], progress=on_progress)
+        )
+        self._running[job["id"]] = task
+        try:
+            await task
+            await self._finish(job, "completed")
+            logger.info(f"Ingestion job {job['id']} completed")
+        except asyncio.CancelledError:
+            if job["id"] not in self._cancel_requested:
+                # The worker itself is shutting down; stop hands the job back to the queue
+                self._jobs.pop(job["id"], None)
+                task.cancel()
+                raise
+            await self._finish(job, "cancelled")
+            logger.info(f"Ingestion job {job['id']} cancelled")
+        except Exception as e:
+            await self._finish(job, "failed", str(e))
+            logger.error(f"Ingestion job {job['id']} failed: {e}")
+        finally:
+            self._running.pop(job["id"], None)
+            self._cancel_requested.discard(job["id"])
+
+    async def _write_progress(self, job: Dict[str, Any]):
+        try:
+            while job["id"] in self._dirty_progress:
+                self._dirty_progress.discard(job["id"])
+                await self._store(self.store.update, job["id"], **{field: job[field] for field in PROGRESS_FIELDS})
+        except Exception as e:
+            logger.error(f"Error saving progress of ingestion job {job['id']}: {e}")
+        finally:
+            self._progress_writers.pop(job["id"], None)
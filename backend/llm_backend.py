@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+# Failures worth another attempt; anything else (bad request, auth) is returned straight away
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+MOCK_WORDS = "the pump controller reports a fault when the valve stays closed longer than the configured timeout".split()
+
+def mock_tokens(count: int) -> List[str]:
+    """Deterministic filler tokens used by the mock backend and mock server"""
+    return [MOCK_WORDS[i % len(MOCK_WORDS)] + " " for i in range(count)]
+
+class LLMBackend:
+    """Chat completion backend used by the RAG pipeline"""
+    name = "base"
+
+    def __init__(self, model: str, max_tokens: int = 1000, temperature: float = 0.7):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+        # Counters
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.active = 0
+
+    async def complete(self, messages: Messages) -> str:
+        """Return the full completion for a conversation"""
+        raise NotImplementedError
+
+    def stream(self, messages: Messages) -> AsyncGenerator[str, None]:
+        """Yield completion text as it is generated; closing the generator aborts the request"""
+        raise NotImplementedError
+
+    async def close(self):
+        """Release connections held by the backend"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "model": self.model,
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "active": self.active
+        }
+
+class OpenAICompatibleBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None,
+                 max_connections: int = 20, timeout: float = 60.0, connect_timeout: float = 5.0,
+                 max_retries: int = 2, retry_backoff: float = 0.5, **kwargs):
+        """Any OpenAI-compatible HTTP endpoint, over a pooled keep-alive connection pool"""
+        super().__init__(model, **kwargs)
+        self.base_url = base_url
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        # Retries are done here so they can be counted and never happen mid-stream
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0
+        )
+
+    async def _create(self, messages: Messages, stream: bool):
+        """Start a completion, retrying connection failures, rate limits and server errors"""
+        attempt = 0
+        while True:
+            try:
+                return await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=stream
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"LLM request failed ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Exponential backoff with jitter, or the server's Retry-After when it sends one"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return self.retry_backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    async def complete(self, messages: Messages) -> str:
+        self.requests += 1
+        self.active += 1
+        try:
+            response = await self._create(messages, stream=False)
+            return response.choices[0].message.content.strip()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active -= 1
+
+    async def stream(self, messages: Messages) -> AsyncGenerator[str, None]:
+        self.requests += 1
+        self.active += 1
+        try:
+            response = await self._create(messages, stream=True)
+            try:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Releases the connection, aborting the completion if it is still running
+                await response.response.aclose()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active -= 1
+
+    async def close(self):
+        await self.client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**super().get_stats(), "base_url": self.base_url or "https://api.openai.com/v1"}
+
+class MockBackend(LLMBackend):
+    name = "mock"
+
+    def __init__(self, model: str = "mock", ttft_ms: float = 200.0, itl_ms: float = 20.0,
+                 tokens: int = 64, **kwargs):
+        """In-process backend that emits filler tokens with fixed latency, for load tests without a server"""
+        super().__init__(model, **kwargs)
+        self.ttft_ms = ttft_ms
+        self.itl_ms = itl_ms
+        self.tokens = tokens
+
+    async def complete(self, messages: Messages) -> str:
+        self.requests += 1
+        self.active += 1
+        try:
+            tokens = mock_tokens(min(self.tokens, self.max_tokens))
+            await asyncio.sleep((self.ttft_ms + self.itl_ms * (len(tokens) - 1)) / 1000)
+            return "".join(tokens).strip()
+        finally:
+            self.active -= 1
+
+    async def stream(self, messages: Messages) -> AsyncGenerator[str, None]:
+        self.requests += 1
+        self.active += 1
+        try:
+            await asyncio.sleep(self.ttft_ms / 1000)
+            for i, token in enumerate(mock_tokens(min(self.tokens, self.max_tokens))):
+                if i:
+                    await asyncio.sleep(self.itl_ms / 1000)
+                yield token
+        finally:
+            self.active -= 1
+
+def create_llm_backend() -> Optional[LLMBackend]:
+    """Build the backend selected by LLM_BACKEND, or None when it is not configured"""
+    backend = os.getenv("LLM_BACKEND", "openai").lower()
+    options = {
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS", "1000")),
+        "temperature": float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    }
+
+    if backend == "mock":
+        return MockBackend(
+            ttft_ms=float(os.getenv("MOCK_LLM_TTFT_MS", "200")),
+            itl_ms=float(os.getenv("MOCK_LLM_ITL_MS", "20")),
+            tokens=int(os.getenv("MOCK_LLM_TOKENS", "64")),
+            **options
+        )
+    if backend != "openai":
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key == "your_openai_api_key_here":
+        api_key = None
+    base_url = os.getenv("OPENAI_BASE_URL") or None
+    if not api_key:
+        if not base_url:
+            logger.warning("OPENAI_API_KEY not properly set. RAG functionality will be limited.")
+            return None
+        # Local OpenAI-compatible servers usually ignore the key, but the client requires one
+        api_key = "not-needed"
+
+    return OpenAICompatibleBackend(
+        api_key=api_key,
+        model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+        base_url=base_url,
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+        timeout=float(os.getenv("OPENAI_TIMEOUT", "60")),
+        connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        **options
+    )
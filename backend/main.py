@@ -1,16 +1,25 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from startup import StartupState
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 import os
 from dotenv import load_dotenv
-import json
 import asyncio
-from typing import List, Optional
+import shutil
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
 import logging
 
 from rag_pipeline import RAGPipeline
 from document_processor import DocumentProcessor
+from ingestion_jobs import IngestionJobQueue, QueueFullError
+from scoped_search import RetrievalFilter
+from reranking import RetrievalOptions
+from sse import EventSourceResponse, NDJSONResponse, ndjson_stream, sse_stream
+from admission import AdmissionRejected, create_admission_controller
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +28,10 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Heavy libraries (torch, chromadb, langchain) are imported when the pipeline is built, not here
+startup_state = StartupState(os.getenv("STARTUP_MODE", "background"))
+startup_state.mark("import")
+
 app = FastAPI(
     title="LLM Agent with Dynamic Knowledge Base",
     description="A RAG-powered LLM agent that can answer questions and learn from uploaded documents",
@@ -34,35 +47,148 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Chat and upload requests pass per-client rate limits and bounded concurrency pools;
+# uploads are ingested at lower priority than questions
+admission = create_admission_controller()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Initialize RAG pipeline and document processor
 rag_pipeline = None
 document_processor = None
+ingestion_queue = None
+startup_task = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize the RAG pipeline and document processor on startup"""
-    global rag_pipeline, document_processor
+async def initialize_services():
+    """Build the RAG pipeline, document processor and ingestion queue"""
+    global rag_pipeline, document_processor, ingestion_queue
     try:
-        rag_pipeline = RAGPipeline()
-        document_processor = DocumentProcessor()
-        await document_processor.initialize_rag_pipeline(rag_pipeline)
+        # Loading the model and opening Chroma block, so they run off the event loop
+        loop = asyncio.get_running_loop()
+        pipeline = await loop.run_in_executor(None, RAGPipeline)
+        pipeline.ingest_pool = admission.ingest
+        processor = DocumentProcessor()
+        await processor.initialize_rag_pipeline(pipeline)
+        
+        # Uploads are ingested in the background by a bounded worker pool
+        queue = IngestionJobQueue(
+            processor,
+            os.getenv("INGESTION_JOBS_DIRECTORY", "./ingestion_jobs"),
+            max_concurrent_jobs=int(os.getenv("INGESTION_MAX_CONCURRENT_JOBS", "2")),
+            max_queued_jobs=int(os.getenv("INGESTION_MAX_QUEUED_JOBS", "32")),
+            poll_interval=float(os.getenv("INGESTION_POLL_SECONDS", "1")),
+            lease_seconds=float(os.getenv("INGESTION_JOB_LEASE_SECONDS", "30"))
+        )
+        await queue.start()
+        # Other worker processes' uploads and deletes are applied as they happen
+        pipeline.start_sync()
+        rag_pipeline, document_processor, ingestion_queue = pipeline, processor, queue
+        startup_state.set_ready(pipeline.startup_timings)
         logger.info("RAG pipeline and document processor initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize RAG pipeline: {e}")
-        raise
+        startup_state.set_failed(e)
+        if startup_state.mode == "eager":
+            raise
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize the RAG pipeline and document processor on startup
+
+    In background mode the server accepts requests (and reports liveness) at
+    once while the pipeline loads; requests that need it get 503 until ready.
+    """
+    global startup_task
+    if startup_state.mode == "eager":
+        await initialize_services()
+    else:
+        startup_task = asyncio.create_task(initialize_services())
+
+def ensure_ready():
+    """Reject requests that need the pipeline until startup has finished"""
+    if startup_state.ready:
+        return
+    if startup_state.phase == "failed":
+        raise HTTPException(status_code=500, detail=f"RAG pipeline not initialized: {startup_state.error}")
+    raise HTTPException(status_code=503, detail="Service is starting", headers={"Retry-After": "5"})
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pipeline resources on shutdown"""
+    if startup_task and not startup_task.done():
+        startup_task.cancel()
+    if ingestion_queue:
+        await ingestion_queue.stop()
+    if document_processor:
+        document_processor.shutdown()
+    if rag_pipeline:
+        await rag_pipeline.close()
+    metrics.shutdown()
 
 # Pydantic models
-class ChatMessage(BaseModel):
+class ChatFilters(BaseModel):
+    sources: Optional[List[str]] = None
+    doc_types: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+    def to_retrieval_filter(self) -> RetrievalFilter:
+        return RetrievalFilter(
+            sources=self.sources,
+            doc_types=[doc_type.lower().lstrip(".") for doc_type in self.doc_types] if self.doc_types is not None else None,
+            uploaded_after=self.uploaded_after.timestamp() if self.uploaded_after else None,
+            uploaded_before=self.uploaded_before.timestamp() if self.uploaded_before else None
+        )
+
+class ChatRetrieval(BaseModel):
+    mode: Optional[Literal["similarity", "mmr"]] = None
+    rerank: Optional[bool] = None
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    candidates: Optional[int] = Field(None, ge=1, le=200)
+
+    def to_retrieval_options(self, defaults: RetrievalOptions) -> RetrievalOptions:
+        """Fill unset fields from the server defaults"""
+        return replace(defaults, **self.model_dump(exclude_none=True))
+
+class ChatScope(BaseModel):
+    filters: Optional[ChatFilters] = None
+    retrieval: Optional[ChatRetrieval] = None
+
+    def retrieval_filter(self) -> Optional[RetrievalFilter]:
+        return self.filters.to_retrieval_filter() if self.filters else None
+
+    def retrieval_options(self) -> Optional[RetrievalOptions]:
+        if not self.retrieval:
+            return None
+        return self.retrieval.to_retrieval_options(rag_pipeline.retrieval_options)
+
+class ChatMessage(ChatScope):
     message: str
+    # Turns sharing a session_id are one conversation; a new id starts one
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128, pattern=r"^[A-Za-z0-9_.:-]+$")
+
+class ChatBatchRequest(ChatScope):
+    questions: List[str] = Field(..., min_length=1, max_length=int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "1000")))
+    # LLM calls in flight for this batch; defaults to QUERY_BATCH_CONCURRENCY
+    concurrency: Optional[int] = Field(None, ge=1, le=64)
 
 class ChatResponse(BaseModel):
     response: str
     sources: List[str]
+    # Per-turn report for session chats: retrieval skipped, history and prompt tokens
+    session: Optional[Dict[str, Any]] = None
 
 class UploadResponse(BaseModel):
     status: str
     filename: str
     message: str
+    job_id: Optional[str] = None
 
 @app.get("/")
 async def root():
@@ -71,85 +197,266 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
+    """Detailed health check; the process is live as long as it answers, ready once the pipeline is loaded"""
     return {
-        "status": "healthy",
+        "status": "unhealthy" if startup_state.phase == "failed" else "healthy",
+        "live": True,
+        "ready": startup_state.ready,
         "rag_pipeline": rag_pipeline is not None,
-        "document_processor": document_processor is not None
+        "document_processor": document_processor is not None,
+        "startup": startup_state.to_dict(),
+        "admission": admission.get_stats()
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the server is up and answering"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the pipeline is loaded and warmed up"""
+    if not startup_state.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": startup_state.phase, "error": startup_state.error},
+            headers={"Retry-After": "5"}
+        )
+    return {"status": "ready", "timings": startup_state.timings}
+
+def trace_requested(x_trace: Optional[str]) -> bool:
+    """Per-request stage tracing, asked for with an X-Trace header or enabled for every request"""
+    if x_trace is not None:
+        return x_trace.lower() in ("1", "true")
+    return os.getenv("TRACE_REQUESTS", "false").lower() == "true"
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: stage latency histograms, chunk, token and error counters, queue and collection gauges"""
+    queue_depth = collection_chunks = documents = None
+    if startup_state.ready:
+        loop = asyncio.get_running_loop()
+        queue_depth = await ingestion_queue.queue_depth()
+        collection_chunks = await loop.run_in_executor(None, rag_pipeline.collection.count)
+        documents = (await loop.run_in_executor(None, document_processor.get_processing_stats))["total_documents"]
+    body, content_type = metrics.render(queue_depth, collection_chunks, documents)
+    return Response(content=body, media_type=content_type)
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, request: Request, response: Response, x_trace: Optional[str] = Header(None)):
     """Chat with the RAG agent"""
-    if not rag_pipeline:
-        raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
+    ensure_ready()
+    admission.chat_limiter.check(admission.client_key(request))
     
-    try:
-        response, sources = await rag_pipeline.query(message.message)
-        return ChatResponse(response=response, sources=sources)
-    except Exception as e:
-        logger.error(f"Error in chat endpoint: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
+    async with admission.query.slot():
+        try:
+            trace = {} if trace_requested(x_trace) else None
+            turn = {} if message.session_id else None
+            answer, sources = await rag_pipeline.query(
+                message.message, filters=message.retrieval_filter(), options=message.retrieval_options(), trace=trace,
+                session_id=message.session_id, turn=turn
+            )
+            if trace is not None:
+                response.headers["Server-Timing"] = metrics.server_timing(trace)
+                logger.info(f"Trace /chat: {metrics.server_timing(trace)}")
+            return ChatResponse(response=answer, sources=sources, session=turn)
+        except Exception as e:
+            logger.error(f"Error in chat endpoint: {e}")
+            raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
 @app.post("/chat/stream")
-async def chat_stream(message: ChatMessage):
-    """Stream chat response from the RAG agent"""
-    if not rag_pipeline:
-        raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
+async def chat_stream(message: ChatMessage, request: Request, x_trace: Optional[str] = Header(None)):
+    """Stream chat response from the RAG agent as Server-Sent Events"""
+    ensure_ready()
+    admission.chat_limiter.check(admission.client_key(request))
+    admission.query.check()
     
-    async def generate():
-        try:
-            async for chunk in rag_pipeline.query_stream(message.message):
-                yield f"data: {json.dumps(chunk)}\n\n"
-        except Exception as e:
-            logger.error(f"Error in streaming chat: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    # Traced streams report their stage durations in the done event
+    trace = {} if trace_requested(x_trace) else None
+    # A client disconnect closes the pipeline stream and with it the upstream completion request
+    return EventSourceResponse(
+        sse_stream(
+            admission.query.guard(rag_pipeline.query_stream(
+                message.message, filters=message.retrieval_filter(), options=message.retrieval_options(),
+                trace=trace, session_id=message.session_id
+            )),
+            heartbeat_interval=float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        )
+    )
+
+@app.post("/chat/batch")
+async def chat_batch(request: ChatBatchRequest, http_request: Request):
+    """Answer many questions, streaming each answer as a line of NDJSON as soon as it is ready"""
+    ensure_ready()
+    admission.chat_limiter.check(admission.client_key(http_request))
+    admission.batch.check()
     
-    return StreamingResponse(
-        generate(),
-        media_type="text/plain",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+    # Lines arrive in completion order; each answer carries the index of its question.
+    # Batches run in their own small pool and wait while interactive chats are queued
+    return NDJSONResponse(
+        ndjson_stream(
+            admission.batch.guard(rag_pipeline.query_batch(
+                request.questions, filters=request.retrieval_filter(), options=request.retrieval_options(),
+                concurrency=request.concurrency
+            ))
+        )
     )
 
-@app.post("/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a new document to add to the knowledge base"""
-    if not document_processor:
-        raise HTTPException(status_code=500, detail="Document processor not initialized")
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """A conversation's turn totals and the history its next prompt starts from"""
+    ensure_ready()
+    
+    session = await rag_pipeline.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return {
+        **session.summary(),
+        "history": [
+            {"question": turn.question, "answer": turn.answer, "retrieval_skipped": turn.retrieval_skipped,
+             "prompt_tokens": turn.prompt_tokens, "created_at": turn.created_at}
+            for turn in session.turns
+        ]
+    }
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a conversation and drop its history"""
+    ensure_ready()
+    
+    if not await rag_pipeline.delete_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return {"status": "deleted", "session_id": session_id}
+
+async def queue_upload(file: UploadFile, filename: str, request: Request) -> UploadResponse:
+    """Spool an uploaded PDF to disk and queue it for ingestion under filename"""
+    ensure_ready()
+    admission.upload_limiter.check(admission.client_key(request))
+    
+    # Validate file type
+    if not filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    
+    # Reject early instead of spooling an upload the queue cannot take
+    if await ingestion_queue.is_full():
+        metrics.ADMISSION_REJECTIONS.labels("upload", "queue_full").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Ingestion queue is full, please retry later",
+            headers={"Retry-After": "30"}
+        )
     
     try:
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are supported")
-        
-        # Read file content
-        content = await file.read()
+        # Spool the upload to disk instead of reading it into memory
+        job_id = ingestion_queue.new_job_id()
+        spool_path = ingestion_queue.spool_path(job_id)
+        with open(spool_path, "wb") as spool_file:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, spool_file, 1024 * 1024)
         
-        # Process the document
-        result = await document_processor.process_document(content, file.filename)
+        try:
+            await ingestion_queue.submit(job_id, spool_path, filename)
+        except QueueFullError:
+            os.remove(spool_path)
+            metrics.ADMISSION_REJECTIONS.labels("upload", "queue_full").inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Ingestion queue is full, please retry later",
+                headers={"Retry-After": "30"}
+            )
         
         return UploadResponse(
-            status="success",
-            filename=file.filename,
-            message=f"Document '{file.filename}' has been successfully added to the knowledge base"
+            status="queued",
+            filename=filename,
+            message=f"Document '{filename}' has been queued for processing",
+            job_id=job_id
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+@app.post("/upload", response_model=UploadResponse, status_code=202)
+async def upload_document(request: Request, file: UploadFile = File(...)):
+    """Queue a new document for ingestion into the knowledge base"""
+    return await queue_upload(file, file.filename, request)
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """List recent ingestion jobs"""
+    ensure_ready()
+    
+    return {"jobs": await ingestion_queue.list(limit), "queue_depth": await ingestion_queue.queue_depth()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the progress of an ingestion job"""
+    ensure_ready()
+    
+    job = await ingestion_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running ingestion job"""
+    ensure_ready()
+    
+    job = await ingestion_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/documents")
-async def list_documents():
-    """List all documents in the knowledge base"""
-    if not document_processor:
-        raise HTTPException(status_code=500, detail="Document processor not initialized")
+async def list_documents(limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0)):
+    """List documents in the knowledge base in upload order, optionally a page at a time"""
+    ensure_ready()
     
     try:
-        documents = await document_processor.list_documents()
-        return {"documents": documents}
+        documents = await document_processor.list_documents(limit, offset)
+        stats = await asyncio.get_running_loop().run_in_executor(None, document_processor.get_processing_stats)
+        return {"documents": documents, "total": stats["total_documents"], "limit": limit, "offset": offset}
     except Exception as e:
         logger.error(f"Error listing documents: {e}")
         raise HTTPException(status_code=500, detail=f"Error listing documents: {str(e)}")
 
+@app.get("/documents/stats")
+async def document_stats():
+    """Totals and averages over every document in the knowledge base"""
+    ensure_ready()
+    return await asyncio.get_running_loop().run_in_executor(None, document_processor.get_processing_stats)
+
+@app.get("/documents/{filename}")
+async def get_document(filename: str):
+    """Registry entry of one document: hash, size, pages, chunks and ingest time"""
+    ensure_ready()
+    
+    document = await document_processor.get_document_info(filename)
+    if "error" in document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+@app.put("/documents/{filename}", response_model=UploadResponse, status_code=202)
+async def replace_document(filename: str, request: Request, file: UploadFile = File(...)):
+    """Queue a new version of a document; only changed chunks are re-embedded"""
+    return await queue_upload(file, filename, request)
+
+@app.delete("/documents/{filename}")
+async def delete_document(filename: str):
+    """Remove a document and all of its chunks from the knowledge base"""
+    ensure_ready()
+    
+    try:
+        deleted = await document_processor.delete_document(filename)
+    except Exception as e:
+        logger.error(f"Error deleting document: {e}")
+        raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"filename": filename, "chunks_deleted": deleted}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,88 @@
+import os
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+
+# Stage timings are only observed when enabled; the counters and gauges are always kept
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# From sub-millisecond keyword search to minute-long document ingestion
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each stage of a RAG operation",
+    ["operation", "stage"], buckets=STAGE_BUCKETS
+)
+CHUNKS = Counter("rag_chunks", "Chunks embedded during ingestion or retrieved for questions", ["operation", "kind"])
+TOKENS = Counter("rag_tokens", "Prompt context and history tokens sent to and completion tokens received from the LLM", ["kind"])
+ERRORS = Counter("rag_errors", "RAG operations that failed", ["operation"])
+EMBEDDING_BATCHES = Counter("rag_embedding_batches", "Query embedding micro-batches encoded, by what flushed them", ["trigger"])
+EMBEDDING_BATCHED_QUERIES = Counter("rag_embedding_batched_queries", "Query embeddings requested through the micro-batcher")
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "rag_embedding_cache_lookups", "Embedding cache lookups, by cache (document chunks or the query LRU) and result",
+    ["cache", "result"]
+)
+SESSION_TURNS = Counter("rag_session_turns", "Conversation turns, by whether they retrieved or reused the last retrieval", ["retrieval"])
+# Set when /metrics is scraped; with several workers the largest live value is reported
+INGESTION_QUEUE_DEPTH = Gauge("rag_ingestion_queue_depth", "Ingestion jobs waiting for a worker", multiprocess_mode="livemax")
+COLLECTION_CHUNKS = Gauge("rag_collection_chunks", "Chunks in the vector store collection", multiprocess_mode="livemax")
+DOCUMENTS = Gauge("rag_documents", "Documents in the document registry", multiprocess_mode="livemax")
+# Admission control: requests running and waiting per pool, summed over workers, and requests refused
+ADMISSION_ACTIVE = Gauge("rag_admission_active", "Requests holding an admission slot", ["pool"], multiprocess_mode="livesum")
+ADMISSION_QUEUED = Gauge("rag_admission_queued", "Requests waiting for an admission slot", ["pool"], multiprocess_mode="livesum")
+ADMISSION_REJECTIONS = Counter(
+    "rag_admission_rejections", "Requests refused by a rate limit (429) or shed under load (503)", ["scope", "reason"]
+)
+
+# Timing keys reported by retrieval, and the stage each is observed as
+RETRIEVAL_STAGES = {
+    "embedding_ms": "embed",
+    "dense_ms": "dense",
+    "sparse_ms": "sparse",
+    "fusion_ms": "fusion",
+    "mmr_ms": "mmr",
+    "rerank_ms": "rerank",
+    "retrieval_ms": "retrieval"
+}
+
+def retrieval_stages(timings: Dict[str, float]) -> Dict[str, float]:
+    """Stage durations in milliseconds from a retrieval's timings"""
+    stages = {RETRIEVAL_STAGES[key]: value for key, value in timings.items() if key in RETRIEVAL_STAGES}
+    # dense_ms counts from the start of retrieval, so the query embedding is part of it
+    if "dense" in stages:
+        stages["dense"] -= stages.get("embed", 0.0)
+    return stages
+
+def observe_stages(operation: str, stages: Dict[str, float]):
+    """Record stage durations, in milliseconds, of one operation"""
+    if not METRICS_ENABLED:
+        return
+    for stage, elapsed_ms in stages.items():
+        STAGE_SECONDS.labels(operation, stage).observe(elapsed_ms / 1000)
+
+def server_timing(stages: Dict[str, float]) -> str:
+    """Stage durations as a Server-Timing header, which browser dev tools show per request"""
+    return ", ".join(f"{stage};dur={elapsed_ms:.3f}" for stage, elapsed_ms in stages.items())
+
+def render(queue_depth: Optional[int] = None, collection_chunks: Optional[int] = None,
+           documents: Optional[int] = None) -> Tuple[bytes, str]:
+    """Prometheus text exposition of every metric, merged across worker processes when they share a directory"""
+    for gauge, value in ((INGESTION_QUEUE_DEPTH, queue_depth), (COLLECTION_CHUNKS, collection_chunks),
+                         (DOCUMENTS, documents)):
+        if value is not None:
+            gauge.set(value)
+
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def shutdown():
+    """Drop this worker's live gauges from the merged view"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid())
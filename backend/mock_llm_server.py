@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible mock LLM server for latency testing.
+
+Serves /v1/chat/completions with a configurable time to first token and
+inter-token delay, streaming or not, so time-to-first-byte and inter-token
+latency of the backend can be measured without calling OpenAI:
+
+    python mock_llm_server.py --port 8001 --ttft-ms 300 --itl-ms 20 --tokens 64
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://localhost:8001/v1 uvicorn main:app --port 8000
+
+A fraction of requests can be failed with 503 (--error-rate) to exercise the
+backend's retries. GET /stats reports how many completions were started,
+finished, failed and abandoned by the client mid-stream.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm_backend import mock_tokens
+
+app = FastAPI(title="Mock LLM server")
+
+config = {
+    "ttft_ms": float(os.getenv("MOCK_LLM_TTFT_MS", "200")),
+    "itl_ms": float(os.getenv("MOCK_LLM_ITL_MS", "20")),
+    "tokens": int(os.getenv("MOCK_LLM_TOKENS", "64")),
+    "error_rate": float(os.getenv("MOCK_LLM_ERROR_RATE", "0")),
+}
+
+stats = {"started": 0, "completed": 0, "cancelled": 0, "failed": 0, "active": 0}
+
+def chunk_payload(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    tokens = mock_tokens(min(config["tokens"], body.get("max_tokens") or config["tokens"]))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    if random.random() < config["error_rate"]:
+        stats["failed"] += 1
+        return JSONResponse({"error": {"message": "Mock overload", "type": "server_error"}}, status_code=503)
+    stats["started"] += 1
+
+    if not body.get("stream"):
+        await asyncio.sleep((config["ttft_ms"] + config["itl_ms"] * (len(tokens) - 1)) / 1000)
+        stats["completed"] += 1
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        })
+
+    async def stream():
+        stats["active"] += 1
+        finished = False
+        try:
+            yield chunk_payload(completion_id, model, {"role": "assistant", "content": ""})
+            await asyncio.sleep(config["ttft_ms"] / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(config["itl_ms"] / 1000)
+                yield chunk_payload(completion_id, model, {"content": token})
+            yield chunk_payload(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+            finished = True
+        finally:
+            stats["active"] -= 1
+            stats["completed" if finished else "cancelled"] += 1
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, **config}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft-ms", type=float, default=config["ttft_ms"], help="Delay before the first token")
+    parser.add_argument("--itl-ms", type=float, default=config["itl_ms"], help="Delay between tokens")
+    parser.add_argument("--tokens", type=int, default=config["tokens"], help="Tokens per completion")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"],
+                        help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    config.update(ttft_ms=args.ttft_ms, itl_ms=args.itl_ms, tokens=args.tokens, error_rate=args.error_rate)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+PDF text extraction helpers that run inside worker processes.
+
+This module only depends on PyPDF2 so that spawned extraction workers do not
+import the embedding model or the vector store.
+"""
+
+import os
+from typing import List
+
+import PyPDF2
+
+# Each worker keeps the reader for the file it is working on open, so
+# consecutive page batches of the same document neither re-parse its
+# cross-reference table nor load the whole file into memory
+_cached_key = None
+_cached_file = None
+_cached_reader = None
+
+def _get_reader(path: str) -> PyPDF2.PdfReader:
+    global _cached_key, _cached_file, _cached_reader
+    key = (path, os.path.getmtime(path))
+    if key != _cached_key:
+        if _cached_file is not None:
+            _cached_file.close()
+        _cached_file = open(path, "rb")
+        _cached_reader = PyPDF2.PdfReader(_cached_file)
+        _cached_key = key
+    return _cached_reader
+
+def count_pages(path: str) -> int:
+    """Return the number of pages in a PDF file"""
+    return len(_get_reader(path).pages)
+
+def extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) from a PDF file"""
+    reader = _get_reader(path)
+    return [reader.pages[page_num].extract_text() or "" for page_num in range(start, end)]
@@ -1,222 +1,1657 @@
 import os
 import logging
-from typing import List, Tuple, AsyncGenerator, Dict, Any
+from typing import List, Tuple, AsyncGenerator, Dict, Any, Awaitable, Callable, FrozenSet, Optional, Sequence, Set, TYPE_CHECKING
 import asyncio
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-import openai
+import hashlib
+import socket
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
 
+from vector_store import AsyncVectorStore
+from llm_backend import create_llm_backend
+from context_builder import BuiltContext, ContextBuilder, TokenCounter
+from reranking import CrossEncoderReranker, RetrievalOptions, mmr, normalize_rows
+from embedding_cache import EmbeddingCache
+from embedding_engine import create_embedding_engine
+from answer_cache import CachedAnswer, SemanticAnswerCache
+from bm25_index import BM25Index, tokenize
+from scoped_search import RetrievalFilter, SourceCatalog, SourceVectorCache, doc_type_of, source_filter
+from chunking import Chunk, create_splitter, split_text
+from document_store import DocumentStore
+from vector_index import VectorIndex
+from sessions import Session, SessionRetrieval, SessionTurn, create_session_store
+import metrics
+
+# torch (via sentence-transformers), chromadb and langchain take seconds to import,
+# so they are imported when the pipeline is built rather than with this module
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+class EmbeddingBatcher:
+    def __init__(self, encode: Callable[[List[str]], Awaitable[List[List[float]]]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """Collect concurrent single-text embedding requests into one encode call"""
+        self.encode = encode
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        # Strong references to running encode tasks, which the event loop only holds weakly
+        self._tasks: Set[asyncio.Task] = set()
+        
+        # Counters
+        self.requests = 0
+        self.batches = 0
+        self.size_triggered_batches = 0
+        self.time_triggered_batches = 0
+        self.max_observed_batch_size = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its embedding"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+        metrics.EMBEDDING_BATCHED_QUERIES.inc()
+        
+        if len(self._pending) >= self.max_batch_size:
+            self.size_triggered_batches += 1
+            self._flush("size")
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush_on_timer)
+        
+        return await future
+
+    def _flush_on_timer(self):
+        self._flush_handle = None
+        if self._pending:
+            self.time_triggered_batches += 1
+            self._flush("timer")
+
+    def _flush(self, trigger: str):
+        """Hand the pending requests to a background encode task"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        self.max_observed_batch_size = max(self.max_observed_batch_size, len(batch))
+        metrics.EMBEDDING_BATCHES.labels(trigger).inc()
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            embeddings = await self.encode([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def close(self):
+        """Encode whatever is still queued and wait for the batches in flight"""
+        if self._pending:
+            self._flush("close")
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching counters"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "requests": self.requests,
+            "batches": self.batches,
+            "size_triggered_batches": self.size_triggered_batches,
+            "time_triggered_batches": self.time_triggered_batches,
+            "max_observed_batch_size": self.max_observed_batch_size,
+            "average_batch_size": self.requests / self.batches if self.batches else 0.0
+        }
+
+@dataclass
+class SourceUpdate:
+    """Diff state while a source is (re)indexed chunk batch by chunk batch"""
+    source: str
+    existing: Dict[str, Dict[str, Any]]
+    # Upload time written on the chunks this update adds or moves
+    uploaded_at: float = field(default_factory=time.time)
+    seen: Set[str] = field(default_factory=set)
+    added: List[str] = field(default_factory=list)
+    # New metadata of stored chunks whose position changed, written once the update finishes
+    moved: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    occurrences: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    # Milliseconds spent per stage, summed over every batch
+    stages: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    # Whether the update still holds its source's lock, and whether its changes were committed
+    locked: bool = False
+    finished: bool = False
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "chunks_added": len(self.added),
+            "chunks_updated": self.updated,
+            "chunks_unchanged": self.unchanged,
+            "chunks_deleted": self.deleted
+        }
+
+@dataclass
+class RetrievalResult:
+    """Chunks retrieved for a question, fused across the dense and keyword legs"""
+    query_embedding: List[float]
+    ids: List[str] = field(default_factory=list)
+    documents: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+    # Distances of the dense leg's top results, which the answer cache keys invalidation on
+    distances: List[float] = field(default_factory=list)
+    terms: List[str] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: Optional[CachedAnswer] = None
+
+    @property
+    def sources(self) -> List[str]:
+        return [meta.get("source", "unknown") for meta in self.metadatas]
+
+class LatencyStats:
+    def __init__(self, window: int = 1000):
+        """Rolling latency percentiles per retrieval stage"""
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, timings: Dict[str, float]):
+        for stage, elapsed_ms in timings.items():
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(elapsed_ms)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        stats = {}
+        for stage, samples in self._samples.items():
+            values = np.fromiter(samples, dtype=np.float64)
+            stats[stage] = {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "max_ms": round(float(values.max()), 3)
+            }
+        return stats
+
 class RAGPipeline:
     def __init__(self):
-        """Initialize the RAG pipeline with ChromaDB and OpenAI"""
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        if not self.openai_api_key or self.openai_api_key == "your_openai_api_key_here":
-            logger.warning("OPENAI_API_KEY not properly set. RAG functionality will be limited.")
-            self.openai_api_key = None
-        
-        # Initialize OpenAI client
-        if self.openai_api_key:
-            try:
-                self.openai_client = openai.OpenAI(api_key=self.openai_api_key)
-            except Exception as e:
-                logger.error(f"Failed to initialize OpenAI client: {e}")
-                self.openai_client = None
-        else:
-            self.openai_client = None
+        """Initialize the RAG pipeline with ChromaDB and an LLM backend"""
+        # Duration of each startup phase, reported by /health
+        self.startup_timings: Dict[str, float] = {}
+        
+        # Chat completions go through a pluggable backend (see llm_backend.py)
+        try:
+            self.llm = create_llm_backend()
+        except Exception as e:
+            logger.error(f"Failed to initialize LLM backend: {e}")
+            self.llm = None
+        
+        # Retrieved chunks are merged and packed into a prompt token budget
+        self.context_builder = ContextBuilder(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "2000")),
+            counter=TokenCounter(self.llm.model if self.llm else "gpt-3.5-turbo")
+        )
+        # Tokens of the system message and prompt template, which every prompt carries
+        self.prompt_overhead_tokens = sum(
+            self.context_builder.counter.count(message["content"]) for message in self._build_messages("", "")
+        )
         
         # Initialize embedding model
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.embedding_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+        self.embedding_model = self._load_embedding_model()
         
-        # Initialize ChromaDB
-        self.chroma_persist_directory = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
-        self.client = chromadb.PersistentClient(
-            path=self.chroma_persist_directory,
-            settings=Settings(anonymized_telemetry=False)
+        # Encoding is CPU-bound, so it runs in a small bounded executor
+        # instead of on the event loop
+        self.embedding_max_workers = int(os.getenv("EMBEDDING_MAX_WORKERS", "2"))
+        self.embedding_executor = ThreadPoolExecutor(
+            max_workers=self.embedding_max_workers,
+            thread_name_prefix="embedding"
+        )
+        # The server's admission controller bounds how many ingest batches are written at once,
+        # and holds them back while chats are busy
+        self.ingest_pool = None
+        
+        # Query embeddings are micro-batched across concurrent requests
+        self.embedding_batcher = EmbeddingBatcher(
+            self._encode,
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
         )
         
+        # Initialize ChromaDB; with several worker processes they share one Chroma
+        # server, whose client keeps a pool of HTTP connections per worker
+        phase_start = time.perf_counter()
+        import chromadb
+        from chromadb.config import Settings
+        self.chroma_persist_directory = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+        os.makedirs(self.chroma_persist_directory, exist_ok=True)
+        self.chroma_server_host = os.getenv("CHROMA_SERVER_HOST")
+        if self.chroma_server_host:
+            self.client = chromadb.HttpClient(
+                host=self.chroma_server_host,
+                port=int(os.getenv("CHROMA_SERVER_PORT", "8000")),
+                settings=Settings(anonymized_telemetry=False)
+            )
+        else:
+            self.client = chromadb.PersistentClient(
+                path=self.chroma_persist_directory,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
             name="knowledge_base",
             metadata={"hnsw:space": "cosine"}
         )
+        self.vector_store = AsyncVectorStore(
+            self.collection,
+            max_workers=int(os.getenv("VECTOR_STORE_MAX_WORKERS", "4"))
+        )
+        self.startup_timings["chroma_ms"] = (time.perf_counter() - phase_start) * 1000
+        
+        # Document metadata and the change log live in SQLite next to the collection,
+        # so every worker process sees uploads and deletes made by the others
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.document_store = DocumentStore(
+            os.getenv(
+                "DOCUMENT_STORE_PATH",
+                os.path.join(self.chroma_persist_directory, "documents.db")
+            )
+        )
+        self.sync_interval = float(os.getenv("SYNC_INTERVAL_SECONDS", "1"))
+        self._sync_task: Optional[asyncio.Task] = None
+        
+        # Counters
+        self.synced_changes = 0
+        self.full_resyncs = 0
+        
+        # Chunk embeddings are cached on disk by content hash so re-uploads
+        # only encode chunks that have not been seen before
+        self.embedding_cache = EmbeddingCache(
+            os.getenv(
+                "EMBEDDING_CACHE_DIRECTORY",
+                os.path.join(self.chroma_persist_directory, "embedding_cache")
+            ),
+            self.embedding_model.cache_name,
+            self.embedding_model.get_sentence_embedding_dimension(),
+            lru_size=int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "1024"))
+        )
         
-        # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
+        # Near-duplicate questions are answered from cache without calling OpenAI
+        self.answer_cache_enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        self.answer_cache = SemanticAnswerCache(
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
         )
         
+        # Conversations keep a bounded history and their last retrieval and context,
+        # which close follow-up questions reuse instead of retrieving again
+        self.session_store = create_session_store(self.chroma_persist_directory)
+        self.session_max_turns = int(os.getenv("SESSION_MAX_TURNS", "10"))
+        self.session_history_max_tokens = int(os.getenv("SESSION_HISTORY_MAX_TOKENS", "1000"))
+        self.session_reuse_similarity = float(os.getenv("SESSION_REUSE_SIMILARITY", "0.8"))
+        self.session_turns = 0
+        self.session_retrieval_skips = 0
+        
+        # Keyword retrieval over the same chunks catches exact identifiers,
+        # error codes and part numbers that dense search misses
+        self.hybrid_search_enabled = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        self.bm25_save_interval = float(os.getenv("BM25_SAVE_INTERVAL_SECONDS", "30"))
+        self.bm25_index = BM25Index(
+            os.getenv(
+                "BM25_INDEX_DIRECTORY",
+                os.path.join(self.chroma_persist_directory, "bm25_index")
+            ),
+            k1=float(os.getenv("BM25_K1", "1.2")),
+            b=float(os.getenv("BM25_B", "0.75"))
+        )
+        self.retrieval_latency = LatencyStats()
+        
+        # Retrieval filters are resolved against an in-memory catalog of sources and
+        # searched exactly over cached per-source embeddings, instead of through
+        # Chroma's metadata scan; very broad scopes fall back to a Chroma where clause
+        self.prefilter_exact_max_chunks = int(os.getenv("PREFILTER_EXACT_MAX_CHUNKS", "20000"))
+        self.source_catalog = SourceCatalog()
+        self.source_vectors = SourceVectorCache(
+            max_chunks=int(os.getenv("PREFILTER_CACHE_MAX_CHUNKS", "100000"))
+        )
+        # source -> [lock, updates and deletes holding or waiting for it]; an update holds
+        # its source's lock from begin to finish or abort, so updates and deletes of one
+        # source never diff against the same stored chunks
+        self._source_locks: Dict[str, list] = {}
+        
+        # Optionally every embedding is also kept in process and searched there, scoped or not;
+        # Chroma stays the source of truth and serves queries whenever the index cannot
+        vector_index_mode = os.getenv("VECTOR_INDEX_MODE", "off").lower()
+        self.vector_index = None
+        if vector_index_mode != "off":
+            self.vector_index = VectorIndex(
+                self.embedding_model.get_sentence_embedding_dimension(),
+                mode=vector_index_mode,
+                dtype=os.getenv("VECTOR_INDEX_DTYPE", "float32"),
+                hnsw_threshold=int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "200000")),
+                hnsw_m=int(os.getenv("VECTOR_INDEX_HNSW_M", "16")),
+                hnsw_ef_construction=int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "200")),
+                hnsw_ef_search=int(os.getenv("VECTOR_INDEX_HNSW_EF_SEARCH", "100"))
+            )
+        phase_start = time.perf_counter()
+        # Changes logged from here on are applied on top of the loaded state
+        self.last_change = self.document_store.latest_change()
+        self._load_collection()
+        self.startup_timings["collection_load_ms"] = (time.perf_counter() - phase_start) * 1000
+        
+        # Candidates can be diversified with MMR and/or reranked by a cross-encoder,
+        # per request; these are the defaults
+        self.retrieval_options = RetrievalOptions.from_env()
+        self.mmr_duplicate_threshold = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+        self.reranker = CrossEncoderReranker(
+            model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "16")),
+            max_candidates=int(os.getenv("RERANK_MAX_CANDIDATES", "20"))
+        )
+        
+        # Batch queries embed and search a slice of questions at a time, and
+        # fan generation out with at most this many LLM calls in flight
+        self.query_batch_size = int(os.getenv("QUERY_BATCH_SIZE", "64"))
+        self.query_batch_concurrency = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
+        
+        # Chunking runs once per document; the document processor shares this splitter
+        self.chunker = create_splitter()
+        
         logger.info("RAG pipeline initialized successfully")
 
-    async def add_documents(self, documents: List[Document], metadata: Dict[str, Any] = None):
+    def _load_embedding_model(self):
+        """Load the embedding engine, from EMBEDDING_MODEL_PATH when the image bakes the model in, and warm it up"""
+        phase_start = time.perf_counter()
+        model_path = os.getenv("EMBEDDING_MODEL_PATH")
+        if model_path and not os.path.isdir(model_path):
+            logger.warning(f"EMBEDDING_MODEL_PATH {model_path} not found, loading {self.embedding_model_name}")
+        # Imports torch (or only onnxruntime for the ONNX engines) on first use
+        model = create_embedding_engine(self.embedding_model_name, model_path)
+        self.startup_timings["model_load_ms"] = (time.perf_counter() - phase_start) * 1000
+        
+        # The first encode initializes kernels and buffers; pay for it before serving
+        if os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+            phase_start = time.perf_counter()
+            model.encode(["warmup"])
+            self.startup_timings["model_warmup_ms"] = (time.perf_counter() - phase_start) * 1000
+        return model
+
+    def _load_collection(self, page_size: int = 1000, force_rebuild: bool = False):
+        """Build the source catalog and vector index, and rebuild the keyword index if it does not match the collection"""
+        count = self.collection.count()
+        rebuild_bm25 = self.hybrid_search_enabled and (force_rebuild or len(self.bm25_index) != count)
+        if rebuild_bm25:
+            logger.info(f"Rebuilding BM25 index: it holds {len(self.bm25_index)} chunks, the collection {count}")
+            self.bm25_index.clear()
+        if self.vector_index is not None:
+            self.vector_index.clear()
+        
+        include = ["metadatas", "documents"] if rebuild_bm25 else ["metadatas"]
+        if self.vector_index is not None:
+            include.append("embeddings")
+        # Chunk count, text length and upload time per source, to verify the document registry against
+        sources: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"chunks": 0, "text_length": 0, "uploaded_at": None})
+        for offset in range(0, count, page_size):
+            results = self.collection.get(limit=page_size, offset=offset, include=include)
+            for chunk_id, metadata in zip(results["ids"], results["metadatas"]):
+                self.source_catalog.add_chunk(chunk_id, metadata)
+                source = sources[metadata.get("source", "unknown")]
+                source["chunks"] += 1
+                source["text_length"] = max(source["text_length"], metadata.get("end_offset") or 0)
+                source["uploaded_at"] = max(source["uploaded_at"] or 0.0, metadata.get("uploaded_at") or 0.0) or None
+            if rebuild_bm25:
+                self.bm25_index.add(results["ids"], results["documents"])
+            if self.vector_index is not None:
+                self.vector_index.add(results["ids"], results["embeddings"])
+        
+        if rebuild_bm25:
+            self.bm25_index.save(force=True)
+        
+        repaired = self.document_store.reconcile(dict(sources))
+        if any(repaired.values()):
+            logger.info(f"Repaired document registry from the collection: {repaired}")
+        logger.info(f"Loaded {count} chunks from {len(self.source_catalog)} sources")
+        if self.vector_index is not None:
+            logger.info(f"Vector index: {self.vector_index.get_stats()}")
+
+    async def _update_bm25(self, func, *args):
+        """Run a keyword index update off the event loop and save it now and then"""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, func, *args)
+        if time.time() - self.bm25_index.last_saved >= self.bm25_save_interval:
+            await loop.run_in_executor(None, self.bm25_index.save)
+        return result
+
+    async def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Encode texts in the embedding executor"""
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            self.embedding_executor, self.embedding_model.encode, texts
+        )
+        return embeddings.tolist()
+
+    def _encode_documents_sync(self, texts: List[str]) -> List[List[float]]:
+        """Encode only the texts missing from the embedding cache"""
+        cached = self.embedding_cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = self.embedding_model.encode(missing_texts)
+            self.embedding_cache.put_many(missing_texts, encoded)
+            for i, embedding in zip(missing, encoded):
+                cached[i] = embedding
+        
+        logger.info(f"Embedding cache served {len(texts) - len(missing)} of {len(texts)} chunks")
+        return np.stack(cached).tolist()
+
+    async def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed document chunks through the persistent cache"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.embedding_executor, self._encode_documents_sync, texts)
+
+    async def _embed_query(self, question: str) -> List[float]:
+        """Embed a query through the LRU cache and the micro-batcher"""
+        cached = self.embedding_cache.get_query(question)
+        if cached is not None:
+            return cached
+        
+        embedding = await self.embedding_batcher.embed(question)
+        self.embedding_cache.put_query(question, embedding)
+        return embedding
+
+    async def _embed_queries(self, questions: List[str]) -> List[List[float]]:
+        """Embed many queries through the LRU cache in a single encode call"""
+        embeddings = [self.embedding_cache.get_query(question) for question in questions]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = await self._encode([questions[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                self.embedding_cache.put_query(questions[i], embedding)
+                embeddings[i] = embedding
+        return embeddings
+
+    async def add_documents(self, documents: List["Document"], metadata: Dict[str, Any] = None):
         """Add documents to the vector store"""
         try:
-            # Split documents into chunks
-            chunks = self.text_splitter.split_documents(documents)
+            total = 0
+            for document in documents:
+                start = time.perf_counter()
+                source = document.metadata.get("source", "unknown")
+                chunks = split_text(self.chunker, document.page_content)
+                if not chunks:
+                    continue
+                
+                update = await self.begin_source_update(source)
+                update.stages["chunk"] = (time.perf_counter() - start) * 1000
+                try:
+                    await self.add_chunks(update, chunks, metadata)
+                    await self.finish_source_update(update)
+                except BaseException:
+                    await self.abort_source_update(update)
+                    raise
+                update.stages["total"] = (time.perf_counter() - start) * 1000
+                metrics.observe_stages("add_documents", update.stages)
+                total += len(chunks)
             
-            if not chunks:
+            if not total:
                 logger.warning("No chunks created from documents")
                 return
             
-            # Prepare data for ChromaDB
-            texts = [chunk.page_content for chunk in chunks]
-            metadatas = []
-            ids = []
+            logger.info(f"Added {total} chunks to vector store")
             
-            for i, chunk in enumerate(chunks):
+        except Exception as e:
+            metrics.ERRORS.labels("add_documents").inc()
+            logger.error(f"Error adding documents to vector store: {e}")
+            raise
+
+    async def _lock_source(self, source: str):
+        entry = self._source_locks.setdefault(source, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._forget_source_lock(source)
+            raise
+
+    def _unlock_source(self, source: str):
+        self._source_locks[source][0].release()
+        self._forget_source_lock(source)
+
+    def _forget_source_lock(self, source: str):
+        entry = self._source_locks[source]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._source_locks[source]
+
+    async def begin_source_update(self, source: str) -> SourceUpdate:
+        """Lock a source and load the chunk hashes already stored for it so it can be diffed
+
+        The lock is held until finish_source_update or abort_source_update, so
+        a second update or a delete of the same source waits for this one.
+        """
+        await self._lock_source(source)
+        try:
+            results = await self.vector_store.get(where={"source": source}, include=["metadatas"])
+        except BaseException:
+            self._unlock_source(source)
+            raise
+        existing = dict(zip(results["ids"], results["metadatas"]))
+        return SourceUpdate(source=source, existing=existing, locked=True)
+
+    def release_source_update(self, update: SourceUpdate):
+        """Release the source lock of an update; finish and abort do this unless asked not to"""
+        if update.locked:
+            update.locked = False
+            self._unlock_source(update.source)
+
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    async def add_chunks(self, update: SourceUpdate, chunks: List[Chunk],
+                         metadata: Dict[str, Any] = None) -> int:
+        """Store a batch of chunks, embedding only those not already in the collection"""
+        try:
+            new_ids, new_texts, new_metadatas = [], [], []
+            doc_type = doc_type_of(update.source)
+            
+            for chunk in chunks:
+                # Chunk ids are content addressed; repeated text within a source gets a suffix
+                chunk_hash = self._chunk_hash(chunk.text)
+                occurrence = update.occurrences[chunk_hash]
+                update.occurrences[chunk_hash] += 1
+                chunk_id = f"{update.source}_{chunk_hash}" + (f"_{occurrence}" if occurrence else "")
+                
                 chunk_metadata = {
-                    "source": chunk.metadata.get("source", "unknown"),
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
+                    "source": update.source,
+                    "chunk_hash": chunk_hash,
+                    "chunk_index": chunk.index,
+                    "start_offset": chunk.start,
+                    "end_offset": chunk.end,
+                    "page": chunk.page,
+                    "page_end": chunk.page_end,
+                    "doc_type": doc_type
                 }
                 if metadata:
                     chunk_metadata.update(metadata)
                 
-                metadatas.append(chunk_metadata)
-                ids.append(f"{chunk_metadata['source']}_{i}")
-            
-            # Generate embeddings
-            embeddings = self.embedding_model.encode(texts).tolist()
+                update.seen.add(chunk_id)
+                stored = update.existing.get(chunk_id)
+                if stored is None:
+                    new_ids.append(chunk_id)
+                    new_texts.append(chunk.text)
+                    new_metadatas.append({**chunk_metadata, "uploaded_at": update.uploaded_at})
+                elif any(stored.get(key) != value for key, value in chunk_metadata.items()):
+                    # Same text at a new position: only the metadata changes, once the whole source is through
+                    update.moved[chunk_id] = {**chunk_metadata, "uploaded_at": update.uploaded_at}
+                    update.updated += 1
+                else:
+                    update.unchanged += 1
             
-            # Add to ChromaDB
-            self.collection.add(
-                embeddings=embeddings,
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
+            if new_ids:
+                await self._write_chunks(new_ids, new_texts, new_metadatas, update.stages)
+                update.added.extend(new_ids)
             
-            logger.info(f"Added {len(chunks)} chunks to vector store")
+            return len(chunks)
             
         except Exception as e:
-            logger.error(f"Error adding documents to vector store: {e}")
+            logger.error(f"Error adding chunk batch to vector store: {e}")
             raise
 
-    async def query(self, question: str, n_results: int = 5) -> Tuple[str, List[str]]:
-        """Query the RAG pipeline and return response with sources"""
+    async def finish_source_update(self, update: SourceUpdate, release: bool = True) -> Dict[str, int]:
+        """Delete chunks that disappeared from the source, move the ones that shifted and update the catalog
+
+        With release False the source stays locked until release_source_update,
+        for callers that record the new version elsewhere first.
+        """
+        start = time.perf_counter()
+        removed = [chunk_id for chunk_id in update.existing if chunk_id not in update.seen]
+        if removed:
+            await self.vector_store.delete(ids=removed)
+            update.deleted = len(removed)
+            if self.hybrid_search_enabled:
+                await self._update_bm25(self.bm25_index.remove, removed)
+            await self._update_vector_index(removed=removed)
+        if update.moved:
+            # Chroma merges the updated keys into the stored metadata
+            await self.vector_store.update(ids=list(update.moved), metadatas=list(update.moved.values()))
+        
+        # Chunks that did not change keep the metadata they were written with, so the
+        # catalog rather than each chunk holds the document's upload time
+        if update.added or update.moved or update.deleted:
+            uploaded_at = update.uploaded_at
+        else:
+            uploaded_at = max(
+                (meta.get("uploaded_at") or 0.0 for meta in update.existing.values()), default=0.0
+            ) or update.uploaded_at
+        self.source_catalog.set_source(update.source, update.seen, doc_type_of(update.source), uploaded_at)
+        self.source_vectors.invalidate(update.source)
+        
+        if update.deleted:
+            self.answer_cache.invalidate(sources={update.source})
+        update.finished = True
+        await self._record_change(update.source, "update")
+        update.stages["finalize"] += (time.perf_counter() - start) * 1000
+        if release:
+            self.release_source_update(update)
+        
+        summary = update.summary()
+        logger.info(f"Indexed {update.source}: {summary}")
+        return summary
+
+    async def abort_source_update(self, update: SourceUpdate):
+        """Remove the chunks a failed or cancelled update added; stored chunks are only changed when it finishes"""
+        try:
+            # Once finished, the added chunks are the source's chunks
+            if update.added and not update.finished:
+                await self.vector_store.delete(ids=update.added)
+                if self.hybrid_search_enabled:
+                    await self._update_bm25(self.bm25_index.remove, update.added)
+                await self._update_vector_index(removed=update.added)
+                self.source_vectors.invalidate(update.source)
+                self.answer_cache.invalidate(sources={update.source})
+                await self._record_change(update.source, "update")
+        finally:
+            self.release_source_update(update)
+
+    async def delete_source(self, source: str) -> int:
+        """Delete every chunk of a source, after any update of it in progress"""
+        await self._lock_source(source)
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode([question]).tolist()[0]
+            results = await self.vector_store.get(where={"source": source}, include=[])
+            self.source_catalog.remove_source(source)
+            self.source_vectors.invalidate(source)
+            if results["ids"]:
+                await self.vector_store.delete(ids=results["ids"])
+                if self.hybrid_search_enabled:
+                    await self._update_bm25(self.bm25_index.remove, results["ids"])
+                await self._update_vector_index(removed=results["ids"])
+                self.answer_cache.invalidate(sources={source})
+            await self._record_change(source, "delete")
+        finally:
+            self._unlock_source(source)
+        logger.info(f"Deleted {len(results['ids'])} chunks of {source}")
+        return len(results["ids"])
+
+    async def _write_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                            stages: Optional[Dict[str, float]] = None):
+        """Embed chunks, write them to ChromaDB and invalidate affected answers"""
+        # The whole write holds an ingest slot, not just the encode: storing and
+        # keyword indexing compete with chats for the same CPU
+        if self.ingest_pool is None:
+            return await self._store_chunks(ids, texts, metadatas, stages)
+        async with self.ingest_pool.slot():
+            return await self._store_chunks(ids, texts, metadatas, stages)
+
+    async def _store_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                            stages: Optional[Dict[str, float]] = None):
+        stages = stages if stages is not None else defaultdict(float)
+        
+        # Generate embeddings
+        start = time.perf_counter()
+        embeddings = await self._embed_documents(texts)
+        stages["embed"] += (time.perf_counter() - start) * 1000
+        
+        # Add to ChromaDB
+        start = time.perf_counter()
+        await self.vector_store.add(
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=metadatas,
+            ids=ids
+        )
+        await self._update_vector_index(added=(ids, embeddings))
+        stages["store"] += (time.perf_counter() - start) * 1000
+        
+        # Index the same chunks for keyword search
+        terms = set()
+        if self.hybrid_search_enabled:
+            start = time.perf_counter()
+            terms = await self._update_bm25(self.bm25_index.add, ids, texts)
+            stages["keyword_index"] += (time.perf_counter() - start) * 1000
+        metrics.CHUNKS.labels("ingest", "embedded").inc(len(ids))
+        
+        self.answer_cache.invalidate(
+            sources={meta["source"] for meta in metadatas},
+            embeddings=embeddings,
+            terms=terms
+        )
+
+    async def _update_vector_index(self, added: Optional[Tuple[List[str], List[List[float]]]] = None,
+                                   removed: Optional[List[str]] = None):
+        """Apply a collection write to the in-process vector index; Chroma already holds it"""
+        if self.vector_index is None:
+            return
+        loop = asyncio.get_running_loop()
+        if removed:
+            await loop.run_in_executor(None, self.vector_index.remove, removed)
+        if added and added[0]:
+            await loop.run_in_executor(None, self.vector_index.add, *added)
+
+    async def _record_change(self, source: str, action: str):
+        """Log a change to a source for the other worker processes"""
+        loop = asyncio.get_running_loop()
+        self.last_change = max(self.last_change, await loop.run_in_executor(
+            None, self.document_store.record_change, source, action, self.worker_id
+        ))
+
+    def start_sync(self):
+        """Start applying changes other worker processes make to the collection"""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync_changes()
+            except Exception as e:
+                logger.error(f"Error syncing collection changes: {e}")
+
+    async def sync_changes(self) -> int:
+        """Refresh the in-memory indexes for sources other workers changed since the last sync"""
+        loop = asyncio.get_running_loop()
+        changes, complete = await loop.run_in_executor(None, self.document_store.changes_since, self.last_change)
+        if not changes:
+            return 0
+
+        if not complete:
+            # Fell behind the change log; reload everything
+            latest = changes[-1]["seq"]
+            await loop.run_in_executor(None, self._resync)
+            self.last_change = latest
+            return len(changes)
+
+        for source in dict.fromkeys(
+            change["source"] for change in changes if change["origin"] != self.worker_id
+        ):
+            await self._refresh_source(source)
+        self.last_change = changes[-1]["seq"]
+        self.synced_changes += len(changes)
+        return len(changes)
+
+    def _resync(self):
+        """Rebuild the catalog, keyword index and caches from the collection"""
+        logger.info("Change log no longer reaches the last applied change, reloading the collection")
+        self.source_catalog = SourceCatalog()
+        self._load_collection(force_rebuild=True)
+        self.source_vectors.clear()
+        self.answer_cache.clear()
+        self.full_resyncs += 1
+
+    async def _refresh_source(self, source: str):
+        """Bring one source in line with what the collection now holds for it"""
+        results = await self.vector_store.get(
+            where={"source": source}, include=["metadatas", "documents", "embeddings"]
+        )
+        current_ids = set(results["ids"])
+        previous_ids = self.source_catalog.chunk_ids([source])
+
+        if current_ids:
+            # The chunks an update added or moved carry its upload time; unchanged ones keep an earlier one
+            uploaded_at = max(metadata.get("uploaded_at") or 0.0 for metadata in results["metadatas"]) or None
+            self.source_catalog.set_source(
+                source, current_ids, results["metadatas"][0].get("doc_type") or doc_type_of(source), uploaded_at
+            )
+        else:
+            self.source_catalog.remove_source(source)
+        self.source_vectors.invalidate(source)
+
+        added = [
+            (chunk_id, text, embedding)
+            for chunk_id, text, embedding in zip(results["ids"], results["documents"], results["embeddings"])
+            if chunk_id not in previous_ids
+        ]
+        terms = set()
+        if self.hybrid_search_enabled:
+            removed = [chunk_id for chunk_id in previous_ids if chunk_id not in current_ids]
+            if removed:
+                await self._update_bm25(self.bm25_index.remove, removed)
+            missing = [(chunk_id, text) for chunk_id, text, _ in added if chunk_id not in self.bm25_index]
+            if missing:
+                terms = await self._update_bm25(
+                    self.bm25_index.add, [chunk_id for chunk_id, _ in missing], [text for _, text in missing]
+                )
+        await self._update_vector_index(
+            added=([chunk_id for chunk_id, _, _ in added], [embedding for _, _, embedding in added]),
+            removed=[chunk_id for chunk_id in previous_ids if chunk_id not in current_ids]
+        )
+
+        self.answer_cache.invalidate(
+            sources={source},
+            embeddings=[embedding for _, _, embedding in added] or None,
+            terms=terms
+        )
+        logger.info(f"Refreshed {source} from another worker: {len(current_ids)} chunks")
+
+    async def retrieve(self, question: str, n_results: int = 5, cache_variant: Optional[str] = None,
+                       filters: Optional[RetrievalFilter] = None,
+                       options: Optional[RetrievalOptions] = None,
+                       query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+        """Run dense and keyword retrieval concurrently, fuse their rankings and select the results"""
+        start = time.perf_counter()
+        timings = {}
+        options = options or self.retrieval_options
+        depth, keep, scope, allowed_ids = self._retrieval_plan(n_results, filters, options)
+        
+        # The keyword leg starts right away and runs while the query is embedded
+        sparse_task = None
+        if self.hybrid_search_enabled:
+            sparse_task = asyncio.create_task(self._sparse_search(question, depth, timings, allowed_ids))
+        
+        try:
+            if query_embedding is None:
+                query_embedding = await self._embed_query(question)
+            timings["embedding_ms"] = (time.perf_counter() - start) * 1000
+            result = RetrievalResult(query_embedding=query_embedding, timings=timings)
             
-            # Search for similar documents
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
+            # Answer near-duplicate questions from the cache
+            if cache_variant is not None and self.answer_cache_enabled:
+                result.cached = self.answer_cache.lookup(query_embedding, cache_variant)
+                if result.cached:
+                    return result
+            
+            dense_start = time.perf_counter()
+            dense = await self._dense_search(
+                query_embedding, depth, scope, allowed_ids, include_embeddings=options.mode == "mmr"
             )
+            timings["dense_ms"] = timings["embedding_ms"] + (time.perf_counter() - dense_start) * 1000
             
-            # Extract relevant documents
-            relevant_docs = results["documents"][0] if results["documents"] else []
-            sources = []
+            sparse_ids = await sparse_task if sparse_task is not None else None
+            await self._finish_retrieval(question, result, dense, sparse_ids, n_results, keep, options)
+            timings["retrieval_ms"] = (time.perf_counter() - start) * 1000
+            self.retrieval_latency.record(timings)
+            return result
+        finally:
+            if sparse_task and not sparse_task.done():
+                sparse_task.cancel()
+
+    def _retrieval_plan(self, n_results: int, filters: Optional[RetrievalFilter], options: RetrievalOptions
+                        ) -> Tuple[int, int, Optional[Dict[str, int]], Optional[FrozenSet[str]]]:
+        """How deep each leg searches, how many fused candidates are kept, and the sources and chunk ids in scope"""
+        depth = max(n_results, self.hybrid_candidates) if self.hybrid_search_enabled else n_results
+        if options.expands_candidates:
+            depth = max(depth, options.candidates)
+        keep = depth if options.expands_candidates else n_results
+        
+        # Filters are resolved to the matching sources up front, so both legs only search inside them
+        scope = allowed_ids = None
+        if filters is not None and not filters.is_empty():
+            scope = self.source_catalog.resolve(filters)
+            # The keyword leg and the vector index take chunk ids; the catalog caches them per filter
+            if self.hybrid_search_enabled or self.vector_index is not None:
+                allowed_ids = self.source_catalog.scope_chunk_ids(filters)
+        return depth, keep, scope, allowed_ids
+
+    async def _finish_retrieval(self, question: str, result: RetrievalResult, dense, sparse_ids: Optional[List[str]],
+                                n_results: int, keep: int, options: RetrievalOptions):
+        """Fuse the dense and keyword rankings into result and select its chunks"""
+        dense_ids, dense_hits, distances, embeddings = dense
+        timings = result.timings
+        result.distances = distances[:n_results]
+        
+        fused_scores = None
+        if sparse_ids is None:
+            result.ids = dense_ids[:keep]
+        else:
+            result.terms = sorted(set(tokenize(question)))
+            fusion_start = time.perf_counter()
+            fused_scores = self._fusion_scores([dense_ids, sparse_ids])
+            result.ids = sorted(fused_scores, key=fused_scores.get, reverse=True)[:keep]
             
-            if results["metadatas"] and results["metadatas"][0]:
-                sources = [meta.get("source", "unknown") for meta in results["metadatas"][0]]
+            # Keyword-only hits still need their text and metadata
+            missing = [chunk_id for chunk_id in result.ids if chunk_id not in dense_hits]
+            if missing:
+                include = ["documents", "metadatas"] + (["embeddings"] if options.mode == "mmr" else [])
+                fetched = await self.vector_store.get(ids=missing, include=include)
+                dense_hits.update(
+                    (chunk_id, (document, metadata))
+                    for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+                )
+                if options.mode == "mmr":
+                    embeddings.update(zip(fetched["ids"], fetched["embeddings"]))
+                result.ids = [chunk_id for chunk_id in result.ids if chunk_id in dense_hits]
+            timings["fusion_ms"] = (time.perf_counter() - fusion_start) * 1000
+        
+        if options.expands_candidates:
+            result.ids = await self._select(question, result.query_embedding, result.ids, dense_hits, embeddings,
+                                            fused_scores, n_results, options, timings)
+        
+        result.documents = [dense_hits[chunk_id][0] for chunk_id in result.ids]
+        result.metadatas = [dense_hits[chunk_id][1] for chunk_id in result.ids]
+
+    async def retrieve_batch(self, questions: List[str], n_results: int = 5, cache_variant: Optional[str] = None,
+                             filters: Optional[RetrievalFilter] = None,
+                             options: Optional[RetrievalOptions] = None) -> List[RetrievalResult]:
+        """Retrieve for many questions with one encode call and one batched Chroma query
+
+        Every result shares the embedding, dense and keyword timings of the batch.
+        """
+        start = time.perf_counter()
+        timings = {}
+        options = options or self.retrieval_options
+        depth, keep, scope, allowed_ids = self._retrieval_plan(n_results, filters, options)
+        
+        # The keyword leg searches every question in one worker thread call while the batch is embedded
+        sparse_task = None
+        if self.hybrid_search_enabled:
+            sparse_task = asyncio.create_task(self._sparse_search_batch(questions, depth, timings, allowed_ids))
+        
+        try:
+            query_embeddings = await self._embed_queries(questions)
+            timings["embedding_ms"] = (time.perf_counter() - start) * 1000
+            results = [RetrievalResult(query_embedding=embedding) for embedding in query_embeddings]
+            if cache_variant is not None and self.answer_cache_enabled:
+                for result in results:
+                    result.cached = self.answer_cache.lookup(result.query_embedding, cache_variant)
+            
+            pending = [i for i, result in enumerate(results) if not result.cached]
+            dense_start = time.perf_counter()
+            dense = await self._dense_search_batch(
+                [query_embeddings[i] for i in pending], depth, scope, allowed_ids, include_embeddings=options.mode == "mmr"
+            )
+            timings["dense_ms"] = timings["embedding_ms"] + (time.perf_counter() - dense_start) * 1000
+            sparse_ids = await sparse_task if sparse_task is not None else None
             
-            # Create context from retrieved documents
-            context = "\n\n".join(relevant_docs) if relevant_docs else "No relevant context found."
+            for i, question_dense in zip(pending, dense):
+                results[i].timings = dict(timings)
+                await self._finish_retrieval(
+                    questions[i], results[i], question_dense, sparse_ids[i] if sparse_ids is not None else None,
+                    n_results, keep, options
+                )
+            timings["retrieval_ms"] = (time.perf_counter() - start) * 1000
+            for result in results:
+                result.timings.update(timings)
+            self.retrieval_latency.record(timings)
+            return results
+        finally:
+            if sparse_task and not sparse_task.done():
+                sparse_task.cancel()
+
+    async def _dense_search(self, query_embedding: List[float], k: int, scope: Optional[Dict[str, int]],
+                            allowed_ids: Optional[FrozenSet[str]] = None, include_embeddings: bool = False
+                            ) -> Tuple[List[str], Dict[str, Tuple[str, Dict[str, Any]]], List[float], Dict[str, List[float]]]:
+        """Dense leg: ids, (document, metadata) by id, distances and (on request) embeddings of the nearest chunks"""
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        if self.vector_index is not None:
+            try:
+                return await self._index_search(query_embedding, k, scope, allowed_ids, include_embeddings)
+            except Exception as e:
+                logger.error(f"Vector index search failed, querying Chroma instead: {e}")
+        
+        if scope is None:
+            results = await self.vector_store.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                include=include
+            )
+            return self._query_hits(results)
+        
+        scoped_chunks = sum(scope.values())
+        if not scoped_chunks:
+            return [], {}, [], {}
+        
+        if scoped_chunks > self.prefilter_exact_max_chunks:
+            # Too broad to search exactly in memory; let Chroma filter to the sources the catalog matched
+            results = await self.vector_store.query(
+                query_embeddings=[query_embedding],
+                n_results=min(k, scoped_chunks),
+                include=include,
+                where=source_filter(scope)
+            )
+            return self._query_hits(results)
+        
+        # Exact search over the embeddings of the matching sources only
+        entries, missing = self.source_vectors.get(list(scope))
+        if missing:
+            loaded = await self.vector_store.get(
+                ids=list(self.source_catalog.chunk_ids(missing)),
+                include=["embeddings", "metadatas"]
+            )
+            by_source = defaultdict(lambda: ([], []))
+            for chunk_id, embedding, metadata in zip(loaded["ids"], loaded["embeddings"], loaded["metadatas"]):
+                source_ids, source_embeddings = by_source[metadata.get("source", "unknown")]
+                source_ids.append(chunk_id)
+                source_embeddings.append(embedding)
+            for source, (source_ids, source_embeddings) in by_source.items():
+                entries[source] = self.source_vectors.put(source, source_ids, source_embeddings)
+        
+        loop = asyncio.get_running_loop()
+        nearest = await loop.run_in_executor(
+            None, self.source_vectors.search, query_embedding, list(entries.values()), k
+        )
+        return (await self._fetch_nearest([nearest], include_embeddings))[0]
+
+    async def _index_search(self, query_embedding: List[float], k: int, scope: Optional[Dict[str, int]],
+                            allowed_ids: Optional[FrozenSet[str]], include_embeddings: bool = False):
+        """Dense leg through the in-process vector index; text and metadata still come from Chroma"""
+        if scope is not None and not sum(scope.values()):
+            return [], {}, [], {}
+        loop = asyncio.get_running_loop()
+        nearest = await loop.run_in_executor(None, self.vector_index.search, query_embedding, k, allowed_ids)
+        return (await self._fetch_nearest([nearest], include_embeddings))[0]
+
+    async def _fetch_nearest(self, nearest: List[List[Tuple[str, float]]], include_embeddings: bool = False) -> list:
+        """Dense leg return values for in-memory search results, with one Chroma read for all of them"""
+        wanted = list(dict.fromkeys(chunk_id for query_nearest in nearest for chunk_id, _ in query_nearest))
+        if not wanted:
+            return [([], {}, [], {}) for _ in nearest]
+        fetched = await self.vector_store.get(
+            ids=wanted, include=["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        )
+        stored = dict(zip(fetched["ids"], zip(fetched["documents"], fetched["metadatas"])))
+        stored_embeddings = dict(zip(fetched["ids"], fetched["embeddings"])) if include_embeddings else {}
+        
+        results = []
+        for query_nearest in nearest:
+            # Chunks deleted since the search are skipped
+            found = [(chunk_id, distance) for chunk_id, distance in query_nearest if chunk_id in stored]
+            ids = [chunk_id for chunk_id, _ in found]
+            results.append((
+                ids,
+                {chunk_id: stored[chunk_id] for chunk_id in ids},
+                [distance for _, distance in found],
+                {chunk_id: stored_embeddings[chunk_id] for chunk_id in ids} if include_embeddings else {}
+            ))
+        return results
+
+    async def _dense_search_batch(self, query_embeddings: List[List[float]], k: int, scope: Optional[Dict[str, int]],
+                                  allowed_ids: Optional[FrozenSet[str]] = None, include_embeddings: bool = False) -> list:
+        """Dense leg for many queries: one Chroma query for all of them unless the scope is searched in memory"""
+        if not query_embeddings:
+            return []
+        if self.vector_index is not None and scope is None:
+            try:
+                loop = asyncio.get_running_loop()
+                nearest = await loop.run_in_executor(None, self.vector_index.search_batch, query_embeddings, k)
+                return await self._fetch_nearest(nearest, include_embeddings)
+            except Exception as e:
+                logger.error(f"Vector index search failed, querying Chroma instead: {e}")
+        
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        if scope is None or (self.vector_index is None and sum(scope.values()) > self.prefilter_exact_max_chunks):
+            scoped_chunks = sum(scope.values()) if scope is not None else None
+            results = await self.vector_store.query(
+                query_embeddings=query_embeddings,
+                n_results=min(k, scoped_chunks) if scoped_chunks is not None else k,
+                include=include,
+                where=source_filter(scope) if scope is not None else None
+            )
+            return [self._query_hits(results, row) for row in range(len(query_embeddings))]
+        
+        # Scopes are searched exactly in memory, which is already cheap per query
+        return await asyncio.gather(*[
+            self._dense_search(query_embedding, k, scope, allowed_ids, include_embeddings)
+            for query_embedding in query_embeddings
+        ])
+
+    @staticmethod
+    def _query_hits(results: Dict[str, Any], row: int = 0):
+        """Unpack one query of a Chroma result into the dense leg's return values"""
+        ids = results["ids"][row] if results["ids"] else []
+        hits = dict(zip(ids, zip(
+            results["documents"][row] if results["documents"] else [],
+            results["metadatas"][row] if results["metadatas"] else []
+        )))
+        distances = results["distances"][row] if results.get("distances") else []
+        embeddings = dict(zip(ids, results["embeddings"][row])) if results.get("embeddings") else {}
+        return ids, hits, distances, embeddings
+
+    async def _select(self, question: str, query_embedding: List[float], candidates: List[str],
+                      hits: Dict[str, Tuple[str, Dict[str, Any]]], embeddings: Dict[str, List[float]],
+                      fused_scores: Optional[Dict[str, float]], n_results: int, options: RetrievalOptions,
+                      timings: Dict[str, float]) -> List[str]:
+        """Pick the results from the candidate set: cross-encoder reranking, then MMR or top-n"""
+        relevance = None
+        if fused_scores is not None and candidates:
+            # MMR weighs fused relevance, so keyword-only hits are not judged by cosine alone
+            relevance = self._min_max(np.array([fused_scores[chunk_id] for chunk_id in candidates], dtype=np.float32))
+        loop = asyncio.get_running_loop()
+        
+        if options.rerank and self.reranker.available and candidates:
+            rerank_start = time.perf_counter()
+            candidates = candidates[:self.reranker.max_candidates]
+            scores = await loop.run_in_executor(
+                self.embedding_executor, self.reranker.score, question, [hits[chunk_id][0] for chunk_id in candidates]
+            )
+            if scores is not None:
+                order = np.argsort(-scores, kind="stable")
+                candidates = [candidates[i] for i in order]
+                # Min-max scaled, so MMR weighs them like cosine similarities
+                relevance = self._min_max(scores[order])
+            timings["rerank_ms"] = (time.perf_counter() - rerank_start) * 1000
+        
+        if options.mode != "mmr":
+            return candidates[:n_results]
+        
+        mmr_start = time.perf_counter()
+        known = [i for i, chunk_id in enumerate(candidates) if chunk_id in embeddings]
+        candidates = [candidates[i] for i in known]
+        if relevance is not None:
+            relevance = relevance[known]
+        matrix = normalize_rows([embeddings[chunk_id] for chunk_id in candidates]) if candidates else np.zeros((0, 0))
+        if relevance is None and candidates:
+            relevance = matrix @ normalize_rows([query_embedding])[0]
+        selected = mmr(relevance, matrix, n_results, options.mmr_lambda, self.mmr_duplicate_threshold) if candidates else []
+        timings["mmr_ms"] = (time.perf_counter() - mmr_start) * 1000
+        return [candidates[i] for i in selected]
+
+    @staticmethod
+    def _min_max(scores: np.ndarray) -> np.ndarray:
+        spread = float(scores.max() - scores.min())
+        return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+    async def _sparse_search(self, question: str, k: int, timings: Dict[str, float],
+                             allowed_ids: Optional[FrozenSet[str]] = None) -> List[str]:
+        """Keyword leg: BM25 search in a worker thread"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        hits = await loop.run_in_executor(None, self.bm25_index.search, question, k, allowed_ids)
+        timings["sparse_ms"] = (time.perf_counter() - start) * 1000
+        return [chunk_id for chunk_id, _ in hits]
+
+    async def _sparse_search_batch(self, questions: List[str], k: int, timings: Dict[str, float],
+                                   allowed_ids: Optional[FrozenSet[str]] = None) -> List[List[str]]:
+        """Keyword leg for many questions in a single worker thread call"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        hits = await loop.run_in_executor(
+            None, lambda: [self.bm25_index.search(question, k, allowed_ids) for question in questions]
+        )
+        timings["sparse_ms"] = (time.perf_counter() - start) * 1000
+        return [[chunk_id for chunk_id, _ in question_hits] for question_hits in hits]
+
+    def _fusion_scores(self, rankings: List[List[str]]) -> Dict[str, float]:
+        """Reciprocal rank fusion scores of the ids in several ranked lists"""
+        scores: Dict[str, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking):
+                scores[chunk_id] += 1.0 / (self.rrf_k + rank + 1)
+        return scores
+
+    async def query(self, question: str, n_results: int = 5, filters: Optional[RetrievalFilter] = None,
+                    options: Optional[RetrievalOptions] = None,
+                    trace: Optional[Dict[str, float]] = None,
+                    session_id: Optional[str] = None,
+                    turn: Optional[Dict[str, Any]] = None) -> Tuple[str, List[str]]:
+        """Query the RAG pipeline and return response with sources
+
+        Stage durations in milliseconds are added to trace when one is passed.
+        With a session_id the question is a turn of that conversation (started
+        if it is unknown or expired), and the turn's report is added to turn
+        when one is passed.
+        """
+        start = time.perf_counter()
+        stages = trace if trace is not None else {}
+        try:
+            options = options or self.retrieval_options
+            cache_variant = self._cache_variant(n_results, filters, options)
+            session, history = await self._load_session(session_id)
+            # Once a conversation has history its answers depend on it, so only first turns use the answer cache
+            use_answer_cache = not history
+            reused_context, similarity = None, None
+            if session is not None:
+                retrieval, reused_context, similarity = await self._session_retrieve(
+                    session, question, n_results, cache_variant, use_answer_cache, filters, options
+                )
+            else:
+                retrieval = await self.retrieve(question, n_results, cache_variant, filters, options)
+            stages.update(metrics.retrieval_stages(retrieval.timings))
+            if retrieval.cached:
+                if session is not None:
+                    report = await self._save_turn(
+                        session, question, retrieval.cached.response, retrieval, None, False, similarity, history, cache_variant
+                    )
+                    if turn is not None:
+                        turn.update(report)
+                stages["total"] = (time.perf_counter() - start) * 1000
+                metrics.observe_stages("query", stages)
+                return retrieval.cached.response, retrieval.cached.sources
+            
+            # Create context from retrieved documents, unless the session's last one is reused
+            stage_start = time.perf_counter()
+            context = reused_context or self._build_context(retrieval)
+            stages["context"] = (time.perf_counter() - stage_start) * 1000
+            
+            # Generate response using the LLM backend
+            stage_start = time.perf_counter()
+            response, cacheable = await self._generate_response(
+                question, context.text or "No relevant context found.", history
+            )
+            stages["generate"] = (time.perf_counter() - stage_start) * 1000
             
-            # Generate response using OpenAI
-            response = await self._generate_response(question, context)
+            if self.answer_cache_enabled and use_answer_cache and cacheable:
+                self.answer_cache.store(
+                    retrieval.query_embedding, question, response, context.sources,
+                    retrieval.distances, n_results, cache_variant, terms=retrieval.terms
+                )
+            if session is not None:
+                report = await self._save_turn(
+                    session, question, response, retrieval, context, reused_context is not None, similarity,
+                    history, cache_variant
+                )
+                if turn is not None:
+                    turn.update(report)
             
-            return response, sources
+            stages["total"] = (time.perf_counter() - start) * 1000
+            metrics.observe_stages("query", stages)
+            self._count_usage("query", retrieval, context, self.context_builder.counter.count(response) if cacheable else 0)
+            return response, context.sources
             
         except Exception as e:
+            metrics.ERRORS.labels("query").inc()
             logger.error(f"Error in RAG query: {e}")
             raise
 
-    async def query_stream(self, question: str, n_results: int = 5) -> AsyncGenerator[Dict[str, Any], None]:
-        """Stream query response from the RAG pipeline"""
+    @staticmethod
+    def _trace_fields(trace: Optional[Dict[str, float]]) -> Dict[str, Any]:
+        return {"trace": {stage: round(elapsed, 3) for stage, elapsed in trace.items()}} if trace is not None else {}
+
+    @staticmethod
+    def _count_usage(operation: str, retrieval: RetrievalResult, context: BuiltContext, completion_tokens: int):
+        metrics.CHUNKS.labels(operation, "retrieved").inc(len(retrieval.ids))
+        metrics.TOKENS.labels("context").inc(context.tokens)
+        metrics.TOKENS.labels("completion").inc(completion_tokens)
+
+    async def query_stream(self, question: str, n_results: int = 5, filters: Optional[RetrievalFilter] = None,
+                           options: Optional[RetrievalOptions] = None,
+                           trace: Optional[Dict[str, float]] = None,
+                           session_id: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream query response from the RAG pipeline
+
+        Sources and retrieval timings are sent before generation starts, then
+        content as it arrives, a first-token timing event and a final done event.
+        When trace is passed, stage durations are added to it and to the done event.
+        With a session_id the question is a turn of that conversation; the sources
+        event reports whether retrieval was skipped and the prompt's token count,
+        and the done event the saved turn.
+        """
+        start = time.perf_counter()
+        stages = trace if trace is not None else {}
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode([question]).tolist()[0]
+            options = options or self.retrieval_options
+            cache_variant = self._cache_variant(n_results, filters, options)
+            session, history = await self._load_session(session_id)
+            use_answer_cache = not history
+            reused_context, similarity = None, None
+            if session is not None:
+                retrieval, reused_context, similarity = await self._session_retrieve(
+                    session, question, n_results, cache_variant, use_answer_cache, filters, options
+                )
+            else:
+                retrieval = await self.retrieve(question, n_results, cache_variant, filters, options)
+            timings = {stage: round(elapsed, 3) for stage, elapsed in retrieval.timings.items()}
+            stages.update(metrics.retrieval_stages(retrieval.timings))
             
-            # Search for similar documents
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            # Replay cached answers for near-duplicate questions
+            if retrieval.cached:
+                yield {"type": "sources", "sources": retrieval.cached.sources, "cached": True}
+                yield {"type": "timing", "stage": "retrieval", **timings}
+                for piece in self._replay_chunks(retrieval.cached.response):
+                    yield {"type": "content", "content": piece}
+                session_fields = {}
+                if session is not None:
+                    session_fields["session"] = await self._save_turn(
+                        session, question, retrieval.cached.response, retrieval, None, False, similarity, history,
+                        cache_variant
+                    )
+                stages["total"] = (time.perf_counter() - start) * 1000
+                metrics.observe_stages("query_stream", stages)
+                yield {"type": "done", "cached": True, "total_ms": round(stages["total"], 3), **session_fields,
+                       **self._trace_fields(trace)}
+                return
             
-            # Extract relevant documents
-            relevant_docs = results["documents"][0] if results["documents"] else []
-            sources = []
+            # Create context from retrieved documents, unless the session's last one is reused
+            stage_start = time.perf_counter()
+            context = reused_context or self._build_context(retrieval)
+            stages["context"] = (time.perf_counter() - stage_start) * 1000
             
-            if results["metadatas"] and results["metadatas"][0]:
-                sources = [meta.get("source", "unknown") for meta in results["metadatas"][0]]
+            sources_event = {
+                "type": "sources",
+                "sources": context.sources,
+                "chunks": [
+                    {key: metadata.get(key) for key in ("source", "chunk_index", "page", "page_end")}
+                    for metadata in retrieval.metadatas
+                ],
+                "context": context.summary()
+            }
+            if session is not None:
+                sources_event["session"] = {
+                    "session_id": session.session_id,
+                    "retrieval_skipped": reused_context is not None,
+                    "similarity": round(similarity, 4) if similarity is not None else None,
+                    "history_turns": len(history),
+                    "prompt_tokens": self._prompt_tokens(question, context, history)
+                }
+            yield sources_event
+            yield {"type": "timing", "stage": "retrieval", **timings}
             
-            # Create context from retrieved documents
-            context = "\n\n".join(relevant_docs) if relevant_docs else "No relevant context found."
+            # Stream response from the LLM backend, keeping the text for the cache
+            pieces = []
+            cacheable = self.llm is not None
+            generation_start = time.perf_counter()
+            stream = self._generate_response_stream(question, context.text or "No relevant context found.", history)
+            try:
+                async for chunk in stream:
+                    if chunk.get("type") == "content":
+                        if not pieces:
+                            stages["first_token"] = (time.perf_counter() - generation_start) * 1000
+                            yield {
+                                "type": "timing",
+                                "stage": "first_token",
+                                "generation_ms": round(stages["first_token"], 3),
+                                "total_ms": round((time.perf_counter() - start) * 1000, 3)
+                            }
+                        pieces.append(chunk["content"])
+                    elif chunk.get("type") == "error":
+                        cacheable = False
+                        metrics.ERRORS.labels("query_stream").inc()
+                    elif chunk.get("type") == "done":
+                        stages["generate"] = (time.perf_counter() - generation_start) * 1000
+                        stages["total"] = (time.perf_counter() - start) * 1000
+                        metrics.observe_stages("query_stream", stages)
+                        # Stream deltas are one token each from OpenAI-compatible servers
+                        self._count_usage("query_stream", retrieval, context, len(pieces))
+                        chunk = {**chunk, "pieces": len(pieces), "total_ms": round(stages["total"], 3),
+                                 **self._trace_fields(trace)}
+                        # Only finished answers become part of the conversation
+                        if session is not None:
+                            chunk["session"] = await self._save_turn(
+                                session, question, "".join(pieces).strip(), retrieval, context,
+                                reused_context is not None, similarity, history, cache_variant
+                            )
+                    yield chunk
+            finally:
+                # Closing early (client went away) cancels the upstream request
+                await stream.aclose()
             
-            # Stream response using OpenAI
-            async for chunk in self._generate_response_stream(question, context):
-                yield chunk
+            if self.answer_cache_enabled and use_answer_cache and cacheable and pieces:
+                self.answer_cache.store(
+                    retrieval.query_embedding, question, "".join(pieces).strip(), context.sources,
+                    retrieval.distances, n_results, cache_variant, terms=retrieval.terms
+                )
                 
         except Exception as e:
+            metrics.ERRORS.labels("query_stream").inc()
             logger.error(f"Error in streaming RAG query: {e}")
-            yield {"error": str(e)}
+            yield {"type": "error", "content": str(e)}
 
-    async def _generate_response(self, question: str, context: str) -> str:
-        """Generate response using OpenAI API"""
-        if not self.openai_api_key:
-            return f"""I can see you asked: "{question}"
+    async def query_batch(self, questions: List[str], n_results: int = 5, filters: Optional[RetrievalFilter] = None,
+                          options: Optional[RetrievalOptions] = None,
+                          concurrency: Optional[int] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Answer many questions, yielding each answer as soon as it is generated
 
-However, I need to be configured with a valid OpenAI API key to provide intelligent responses. 
+        Questions are retrieved a slice of query_batch_size at a time, each slice
+        with one encode call and one batched Chroma query, while the answers of
+        earlier slices are generated with at most concurrency LLM calls in flight.
+        Answers arrive out of order and carry the index of their question; a
+        failed question yields an error event and the rest carry on. A final done
+        event counts the answers and errors.
+        """
+        start = time.perf_counter()
+        options = options or self.retrieval_options
+        cache_variant = self._cache_variant(n_results, filters, options)
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.query_batch_concurrency))
+        finished: asyncio.Queue = asyncio.Queue()
+        answer_tasks: List[asyncio.Task] = []
+        
+        async def answer(index: int, retrieval: RetrievalResult):
+            question = questions[index]
+            try:
+                if retrieval.cached:
+                    event = {"response": retrieval.cached.response, "sources": retrieval.cached.sources, "cached": True}
+                else:
+                    async with semaphore:
+                        generation_start = time.perf_counter()
+                        context = self._build_context(retrieval)
+                        response, cacheable = await self._generate_response(
+                            question, context.text or "No relevant context found."
+                        )
+                        generate_ms = (time.perf_counter() - generation_start) * 1000
+                    metrics.observe_stages("query_batch", {"generate": generate_ms})
+                    if self.answer_cache_enabled and cacheable:
+                        self.answer_cache.store(
+                            retrieval.query_embedding, question, response, context.sources,
+                            retrieval.distances, n_results, cache_variant, terms=retrieval.terms
+                        )
+                    self._count_usage(
+                        "query_batch", retrieval, context, self.context_builder.counter.count(response) if cacheable else 0
+                    )
+                    event = {"response": response, "sources": context.sources, "cached": False,
+                             "generation_ms": round(generate_ms, 3)}
+                finished.put_nowait({
+                    "type": "answer", "index": index, "question": question, **event,
+                    "total_ms": round((time.perf_counter() - start) * 1000, 3)
+                })
+            except Exception as e:
+                metrics.ERRORS.labels("query_batch").inc()
+                logger.error(f"Error answering batch question {index}: {e}")
+                finished.put_nowait({"type": "error", "index": index, "question": question, "error": str(e)})
+        
+        async def retrieve_slices():
+            for offset in range(0, len(questions), self.query_batch_size):
+                batch = questions[offset:offset + self.query_batch_size]
+                # Questions before this index have an answer task, which reports them
+                scheduled = offset
+                try:
+                    retrievals = await self.retrieve_batch(batch, n_results, cache_variant, filters, options)
+                    metrics.observe_stages("query_batch", metrics.retrieval_stages(retrievals[0].timings) if retrievals else {})
+                    for i, retrieval in enumerate(retrievals):
+                        answer_tasks.append(asyncio.create_task(answer(offset + i, retrieval)))
+                        scheduled = offset + i + 1
+                except Exception as e:
+                    metrics.ERRORS.labels("query_batch").inc()
+                    logger.error(f"Error retrieving batch questions {offset}-{offset + len(batch) - 1}: {e}")
+                    # Every question must put one event on finished or the consumer waits forever
+                    for index in range(scheduled, offset + len(batch)):
+                        finished.put_nowait({"type": "error", "index": index, "question": questions[index], "error": str(e)})
+        
+        retriever = asyncio.create_task(retrieve_slices())
+        answered = errors = 0
+        try:
+            for _ in range(len(questions)):
+                event = await finished.get()
+                if event["type"] == "answer":
+                    answered += 1
+                else:
+                    errors += 1
+                yield event
+            total_ms = (time.perf_counter() - start) * 1000
+            metrics.observe_stages("query_batch", {"total": total_ms})
+            yield {"type": "done", "questions": len(questions), "answered": answered, "errors": errors,
+                   "total_ms": round(total_ms, 3)}
+        finally:
+            # Closing early (client went away) stops retrieval and any generation still running
+            for task in [retriever, *answer_tasks]:
+                task.cancel()
+            await asyncio.gather(retriever, *answer_tasks, return_exceptions=True)
 
-The context I found from the knowledge base is:
-{context}
+    async def _load_session(self, session_id: Optional[str]) -> Tuple[Optional[Session], List[SessionTurn]]:
+        """The session to add a turn to, new if it is unknown or expired, and the history its prompt carries"""
+        if session_id is None:
+            return None, []
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(None, self.session_store.get, session_id)
+        if session is None:
+            return Session(session_id), []
+        return session, session.history(self.session_history_max_tokens)
 
-To enable full AI functionality, please:
-1. Get an OpenAI API key from https://platform.openai.com/api-keys
-2. Update the OPENAI_API_KEY in the environment configuration
-3. Restart the application
+    async def _session_retrieve(self, session: Session, question: str, n_results: int, variant: str,
+                                use_answer_cache: bool, filters: Optional[RetrievalFilter],
+                                options: RetrievalOptions) -> Tuple[RetrievalResult, Optional[BuiltContext], Optional[float]]:
+        """Retrieve for a session turn, or reuse the chunks and context of the session's last retrieval
 
-For now, I can only show you the relevant context from uploaded documents."""
+        They are reused when that retrieval had the same variant, no document has
+        changed since, and the question is at least session_reuse_similarity
+        close to the one it was made for. Reuse does not move that anchor, so a
+        drifting conversation retrieves again. Returns the retrieval, the reused
+        context (None when retrieved afresh) and the similarity to the anchor.
+        """
+        start = time.perf_counter()
+        query_embedding = await self._embed_query(question)
+        embedding_ms = (time.perf_counter() - start) * 1000
+        previous = session.retrieval
+        similarity = None
+        if previous is not None and previous.variant == variant and previous.last_change == self.last_change:
+            pair = normalize_rows([query_embedding, previous.query_embedding])
+            similarity = float(pair[0] @ pair[1])
+            if similarity >= self.session_reuse_similarity:
+                retrieval = RetrievalResult(
+                    query_embedding=query_embedding,
+                    ids=list(previous.ids),
+                    metadatas=[dict(chunk) for chunk in previous.chunks],
+                    distances=list(previous.distances),
+                    terms=list(previous.terms),
+                    timings={"embedding_ms": embedding_ms, "retrieval_ms": (time.perf_counter() - start) * 1000}
+                )
+                summary = previous.context_summary
+                context = BuiltContext(
+                    text=previous.context_text,
+                    sources=list(previous.context_sources),
+                    passages=[],
+                    tokens=summary["context_tokens"],
+                    raw_tokens=summary["raw_tokens"],
+                    chunks_used=summary["chunks_used"],
+                    chunks_merged=summary["chunks_merged"],
+                    chunks_dropped=summary["chunks_dropped"],
+                    truncated=summary["truncated"]
+                )
+                return retrieval, context, similarity
+        
+        retrieval = await self.retrieve(
+            question, n_results, variant if use_answer_cache else None, filters, options, query_embedding=query_embedding
+        )
+        # The query was embedded before retrieval started, so its stages count from here
+        for key in ("embedding_ms", "dense_ms", "retrieval_ms"):
+            if key in retrieval.timings:
+                retrieval.timings[key] += embedding_ms
+        return retrieval, None, similarity
 
-        try:
-            prompt = f"""You are a helpful AI assistant with access to a knowledge base. 
-            Use the following context to answer the user's question. If the context doesn't contain 
-            relevant information, say so and provide a helpful response based on your general knowledge.
+    def _prompt_tokens(self, question: str, context: BuiltContext, history: Sequence[SessionTurn]) -> int:
+        """Prompt tokens of a turn from counts kept with the context and the history, without recounting either"""
+        return (self.prompt_overhead_tokens + sum(turn.tokens for turn in history) + context.tokens
+                + self.context_builder.counter.count(question))
 
-            Context:
-            {context}
+    async def _save_turn(self, session: Session, question: str, answer: str, retrieval: RetrievalResult,
+                         context: Optional[BuiltContext], reused: bool, similarity: Optional[float],
+                         history: Sequence[SessionTurn], variant: str) -> Dict[str, Any]:
+        """Add a turn to its session, keep a fresh retrieval for follow-ups and report what the turn cost
 
-            Question: {question}
+        context is None when the answer came from the answer cache and no prompt was sent.
+        """
+        counter = self.context_builder.counter
+        history_tokens = sum(turn.tokens for turn in history)
+        prompt_tokens = 0
+        if context is not None:
+            prompt_tokens = self._prompt_tokens(question, context, history)
+            if not reused:
+                session.retrieval = SessionRetrieval(
+                    query_embedding=np.asarray(retrieval.query_embedding, dtype=np.float32).tolist(),
+                    variant=variant,
+                    last_change=self.last_change,
+                    ids=list(retrieval.ids),
+                    distances=[float(distance) for distance in retrieval.distances],
+                    terms=list(retrieval.terms),
+                    chunks=[
+                        {key: metadata.get(key) for key in ("source", "chunk_index", "page", "page_end")}
+                        for metadata in retrieval.metadatas
+                    ],
+                    context_text=context.text,
+                    context_sources=list(context.sources),
+                    context_summary=context.summary()
+                )
+            metrics.TOKENS.labels("history").inc(history_tokens)
+        
+        session.add_turn(SessionTurn(
+            question=question,
+            answer=answer,
+            tokens=counter.count(question) + counter.count(answer),
+            prompt_tokens=prompt_tokens,
+            retrieval_skipped=reused
+        ), self.session_max_turns)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.session_store.put, session)
+        
+        self.session_turns += 1
+        self.session_retrieval_skips += int(reused)
+        metrics.SESSION_TURNS.labels("reused" if reused else "retrieved").inc()
+        return {
+            "session_id": session.session_id,
+            "turn": session.turn_count,
+            "retrieval_skipped": reused,
+            "similarity": round(similarity, 4) if similarity is not None else None,
+            "history_turns": len(history),
+            "history_tokens": history_tokens,
+            "context_tokens": context.tokens if context is not None else 0,
+            "prompt_tokens": prompt_tokens,
+            "retrieval_skips": session.retrieval_skips
+        }
 
-            Answer:"""
+    async def get_session(self, session_id: str) -> Optional[Session]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.session_store.get, session_id)
 
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return f"I apologize, but I encountered an error while generating a response: {str(e)}"
+    async def delete_session(self, session_id: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.session_store.delete, session_id)
+
+    def _build_context(self, retrieval: RetrievalResult) -> BuiltContext:
+        """Merge overlapping chunks and pack them into the prompt token budget"""
+        context = self.context_builder.build(retrieval.documents, retrieval.metadatas)
+        logger.info(
+            f"Context: {context.tokens} tokens from {context.chunks_used}/{len(retrieval.documents)} chunks "
+            f"({context.chunks_merged} merged), {context.tokens_saved} tokens saved"
+        )
+        return context
 
-    async def _generate_response_stream(self, question: str, context: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """Stream response using OpenAI API"""
-        if not self.openai_api_key:
-            yield {
-                "type": "content",
-                "content": f"""I can see you asked: "{question}"
+    @staticmethod
+    def _cache_variant(n_results: int, filters: Optional[RetrievalFilter],
+                       options: Optional[RetrievalOptions] = None) -> str:
+        """Answers are only reused for the same result count, retrieval scope and selection"""
+        variant = f"n={n_results}"
+        if filters is not None and not filters.is_empty():
+            variant += f";{filters.cache_key()}"
+        if options is not None and options.cache_key():
+            variant += f";{options.cache_key()}"
+        return variant
 
-However, I need to be configured with a valid OpenAI API key to provide intelligent responses.
+    @staticmethod
+    def _replay_chunks(text: str, words_per_chunk: int = 4) -> List[str]:
+        """Split a cached answer into stream-sized pieces"""
+        words = text.split(" ")
+        return [
+            " ".join(words[i:i + words_per_chunk]) + (" " if i + words_per_chunk < len(words) else "")
+            for i in range(0, len(words), words_per_chunk)
+        ]
+
+    @staticmethod
+    def _unconfigured_response(question: str, context: str) -> str:
+        return f"""I can see you asked: "{question}"
+
+However, I need to be configured with a valid OpenAI API key to provide intelligent responses. 
 
 The context I found from the knowledge base is:
 {context}
@@ -227,12 +1662,10 @@ To enable full AI functionality, please:
 3. Restart the application
 
 For now, I can only show you the relevant context from uploaded documents."""
-            }
-            yield {"type": "done"}
-            return
 
-        try:
-            prompt = f"""You are a helpful AI assistant with access to a knowledge base. 
+    @staticmethod
+    def _build_messages(question: str, context: str, history: Sequence[SessionTurn] = ()) -> List[Dict[str, str]]:
+        prompt = f"""You are a helpful AI assistant with access to a knowledge base. 
             Use the following context to answer the user's question. If the context doesn't contain 
             relevant information, say so and provide a helpful response based on your general knowledge.
 
@@ -242,24 +1675,46 @@ For now, I can only show you the relevant context from uploaded documents."""
             Question: {question}
 
             Answer:"""
+        messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
+        # Earlier turns are plain questions and answers without their context, so each turn
+        # only appends to the prompt and a server-side prefix cache can reuse the rest
+        for turn in history:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+        messages.append({"role": "user", "content": prompt})
+        return messages
 
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7,
-                stream=True
-            )
+    async def _generate_response(self, question: str, context: str,
+                                 history: Sequence[SessionTurn] = ()) -> Tuple[str, bool]:
+        """Generate response using the LLM backend; the flag says whether it may be cached"""
+        if not self.llm:
+            return self._unconfigured_response(question, context), False
+
+        try:
+            response = await self.llm.complete(self._build_messages(question, context, history))
+            return response, True
             
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield {
-                        "type": "content",
-                        "content": chunk.choices[0].delta.content
-                    }
+        except Exception as e:
+            metrics.ERRORS.labels("query").inc()
+            logger.error(f"Error generating response: {e}")
+            return f"I apologize, but I encountered an error while generating a response: {str(e)}", False
+
+    async def _generate_response_stream(self, question: str, context: str,
+                                        history: Sequence[SessionTurn] = ()) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream response using the LLM backend"""
+        if not self.llm:
+            yield {"type": "content", "content": self._unconfigured_response(question, context)}
+            yield {"type": "done"}
+            return
+
+        try:
+            stream = self.llm.stream(self._build_messages(question, context, history))
+            try:
+                async for piece in stream:
+                    yield {"type": "content", "content": piece}
+            finally:
+                # Closing the backend stream aborts the completion if it is still running
+                await stream.aclose()
             
             yield {"type": "done"}
             
@@ -273,8 +1728,45 @@ For now, I can only show you the relevant context from uploaded documents."""
             count = self.collection.count()
             return {
                 "total_documents": count,
-                "collection_name": self.collection.name
+                "collection_name": self.collection.name,
+                "embedding_batcher": self.embedding_batcher.get_stats(),
+                "embedding_cache": self.embedding_cache.get_stats(),
+                "answer_cache": self.answer_cache.get_stats(),
+                "bm25_index": self.bm25_index.get_stats(),
+                "sources": self.source_catalog.get_stats(),
+                "source_vectors": self.source_vectors.get_stats(),
+                "vector_index": self.vector_index.get_stats() if self.vector_index is not None else None,
+                "retrieval_latency": self.retrieval_latency.get_stats(),
+                "context": self.context_builder.get_stats(),
+                "sessions": {
+                    **self.session_store.get_stats(),
+                    "turns": self.session_turns,
+                    "retrieval_skips": self.session_retrieval_skips
+                },
+                "embedding_engine": self.embedding_model.get_stats(),
+                "sync": {
+                    "worker_id": self.worker_id,
+                    "last_change": self.last_change,
+                    "synced_changes": self.synced_changes,
+                    "full_resyncs": self.full_resyncs
+                },
+                "reranker": self.reranker.get_stats(),
+                "llm": self.llm.get_stats() if self.llm else None
             }
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
             return {"error": str(e)}
+
+    async def close(self):
+        """Release the HTTP connection pool and executors"""
+        if self._sync_task:
+            self._sync_task.cancel()
+        await self.embedding_batcher.close()
+        if self.llm:
+            await self.llm.close()
+        if self.hybrid_search_enabled:
+            self.bm25_index.save()
+        self.embedding_executor.shutdown(wait=False)
+        self.vector_store.shutdown()
+        self.document_store.close()
+        self.session_store.close()
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("similarity", "mmr")
+
+@dataclass
+class RetrievalOptions:
+    """How candidates are selected after retrieval: plain similarity or MMR, optionally reranked first"""
+    mode: str = "similarity"
+    rerank: bool = False
+    # Trade-off between relevance (1.0) and diversity (0.0)
+    mmr_lambda: float = 0.5
+    # Candidates fetched for MMR and reranking to choose from
+    candidates: int = 20
+
+    @classmethod
+    def from_env(cls) -> "RetrievalOptions":
+        return cls(
+            mode=os.getenv("RETRIEVAL_MODE", "similarity"),
+            rerank=os.getenv("RERANK_ENABLED", "false").lower() == "true",
+            mmr_lambda=float(os.getenv("MMR_LAMBDA", "0.5")),
+            candidates=int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+        )
+
+    def __post_init__(self):
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{self.mode}', expected one of {list(RETRIEVAL_MODES)}")
+
+    @property
+    def expands_candidates(self) -> bool:
+        return self.mode == "mmr" or self.rerank
+
+    def cache_key(self) -> str:
+        """Stable text form, so answers are only reused for the same selection"""
+        if not self.expands_candidates:
+            return ""
+        parts = [f"mode={self.mode}", f"candidates={self.candidates}"]
+        if self.mode == "mmr":
+            parts.append(f"lambda={self.mmr_lambda}")
+        if self.rerank:
+            parts.append("rerank")
+        return ",".join(parts)
+
+def mmr(relevance: np.ndarray, embeddings: np.ndarray, k: int, mmr_lambda: float = 0.5,
+        duplicate_threshold: float = 1.0) -> List[int]:
+    """Maximal marginal relevance over candidates; returns the selected row indexes in order
+
+    relevance holds each candidate's score against the query and embeddings
+    their unit vectors. Candidates at least duplicate_threshold similar to an
+    already selected one are never picked, so fewer than k may be returned.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    similarity = embeddings @ embeddings.T
+    # Highest similarity of every candidate to anything selected so far
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    while len(selected) < k and available.any():
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * np.where(np.isinf(redundancy), 0.0, redundancy)
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        available &= redundancy < duplicate_threshold
+    return selected
+
+def normalize_rows(vectors: List[List[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 16,
+                 max_candidates: int = 20, max_length: int = 512):
+        """Scores (question, chunk) pairs with a CPU cross-encoder, loaded on first use"""
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_candidates = max_candidates
+        self.max_length = max_length
+        self._model = None
+        self._load_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.calls = 0
+        self.pairs_scored = 0
+
+    @property
+    def available(self) -> bool:
+        return self._load_error is None
+
+    def _load(self):
+        with self._lock:
+            if self._model is None and self._load_error is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                    logger.info(f"Loaded reranker {self.model_name}")
+                except Exception as e:
+                    # Reranking is optional; requests fall back to the unreranked order
+                    self._load_error = str(e)
+                    logger.error(f"Failed to load reranker {self.model_name}: {e}")
+        return self._model
+
+    def score(self, question: str, documents: List[str]) -> Optional[np.ndarray]:
+        """Relevance score per document, or None when the model cannot be loaded"""
+        model = self._load()
+        if model is None:
+            return None
+        scores = model.predict(
+            [(question, document) for document in documents],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
+        self.calls += 1
+        self.pairs_scored += len(documents)
+        return np.asarray(scores, dtype=np.float32)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "error": self._load_error,
+            "max_candidates": self.max_candidates,
+            "batch_size": self.batch_size,
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored
+        }
@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RetrievalFilter:
+    """Restricts retrieval to a set of documents, document types or an upload-time range"""
+    sources: Optional[List[str]] = None
+    doc_types: Optional[List[str]] = None
+    uploaded_after: Optional[float] = None
+    uploaded_before: Optional[float] = None
+
+    def is_empty(self) -> bool:
+        return (self.sources is None and self.doc_types is None
+                and self.uploaded_after is None and self.uploaded_before is None)
+
+    def cache_key(self) -> str:
+        """Stable text form, so answers are only reused within the same scope"""
+        parts = []
+        if self.sources is not None:
+            parts.append(f"sources={','.join(sorted(self.sources))}")
+        if self.doc_types is not None:
+            parts.append(f"types={','.join(sorted(self.doc_types))}")
+        if self.uploaded_after is not None:
+            parts.append(f"after={self.uploaded_after}")
+        if self.uploaded_before is not None:
+            parts.append(f"before={self.uploaded_before}")
+        return ";".join(parts)
+
+def source_filter(scope: Dict[str, int]) -> Dict[str, Any]:
+    """ChromaDB metadata filter for the sources a filter resolved to; upload times are only current in the catalog"""
+    return {"source": {"$in": list(scope)}}
+
+def doc_type_of(source: str) -> str:
+    """Document type derived from the file extension"""
+    extension = os.path.splitext(source)[1].lower().lstrip(".")
+    return extension or "unknown"
+
+@dataclass
+class SourceEntry:
+    doc_type: str
+    uploaded_at: Optional[float]
+    chunk_ids: Set[str] = field(default_factory=set)
+
+class SourceCatalog:
+    def __init__(self, max_cached_scopes: int = 64):
+        """Document-level metadata and chunk ids per source, used to resolve filters in memory"""
+        self._sources: Dict[str, SourceEntry] = {}
+        self._lock = threading.Lock()
+        # Chunk ids in scope per filter cache key, dropped whenever a source changes
+        self.max_cached_scopes = max_cached_scopes
+        self._scope_ids: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+
+        # Counters
+        self.scope_hits = 0
+        self.scope_misses = 0
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def add_chunk(self, chunk_id: str, metadata: Dict[str, Any]):
+        """Register a chunk loaded from the collection"""
+        source = metadata.get("source", "unknown")
+        with self._lock:
+            entry = self._sources.get(source)
+            if entry is None:
+                entry = SourceEntry(
+                    doc_type=metadata.get("doc_type") or doc_type_of(source),
+                    uploaded_at=metadata.get("uploaded_at")
+                )
+                self._sources[source] = entry
+                self._scope_ids.clear()
+            elif (metadata.get("uploaded_at") or 0.0) > (entry.uploaded_at or 0.0):
+                # Chunks an update left unchanged keep the upload time they were written with
+                entry.uploaded_at = metadata["uploaded_at"]
+            entry.chunk_ids.add(chunk_id)
+            self._scope_ids.clear()
+
+    def set_source(self, source: str, chunk_ids: Set[str], doc_type: str, uploaded_at: Optional[float]):
+        with self._lock:
+            self._sources[source] = SourceEntry(doc_type=doc_type, uploaded_at=uploaded_at, chunk_ids=set(chunk_ids))
+            self._scope_ids.clear()
+
+    def remove_source(self, source: str):
+        with self._lock:
+            self._sources.pop(source, None)
+            self._scope_ids.clear()
+
+    def resolve(self, scope: RetrievalFilter) -> Dict[str, int]:
+        """Sources matching a filter, with their chunk counts"""
+        with self._lock:
+            return self._resolve(scope)
+
+    def scope_chunk_ids(self, scope: RetrievalFilter) -> FrozenSet[str]:
+        """Chunk ids of every source matching a filter, built once per filter until a source changes"""
+        key = scope.cache_key()
+        with self._lock:
+            ids = self._scope_ids.get(key)
+            if ids is not None:
+                self._scope_ids.move_to_end(key)
+                self.scope_hits += 1
+                return ids
+            self.scope_misses += 1
+            ids = frozenset(
+                chunk_id for source in self._resolve(scope) for chunk_id in self._sources[source].chunk_ids
+            )
+            self._scope_ids[key] = ids
+            while len(self._scope_ids) > self.max_cached_scopes:
+                self._scope_ids.popitem(last=False)
+            return ids
+
+    def _resolve(self, scope: RetrievalFilter) -> Dict[str, int]:
+        sources = set(scope.sources) if scope.sources is not None else None
+        doc_types = set(scope.doc_types) if scope.doc_types is not None else None
+        matched = {}
+        candidates = (
+            ((source, self._sources[source]) for source in sources if source in self._sources)
+            if sources is not None else self._sources.items()
+        )
+        for source, entry in candidates:
+            if doc_types is not None and entry.doc_type not in doc_types:
+                continue
+            if scope.uploaded_after is not None and (entry.uploaded_at is None or entry.uploaded_at < scope.uploaded_after):
+                continue
+            if scope.uploaded_before is not None and (entry.uploaded_at is None or entry.uploaded_at > scope.uploaded_before):
+                continue
+            matched[source] = len(entry.chunk_ids)
+        return matched
+
+    def chunk_ids(self, sources: List[str]) -> Set[str]:
+        with self._lock:
+            ids = set()
+            for source in sources:
+                entry = self._sources.get(source)
+                if entry:
+                    ids.update(entry.chunk_ids)
+            return ids
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "sources": len(self._sources),
+            "cached_scopes": len(self._scope_ids),
+            "scope_hits": self.scope_hits,
+            "scope_misses": self.scope_misses
+        }
+
+class SourceVectorCache:
+    def __init__(self, max_chunks: int = 100000):
+        """LRU of per-source normalized embedding matrices for exact search inside a filter"""
+        self.max_chunks = max_chunks
+        self._entries: "OrderedDict[str, Tuple[List[str], np.ndarray]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sources: List[str]) -> Tuple[Dict[str, Tuple[List[str], np.ndarray]], List[str]]:
+        """Cached matrices for the given sources, and the sources that must be loaded"""
+        found, missing = {}, []
+        with self._lock:
+            for source in sources:
+                entry = self._entries.get(source)
+                if entry is None:
+                    missing.append(source)
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(source)
+                    found[source] = entry
+                    self.hits += 1
+        return found, missing
+
+    def put(self, source: str, ids: List[str], embeddings) -> Tuple[List[str], np.ndarray]:
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        entry = (list(ids), matrix)
+        with self._lock:
+            previous = self._entries.pop(source, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[source] = entry
+            self._size += len(ids)
+            while self._size > self.max_chunks and len(self._entries) > 1:
+                _, (evicted_ids, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted_ids)
+        return entry
+
+    def invalidate(self, source: str):
+        with self._lock:
+            entry = self._entries.pop(source, None)
+            if entry is not None:
+                self._size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @staticmethod
+    def search(query_embedding, entries: List[Tuple[List[str], np.ndarray]], k: int) -> List[Tuple[str, float]]:
+        """Exact cosine search over the given matrices; returns (chunk id, cosine distance)"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        ids, scores = [], []
+        for entry_ids, matrix in entries:
+            ids.extend(entry_ids)
+            scores.append(matrix @ query)
+        if not ids:
+            return []
+        similarities = np.concatenate(scores)
+        if len(similarities) > k:
+            top = np.argpartition(-similarities, k)[:k]
+        else:
+            top = np.arange(len(similarities))
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(ids[i], float(1.0 - similarities[i])) for i in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sources": len(self._entries),
+            "chunks": self._size,
+            "max_chunks": self.max_chunks,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
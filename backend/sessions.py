@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SessionTurn:
+    question: str
+    answer: str
+    # Tokens of the question and answer as history messages, counted once when the turn is added
+    tokens: int
+    prompt_tokens: int
+    retrieval_skipped: bool
+    created_at: float = field(default_factory=time.time)
+
+@dataclass
+class SessionRetrieval:
+    """Chunks retrieved for a session turn and the context built from them, reused by close follow-ups"""
+    query_embedding: List[float]
+    # Answer cache variant (result count, filters, selection) and collection change the chunks were retrieved at
+    variant: str
+    last_change: int
+    ids: List[str]
+    distances: List[float]
+    terms: List[str]
+    chunks: List[Dict[str, Any]]
+    context_text: str
+    context_sources: List[str]
+    context_summary: Dict[str, Any]
+
+@dataclass
+class Session:
+    session_id: str
+    turns: List[SessionTurn] = field(default_factory=list)
+    retrieval: Optional[SessionRetrieval] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    # Totals over every turn, including those dropped from the history
+    turn_count: int = 0
+    retrieval_skips: int = 0
+    prompt_tokens: int = 0
+
+    def history(self, max_tokens: int) -> List[SessionTurn]:
+        """Most recent turns whose questions and answers fit in max_tokens, oldest first"""
+        kept, tokens = [], 0
+        for turn in reversed(self.turns):
+            if tokens + turn.tokens > max_tokens:
+                break
+            kept.append(turn)
+            tokens += turn.tokens
+        return kept[::-1]
+
+    def add_turn(self, turn: SessionTurn, max_turns: int):
+        self.turns.append(turn)
+        del self.turns[:-max_turns]
+        self.turn_count += 1
+        self.retrieval_skips += int(turn.retrieval_skipped)
+        self.prompt_tokens += turn.prompt_tokens
+        self.updated_at = turn.created_at
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "turns": self.turn_count,
+            "history_turns": len(self.turns),
+            "retrieval_skips": self.retrieval_skips,
+            "prompt_tokens": self.prompt_tokens,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Session":
+        data = dict(data)
+        data["turns"] = [SessionTurn(**turn) for turn in data.get("turns", [])]
+        data["retrieval"] = SessionRetrieval(**data["retrieval"]) if data.get("retrieval") else None
+        return cls(**data)
+
+class SessionStore:
+    """Where conversation sessions are kept between turns"""
+    name = "base"
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """The session, unless it is unknown or idle for longer than the TTL"""
+        raise NotImplementedError
+
+    def put(self, session: Session):
+        """Save a session after a turn, evicting the least recently used beyond max_sessions"""
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        """Release resources held by the store"""
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl_seconds > 0 and updated_at < time.time() - self.ttl_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class MemorySessionStore(SessionStore):
+    """Sessions in process memory, least recently used first out; lost on restart and not shared by workers"""
+    name = "memory"
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 1800):
+        super().__init__(max_sessions, ttl_seconds)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self._expired(session.updated_at):
+                del self._sessions[session_id]
+                self.expirations += 1
+                session = None
+            if session is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return session
+
+    def put(self, session: Session):
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            # Idle sessions at the front go first, whether expired or just least recently used
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if self._expired(oldest.updated_at):
+                    self.expirations += 1
+                elif len(self._sessions) > self.max_sessions:
+                    self.evictions += 1
+                else:
+                    break
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions as JSON rows in SQLite; they survive restarts and every worker process sees them"""
+    name = "sqlite"
+
+    def __init__(self, db_path: str, max_sessions: int = 1000, ttl_seconds: float = 1800,
+                 prune_interval: int = 100):
+        super().__init__(max_sessions, ttl_seconds)
+        self.db_path = db_path
+        # Expired and excess sessions are deleted every prune_interval saves rather than on each one
+        self.prune_interval = prune_interval
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with file_lock(db_path + ".lock"):
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+            self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and self._expired(row[1]):
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return Session.from_dict(json.loads(row[0]))
+
+    def put(self, session: Session):
+        data = json.dumps(session.to_dict())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (session.session_id, data, session.updated_at)
+            )
+            self._puts += 1
+            if self._puts % self.prune_interval == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        if self.ttl_seconds > 0:
+            self.expirations += self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+        self.evictions += self._conn.execute(
+            "DELETE FROM sessions WHERE session_id IN "
+            "(SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        ).rowcount
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_session_store(default_directory: str) -> SessionStore:
+    """Build the store selected by SESSION_STORE"""
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    options = {
+        "max_sessions": int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+        "ttl_seconds": float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+    }
+    if backend == "memory":
+        return MemorySessionStore(**options)
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("SESSION_STORE_PATH", os.path.join(default_directory, "sessions.db")),
+            **options
+        )
+    raise ValueError(f"Unknown SESSION_STORE: {backend}")
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Dict
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+logger = logging.getLogger(__name__)
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Encode an event as a Server-Sent Events message named after its type"""
+    name = event.get("type", "error" if "error" in event else "message")
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]],
+                     heartbeat_interval: float = 15.0) -> AsyncGenerator[str, None]:
+    """Serialize events as SSE, sending comment heartbeats while the source is idle
+
+    When this generator is closed early, the pending step of the event source
+    is cancelled, which unwinds the source and cancels any upstream request it
+    holds.
+    """
+    iterator = events.__aiter__()
+    next_event = asyncio.ensure_future(iterator.__anext__())
+    try:
+        # Tell the client how long to wait before reconnecting
+        yield "retry: 3000\n\n"
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=heartbeat_interval)
+            if not done:
+                yield ": heartbeat\n\n"
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                break
+            yield format_event(event)
+            next_event = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if next_event.done():
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        else:
+            # Cancelling the pending step unwinds the source, which closes what it holds.
+            # asyncio.wait does not forward a second cancellation of this task into
+            # that cleanup, unlike awaiting the step directly
+            next_event.cancel()
+            next_event.add_done_callback(_consume_result)
+            await asyncio.wait({next_event})
+
+def _consume_result(task: asyncio.Future):
+    if not task.cancelled() and task.exception() and not isinstance(task.exception(), StopAsyncIteration):
+        logger.error(f"Error while cancelling event stream: {task.exception()}")
+
+async def ndjson_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncGenerator[str, None]:
+    """Serialize events as newline-delimited JSON, closing the source when this generator is closed"""
+    iterator = events.__aiter__()
+    try:
+        async for event in iterator:
+            yield json.dumps(event) + "\n"
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+class EventSourceResponse(StreamingResponse):
+    media_type = "text/event-stream"
+
+    def __init__(self, content, **kwargs):
+        """Streaming response that closes its event source when the client disconnects"""
+        headers = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+        headers.update(kwargs.pop("headers", None) or {})
+        super().__init__(content, headers=headers, **kwargs)
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            # Starlette cancels this task on disconnect but leaves the body iterator
+            # suspended until garbage collection; close it now so upstream work stops
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+class NDJSONResponse(EventSourceResponse):
+    """Newline-delimited JSON stream, closed the same way when the client disconnects"""
+    media_type = "application/x-ndjson"
@@ -0,0 +1,44 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Set when the app module starts importing, as close to process start as the app can see
+PROCESS_START = time.perf_counter()
+
+class StartupState:
+    def __init__(self, mode: str = "background"):
+        """Tracks service initialization so liveness and readiness can be reported separately"""
+        self.mode = mode
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    def mark(self, name: str, since: float = PROCESS_START):
+        """Record the time from since (default: process start) until now"""
+        self.timings[f"{name}_ms"] = round((time.perf_counter() - since) * 1000, 1)
+
+    def set_ready(self, phase_timings: Optional[Dict[str, float]] = None):
+        for name, elapsed in (phase_timings or {}).items():
+            self.timings[name] = round(elapsed, 1)
+        self.mark("ready")
+        self.phase = "ready"
+        logger.info(f"Ready after {self.timings['ready_ms']:.0f} ms ({self.mode} startup)")
+
+    def set_failed(self, error: Exception):
+        self.phase = "failed"
+        self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "timings": self.timings
+        }
@@ -0,0 +1,404 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import admission
+from admission import AdmissionPool, AdmissionRejected, RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", fake.monotonic)
+    return fake
+
+async def settle():
+    """Let every task that is ready run until it blocks"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+# Rate limiter
+
+def test_rate_limiter_allows_a_burst_then_limits(clock):
+    limiter = RateLimiter("chat", rate=1.0, burst=3)
+    for _ in range(3):
+        limiter.check("client")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check("client")
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == 1
+    assert limiter.get_stats()["allowed"] == 3
+    assert limiter.get_stats()["limited"] == 1
+
+def test_rate_limiter_refills_at_its_rate(clock):
+    limiter = RateLimiter("chat", rate=2.0, burst=2)
+    limiter.check("client")
+    limiter.check("client")
+
+    clock.now += 0.5
+    limiter.check("client")
+    with pytest.raises(AdmissionRejected):
+        limiter.check("client")
+
+    # A long pause refills only up to the burst
+    clock.now += 60
+    limiter.check("client")
+    limiter.check("client")
+    with pytest.raises(AdmissionRejected):
+        limiter.check("client")
+
+def test_rate_limiter_retry_after_covers_the_cost(clock):
+    limiter = RateLimiter("upload", rate=0.25, burst=1)
+    limiter.check("client")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check("client")
+    assert rejected.value.retry_after == 4
+
+def test_rate_limiter_keeps_clients_apart(clock):
+    limiter = RateLimiter("chat", rate=1.0, burst=1)
+    limiter.check("a")
+    limiter.check("b")
+    with pytest.raises(AdmissionRejected):
+        limiter.check("a")
+
+def test_rate_limiter_forgets_the_least_recent_clients(clock):
+    limiter = RateLimiter("chat", rate=1.0, burst=1, max_clients=2)
+    limiter.check("a")
+    limiter.check("b")
+    limiter.check("c")
+
+    assert limiter.get_stats()["clients"] == 2
+    # a was forgotten, so it starts again with a full bucket
+    limiter.check("a")
+
+def test_rate_limiter_rate_zero_disables_the_limit(clock):
+    limiter = RateLimiter("chat", rate=0, burst=1)
+    for _ in range(100):
+        limiter.check("client")
+    assert limiter.get_stats()["limited"] == 0
+
+# Pool
+
+def test_pool_admits_up_to_max_concurrent_then_queues_in_order():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=2, max_queued=2)
+        await pool.acquire()
+        await pool.acquire()
+        admitted = []
+
+        async def wait(tag):
+            await pool.acquire()
+            admitted.append(tag)
+
+        first = asyncio.create_task(wait("first"))
+        await settle()
+        second = asyncio.create_task(wait("second"))
+        await settle()
+        assert (pool.active, pool.queued) == (2, 2)
+
+        pool.release()
+        await settle()
+        assert admitted == ["first"]
+        assert (pool.active, pool.queued) == (2, 1)
+
+        pool.release()
+        await asyncio.gather(first, second)
+        assert admitted == ["first", "second"]
+        assert (pool.active, pool.queued) == (2, 0)
+        pool.release()
+        pool.release()
+        assert pool.active == 0
+        assert pool.get_stats()["admitted"] == 4
+
+    asyncio.run(scenario())
+
+def test_pool_sheds_when_the_queue_is_full():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1, max_queued=1, retry_after=2.5)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            pool.check()
+        with pytest.raises(AdmissionRejected):
+            await pool.acquire()
+        assert rejected.value.status_code == 503
+        assert rejected.value.retry_after == 3
+        assert pool.get_stats()["shed"] == 2
+
+        pool.release()
+        await waiter
+        pool.release()
+        pool.check()
+
+    asyncio.run(scenario())
+
+def test_pool_without_max_queued_never_sheds():
+    async def scenario():
+        pool = AdmissionPool("ingest", max_concurrent=1)
+        await pool.acquire()
+        waiters = [asyncio.create_task(pool.acquire()) for _ in range(10)]
+        await settle()
+        pool.check()
+        assert pool.queued == 10
+
+        for waiter in waiters:
+            pool.release()
+            await waiter
+        pool.release()
+        assert (pool.active, pool.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+def test_pool_queue_timeout_is_a_503_and_leaves_the_queue():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1, max_queued=5, queue_timeout=0.01)
+        await pool.acquire()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await pool.acquire()
+        assert rejected.value.status_code == 503
+        assert (pool.active, pool.queued) == (1, 0)
+        assert pool.get_stats()["timed_out"] == 1
+
+        pool.release()
+        assert pool.active == 0
+
+    asyncio.run(scenario())
+
+def test_pool_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1, max_queued=5)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert pool.queued == 0
+
+        pool.release()
+        assert pool.active == 0
+
+    asyncio.run(scenario())
+
+def test_pool_slot_handed_to_a_cancelled_waiter_is_released():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1, max_queued=5)
+        await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await settle()
+
+        # The slot is handed over, then the request goes away before it resumes
+        pool.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert (pool.active, pool.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+def test_pool_slot_releases_on_error():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1)
+        with pytest.raises(RuntimeError):
+            async with pool.slot():
+                assert pool.active == 1
+                raise RuntimeError("failed")
+        assert pool.active == 0
+
+    asyncio.run(scenario())
+
+# Guard
+
+async def collect(events):
+    return [event async for event in events]
+
+def test_guard_holds_a_slot_while_the_stream_runs():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1)
+        seen = []
+
+        async def stream():
+            seen.append(pool.active)
+            yield {"type": "token", "content": "a"}
+            seen.append(pool.active)
+            yield {"type": "done"}
+
+        events = await collect(pool.guard(stream()))
+        assert [event["type"] for event in events] == ["token", "done"]
+        assert seen == [1, 1]
+        assert pool.active == 0
+
+    asyncio.run(scenario())
+
+def test_guard_releases_when_the_client_goes_away():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1)
+        closed = []
+
+        async def stream():
+            try:
+                yield {"type": "token"}
+                yield {"type": "token"}
+            finally:
+                closed.append(True)
+
+        guarded = pool.guard(stream())
+        await guarded.__anext__()
+        assert pool.active == 1
+        await guarded.aclose()
+        assert pool.active == 0
+        assert closed == [True]
+
+    asyncio.run(scenario())
+
+def test_guard_yields_an_error_event_when_rejected():
+    async def scenario():
+        pool = AdmissionPool("query", max_concurrent=1, max_queued=5, queue_timeout=0.01, retry_after=2)
+        await pool.acquire()
+        closed = []
+
+        async def stream():
+            try:
+                yield {"type": "token"}
+            finally:
+                closed.append(True)
+
+        events = await collect(pool.guard(stream()))
+        assert len(events) == 1
+        assert events[0]["type"] == "error"
+        assert events[0]["retry_after"] == 2
+        assert pool.active == 1
+        # The stream never started, so there is nothing of it to close
+        assert closed == []
+
+    asyncio.run(scenario())
+
+# Yielding
+
+def test_pool_yields_while_a_pool_it_yields_to_has_waiters():
+    async def scenario():
+        query = AdmissionPool("query", max_concurrent=1, max_queued=5)
+        ingest = AdmissionPool("ingest", max_concurrent=1, yields_to=[query])
+        await query.acquire()
+        queued_chat = asyncio.create_task(query.acquire())
+        await settle()
+
+        ingesting = asyncio.create_task(ingest.acquire())
+        await settle()
+        assert not ingesting.done()
+        assert ingest.active == 0
+
+        # The chat takes the slot and nothing waits any more
+        query.release()
+        await queued_chat
+        await ingesting
+        assert ingest.active == 1
+        assert ingest.get_stats()["yielded"] == 1
+        assert ingest.get_stats()["yield_timeouts"] == 0
+
+    asyncio.run(scenario())
+
+def test_pool_yields_from_yield_at_active_requests():
+    async def scenario():
+        query = AdmissionPool("query", max_concurrent=10)
+        ingest = AdmissionPool("ingest", max_concurrent=1, yields_to=[query], yield_at=2)
+        await query.acquire()
+        await ingest.acquire()
+        ingest.release()
+
+        await query.acquire()
+        ingesting = asyncio.create_task(ingest.acquire())
+        await settle()
+        assert not ingesting.done()
+
+        query.release()
+        await ingesting
+        assert ingest.active == 1
+
+    asyncio.run(scenario())
+
+def test_pool_goes_ahead_after_yield_timeout():
+    async def scenario():
+        query = AdmissionPool("query", max_concurrent=10)
+        ingest = AdmissionPool("ingest", max_concurrent=1, yields_to=[query], yield_at=1, yield_timeout=0.01)
+        await query.acquire()
+
+        await asyncio.wait_for(ingest.acquire(), 1)
+        assert ingest.active == 1
+        assert ingest.get_stats()["yield_timeouts"] == 1
+
+    asyncio.run(scenario())
+
+def test_defer_waits_without_taking_a_slot():
+    async def scenario():
+        query = AdmissionPool("query", max_concurrent=10)
+        ingest = AdmissionPool("ingest", max_concurrent=1, yields_to=[query], yield_at=1)
+        await ingest.defer()
+
+        await query.acquire()
+        deferring = asyncio.create_task(ingest.defer())
+        await settle()
+        assert not deferring.done()
+
+        query.release()
+        await deferring
+        assert ingest.active == 0
+
+    asyncio.run(scenario())
+
+def test_pools_built_outside_a_loop_work_in_later_loops():
+    # As in main.py, which builds the controller at import, before uvicorn starts its loop
+    query = AdmissionPool("query", max_concurrent=10)
+    ingest = AdmissionPool("ingest", max_concurrent=1, yields_to=[query], yield_at=1)
+
+    async def scenario():
+        await query.acquire()
+        ingesting = asyncio.create_task(ingest.acquire())
+        await settle()
+        assert not ingesting.done()
+        query.release()
+        await ingesting
+        ingest.release()
+
+    asyncio.run(scenario())
+    asyncio.run(scenario())
+
+# Response
+
+def test_rejections_map_to_status_and_retry_after():
+    from main import admission_rejected
+
+    app = FastAPI()
+    app.add_exception_handler(AdmissionRejected, admission_rejected)
+
+    @app.get("/limited")
+    async def limited():
+        raise AdmissionRejected(429, "Too many chat requests, please slow down", 0.2)
+
+    @app.get("/busy")
+    async def busy():
+        raise AdmissionRejected(503, "Server is busy", 2.5)
+
+    client = TestClient(app)
+    response = client.get("/limited")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"detail": "Too many chat requests, please slow down"}
+
+    response = client.get("/busy")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
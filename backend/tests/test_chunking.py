@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from chunking import ChunkingStage, SentenceSplitter, split_text
+
+WORDS = ["valve", "pump", "torque", "sensor", "firmware", "bracket", "seal", "gauge", "relay", "filter"]
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(4, 12))]
+    return " ".join(words).capitalize() + rng.choice([".", "!", "?"])
+
+def make_pages(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    pages = []
+    for page in range(count):
+        if page == 3:
+            # Blank pages happen, and must not shift the page numbers after them
+            pages.append("")
+            continue
+        paragraphs = [" ".join(sentence(rng) for _ in range(rng.randint(2, 6))) for _ in range(rng.randint(1, 3))]
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+def stream(splitter, pages, batch_size: int):
+    stage = ChunkingStage(splitter)
+    chunks = []
+    for i in range(0, len(pages), batch_size):
+        chunks.extend(stage.feed(pages[i:i + batch_size]))
+    chunks.extend(stage.finish())
+    return stage, chunks
+
+def page_ranges(pages):
+    """Document offsets each page covers, with pages joined by a newline"""
+    ranges, offset = [], 0
+    for text in pages:
+        ranges.append((offset, offset + len(text)))
+        offset += len(text) + 1
+    return ranges
+
+@pytest.fixture
+def splitter():
+    return SentenceSplitter(chunk_size=200, chunk_overlap=50)
+
+@pytest.mark.parametrize("batch_size", [1, 2, 5, 100])
+def test_offsets_point_into_the_whole_document(splitter, batch_size):
+    pages = make_pages(20)
+    document = "\n".join(pages)
+    stage, chunks = stream(splitter, pages, batch_size)
+
+    assert chunks
+    assert stage.text_length == len(document)
+    assert [chunk.index for chunk in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert document[chunk.start:chunk.end] == chunk.text
+
+@pytest.mark.parametrize("batch_size", [1, 3, 100])
+def test_pages_contain_the_chunk_ends(splitter, batch_size):
+    pages = make_pages(20)
+    ranges = page_ranges(pages)
+    _, chunks = stream(splitter, pages, batch_size)
+
+    spanning = 0
+    for chunk in chunks:
+        first_start, first_end = ranges[chunk.page - 1]
+        last_start, last_end = ranges[chunk.page_end - 1]
+        assert first_start <= chunk.start < first_end
+        assert last_start < chunk.end <= last_end
+        assert chunk.page_end >= chunk.page
+        spanning += chunk.page_end > chunk.page
+    # The pages are shorter than a chunk, so some chunks must cross a page break
+    assert spanning
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_streaming_matches_chunking_the_whole_document(splitter, batch_size):
+    pages = make_pages(20, seed=1)
+    _, streamed = stream(splitter, pages, batch_size)
+    whole = split_text(splitter, "\n".join(pages))
+
+    assert [(chunk.start, chunk.end, chunk.text) for chunk in streamed] == \
+           [(chunk.start, chunk.end, chunk.text) for chunk in whole]
+
+def test_last_chunk_is_held_until_it_cannot_grow(splitter):
+    stage = ChunkingStage(splitter)
+    assert stage.feed(["Short first page."]) == []
+
+    chunks = stage.finish()
+    assert len(chunks) == 1
+    assert chunks[0].text == "Short first page."
+    assert (chunks[0].start, chunks[0].end) == (0, 17)
+    assert (chunks[0].page, chunks[0].page_end) == (1, 1)
+
+def test_whitespace_only_document_has_no_chunks(splitter):
+    _, chunks = stream(splitter, ["", "   ", "\n\n"], batch_size=1)
+    assert chunks == []
@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+
+from ingestion_jobs import IngestionJobQueue
+
+class FakeProcessor:
+    def __init__(self):
+        self.processed = []
+
+    async def process_file(self, path, filename, progress=None):
+        self.processed.append(filename)
+        return {}
+
+async def wait_for_status(queue: IngestionJobQueue, job_id: str, status: str, timeout: float = 5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while (await queue.get(job_id))["status"] != status:
+        assert loop.time() < deadline, f"job {job_id} never became {status}"
+        await asyncio.sleep(0.01)
+
+async def submit(queue: IngestionJobQueue, job_id: str, filename: str):
+    path = queue.spool_path(job_id)
+    with open(path, "wb") as f:
+        f.write(b"%PDF")
+    await queue.submit(job_id, path, filename)
+
+def test_worker_survives_store_errors(tmp_path):
+    async def scenario():
+        processor = FakeProcessor()
+        queue = IngestionJobQueue(processor, str(tmp_path), max_concurrent_jobs=1, poll_interval=0.01)
+        claim = queue.store.claim
+        failures = []
+
+        def locked_claim(owner):
+            if len(failures) < 3:
+                failures.append(owner)
+                raise sqlite3.OperationalError("database is locked")
+            return claim(owner)
+
+        queue.store.claim = locked_claim
+        await queue.start()
+        try:
+            await submit(queue, "first", "a.pdf")
+            await wait_for_status(queue, "first", "completed")
+            assert len(failures) == 3
+            assert processor.processed == ["a.pdf"]
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_jobs_for_the_same_file_run_one_at_a_time(tmp_path):
+    async def scenario():
+        running, overlaps = set(), []
+
+        class SlowProcessor:
+            async def process_file(self, path, filename, progress=None):
+                if filename in running:
+                    overlaps.append(filename)
+                running.add(filename)
+                await asyncio.sleep(0.05)
+                running.discard(filename)
+                return {}
+
+        queue = IngestionJobQueue(SlowProcessor(), str(tmp_path), max_concurrent_jobs=3, poll_interval=0.01)
+        await queue.start()
+        try:
+            await submit(queue, "first", "a.pdf")
+            await submit(queue, "second", "a.pdf")
+            await submit(queue, "other", "b.pdf")
+            for job_id in ("first", "second", "other"):
+                await wait_for_status(queue, job_id, "completed")
+            assert overlaps == []
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
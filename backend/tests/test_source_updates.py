@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import re
+
+import numpy as np
+import pytest
+
+from chunking import Chunk
+from rag_pipeline import RAGPipeline
+from scoped_search import RetrievalFilter
+
+SOURCE = "manual.pdf"
+
+class HashedEmbedding:
+    """Bag of hashed words, so the tests need no model download"""
+    cache_name = "hashed-test"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return 16
+
+    def get_stats(self):
+        return {}
+
+@pytest.fixture
+def pipeline_factory(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIRECTORY", str(tmp_path / "chroma_db"))
+    monkeypatch.setenv("CHUNKER", "sentence")
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    for name in ("CHROMA_SERVER_HOST", "DOCUMENT_STORE_PATH", "EMBEDDING_CACHE_DIRECTORY", "BM25_INDEX_DIRECTORY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(RAGPipeline, "_load_embedding_model", lambda self: HashedEmbedding())
+    return RAGPipeline
+
+def run(pipeline_factory, scenario):
+    async def main():
+        pipeline = pipeline_factory()
+        try:
+            await scenario(pipeline)
+        finally:
+            await pipeline.close()
+    asyncio.run(main())
+
+def make_chunks(texts, first_page: int = 1):
+    chunks, offset = [], 0
+    for index, text in enumerate(texts):
+        chunks.append(Chunk(index=index, text=text, start=offset, end=offset + len(text),
+                            page=first_page + index, page_end=first_page + index))
+        offset += len(text) + 1
+    return chunks
+
+async def index(pipeline: RAGPipeline, texts, source: str = SOURCE):
+    update = await pipeline.begin_source_update(source)
+    # Two batches, as ingestion hands chunks over
+    chunks = make_chunks(texts)
+    middle = len(chunks) // 2
+    await pipeline.add_chunks(update, chunks[:middle])
+    await pipeline.add_chunks(update, chunks[middle:])
+    return await pipeline.finish_source_update(update)
+
+async def stored(pipeline: RAGPipeline, source: str = SOURCE):
+    """Stored chunk text by id"""
+    results = await pipeline.vector_store.get(where={"source": source}, include=["documents"])
+    return dict(zip(results["ids"], results["documents"]))
+
+async def assert_consistent(pipeline: RAGPipeline, texts, source: str = SOURCE):
+    """The collection, keyword index and catalog hold exactly the chunks of texts"""
+    chunks = await stored(pipeline, source)
+    assert sorted(chunks.values()) == sorted(texts)
+    assert pipeline.collection.count() == len(chunks)
+    assert len(pipeline.bm25_index) == len(chunks)
+    assert all(chunk_id in pipeline.bm25_index for chunk_id in chunks)
+    assert pipeline.source_catalog.scope_chunk_ids(RetrievalFilter(sources=[source])) == set(chunks)
+
+VERSION_1 = [
+    "The intake valve opens at 40 psi.",
+    "Replace the pump seal every 500 hours.",
+    "Torque the bracket bolts to 25 Nm.",
+    "The relay trips above 85 degrees."
+]
+
+def test_first_index_adds_every_chunk(pipeline_factory):
+    async def scenario(pipeline):
+        summary = await index(pipeline, VERSION_1)
+        assert summary == {"chunks_added": 4, "chunks_updated": 0, "chunks_unchanged": 0, "chunks_deleted": 0}
+        await assert_consistent(pipeline, VERSION_1)
+
+    run(pipeline_factory, scenario)
+
+def test_unchanged_reindex_writes_nothing(pipeline_factory):
+    async def scenario(pipeline):
+        await index(pipeline, VERSION_1)
+        ids = set(await stored(pipeline))
+
+        summary = await index(pipeline, VERSION_1)
+        assert summary == {"chunks_added": 0, "chunks_updated": 0, "chunks_unchanged": 4, "chunks_deleted": 0}
+        assert set(await stored(pipeline)) == ids
+        await assert_consistent(pipeline, VERSION_1)
+
+    run(pipeline_factory, scenario)
+
+def test_modified_source_is_diffed(pipeline_factory):
+    async def scenario(pipeline):
+        await index(pipeline, VERSION_1)
+
+        # The second chunk is removed, so the two after it move up, and one is appended
+        version_2 = [VERSION_1[0], VERSION_1[2], VERSION_1[3], "Flush the filter housing monthly."]
+        summary = await index(pipeline, version_2)
+        assert summary == {"chunks_added": 1, "chunks_updated": 2, "chunks_unchanged": 1, "chunks_deleted": 1}
+        await assert_consistent(pipeline, version_2)
+
+        # Moved chunks carry their new position
+        results = await pipeline.vector_store.get(where={"source": SOURCE}, include=["documents", "metadatas"])
+        positions = {text: meta["chunk_index"] for text, meta in zip(results["documents"], results["metadatas"])}
+        assert positions == {text: index for index, text in enumerate(version_2)}
+
+        # An edited chunk is a new chunk; its old text is gone
+        version_3 = [version_2[0], "Torque the bracket bolts to 30 Nm.", version_2[2], version_2[3]]
+        summary = await index(pipeline, version_3)
+        assert summary == {"chunks_added": 1, "chunks_updated": 0, "chunks_unchanged": 3, "chunks_deleted": 1}
+        await assert_consistent(pipeline, version_3)
+
+    run(pipeline_factory, scenario)
+
+def test_repeated_text_keeps_one_chunk_per_occurrence(pipeline_factory):
+    async def scenario(pipeline):
+        texts = ["Check the gauge.", "Close the valve.", "Check the gauge."]
+        await index(pipeline, texts)
+        await assert_consistent(pipeline, texts)
+
+        summary = await index(pipeline, texts[:2])
+        assert summary["chunks_deleted"] == 1
+        await assert_consistent(pipeline, texts[:2])
+
+    run(pipeline_factory, scenario)
+
+def test_sources_are_diffed_separately(pipeline_factory):
+    async def scenario(pipeline):
+        await index(pipeline, VERSION_1)
+        await index(pipeline, VERSION_1[:2], source="other.pdf")
+
+        summary = await index(pipeline, VERSION_1[:1])
+        assert summary["chunks_deleted"] == 3
+        assert sorted((await stored(pipeline)).values()) == VERSION_1[:1]
+        assert sorted((await stored(pipeline, "other.pdf")).values()) == sorted(VERSION_1[:2])
+        assert pipeline.collection.count() == 3
+        assert len(pipeline.bm25_index) == 3
+
+    run(pipeline_factory, scenario)
+
+def test_abort_leaves_the_stored_version(pipeline_factory):
+    async def scenario(pipeline):
+        await index(pipeline, VERSION_1)
+        before = await pipeline.vector_store.get(where={"source": SOURCE}, include=["metadatas"])
+
+        update = await pipeline.begin_source_update(SOURCE)
+        await pipeline.add_chunks(update, make_chunks(["A chunk that never lands.", *VERSION_1]))
+        assert update.added and update.moved
+        await pipeline.abort_source_update(update)
+
+        await assert_consistent(pipeline, VERSION_1)
+        after = await pipeline.vector_store.get(where={"source": SOURCE}, include=["metadatas"])
+        assert dict(zip(after["ids"], after["metadatas"])) == dict(zip(before["ids"], before["metadatas"]))
+
+    run(pipeline_factory, scenario)
+
+def test_concurrent_updates_of_a_source_leave_no_stale_chunks(pipeline_factory):
+    async def scenario(pipeline):
+        await index(pipeline, VERSION_1)
+        first = ["First upload, first chunk.", "First upload, second chunk."]
+        second = ["Second upload, only chunk."]
+
+        async def slow_index(texts):
+            update = await pipeline.begin_source_update(SOURCE)
+            await pipeline.add_chunks(update, make_chunks(texts))
+            await asyncio.sleep(0.05)
+            return await pipeline.finish_source_update(update)
+
+        summaries = await asyncio.gather(slow_index(first), slow_index(second))
+        # The second update waited for the first and diffed against its chunks
+        assert summaries[0]["chunks_deleted"] == 4
+        assert summaries[1]["chunks_deleted"] == 2
+        await assert_consistent(pipeline, second)
+
+    run(pipeline_factory, scenario)
+
+def test_delete_waits_for_an_update_in_progress(pipeline_factory):
+    async def scenario(pipeline):
+        update = await pipeline.begin_source_update(SOURCE)
+        await pipeline.add_chunks(update, make_chunks(VERSION_1))
+
+        deleting = asyncio.create_task(pipeline.delete_source(SOURCE))
+        await asyncio.sleep(0.05)
+        assert not deleting.done()
+
+        await pipeline.finish_source_update(update)
+        assert await deleting == 4
+        await assert_consistent(pipeline, [])
+
+    run(pipeline_factory, scenario)
+
+def test_source_lock_is_released_after_errors(pipeline_factory):
+    async def scenario(pipeline):
+        update = await pipeline.begin_source_update(SOURCE)
+        await pipeline.abort_source_update(update)
+        # A second abort, as after a failed finish, releases nothing twice
+        await pipeline.abort_source_update(update)
+
+        await asyncio.wait_for(index(pipeline, VERSION_1), 10)
+        await asyncio.wait_for(pipeline.delete_source(SOURCE), 10)
+        assert pipeline._source_locks == {}
+
+    run(pipeline_factory, scenario)
@@ -0,0 +1,240 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_MODES = ("off", "exact", "hnsw", "auto")
+
+class VectorIndex:
+    def __init__(self, dimension: int, mode: str = "auto", dtype: str = "float32",
+                 hnsw_threshold: int = 200000, hnsw_m: int = 16, hnsw_ef_construction: int = 200,
+                 hnsw_ef_search: int = 100, block_rows: int = 16384):
+        """In-process copy of the collection's embeddings, searched instead of going through Chroma
+
+        Normalized embeddings are kept in one contiguous float32 or float16
+        matrix and searched exactly with a matrix product. In hnsw mode, or in
+        auto mode once the index holds hnsw_threshold chunks, unscoped searches
+        go through an HNSW graph instead; searches inside a filter scope are
+        always exact over the scope's rows.
+        """
+        if mode not in VECTOR_INDEX_MODES or mode == "off":
+            raise ValueError(f"Unknown vector index mode: {mode}")
+        self.dimension = dimension
+        self.mode = mode
+        self.dtype = np.dtype(dtype)
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        # float16 rows are converted to float32 this many at a time, since NumPy has no float16 BLAS
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+        self._reset()
+
+        # Counters
+        self.exact_searches = 0
+        self.hnsw_searches = 0
+        self.compactions = 0
+        self.hnsw_builds = 0
+
+    def _reset(self):
+        # Rows are only ever appended; removed rows are masked out until the next compaction,
+        # so a search can keep using the arrays it started with while chunks are added
+        self._matrix = np.zeros((0, self.dimension), dtype=self.dtype)
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._dead = 0
+        self._hnsw = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._rows
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def add(self, ids: Sequence[str], embeddings):
+        """Add chunks; ids already in the index are skipped, since chunk ids are content addressed"""
+        vectors = self._normalize(embeddings)
+        with self._lock:
+            keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._rows]
+            if not keep:
+                return
+            count = len(self._ids)
+            needed = count + len(keep)
+            if needed > len(self._matrix):
+                # Grow geometrically into fresh arrays; running searches hold the old ones
+                capacity = max(needed, 2 * len(self._matrix), 1024)
+                matrix = np.zeros((capacity, self.dimension), dtype=self.dtype)
+                matrix[:count] = self._matrix[:count]
+                live = np.zeros(capacity, dtype=bool)
+                live[:count] = self._live[:count]
+                self._matrix, self._live = matrix, live
+            self._matrix[count:needed] = vectors[keep]
+            self._live[count:needed] = True
+            for row, i in enumerate(keep, start=count):
+                self._ids.append(ids[i])
+                self._rows[ids[i]] = row
+
+            if self._hnsw is not None:
+                if needed > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(max(needed, 2 * self._hnsw.get_max_elements()))
+                self._hnsw.add_items(vectors[keep], np.arange(count, needed))
+            elif self._wants_hnsw():
+                self._build_hnsw()
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """Drop chunks from the index; returns how many were present"""
+        removed = 0
+        with self._lock:
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                self._live[row] = False
+                self._ids[row] = None
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+                removed += 1
+            self._dead += removed
+            if self._dead > max(1024, len(self._ids) // 4):
+                self._compact()
+        return removed
+
+    def _compact(self):
+        """Rewrite the matrix without removed rows"""
+        rows = np.flatnonzero(self._live[:len(self._ids)])
+        self._matrix = self._matrix[rows].copy()
+        self._live = np.ones(len(rows), dtype=bool)
+        self._ids = [self._ids[row] for row in rows]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._dead = 0
+        self.compactions += 1
+        if self._hnsw is not None:
+            self._build_hnsw()
+
+    def _wants_hnsw(self) -> bool:
+        return self.mode == "hnsw" or (self.mode == "auto" and len(self._rows) >= self.hnsw_threshold)
+
+    def _build_hnsw(self):
+        """Build the HNSW graph over every live row; chroma-hnswlib is installed with chromadb"""
+        try:
+            import hnswlib
+        except ImportError:
+            logger.warning("hnswlib is not installed; the vector index searches exactly")
+            self.mode = "exact"
+            return
+
+        count = len(self._ids)
+        rows = np.flatnonzero(self._live[:count])
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(max_elements=max(count, 1024), M=self.hnsw_m, ef_construction=self.hnsw_ef_construction)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            index.add_items(self._matrix[block].astype(np.float32), block)
+        index.set_ef(self.hnsw_ef_search)
+        self._hnsw = index
+        self.hnsw_builds += 1
+        logger.info(f"Built HNSW graph over {len(rows)} chunks")
+
+    def _similarities(self, matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row with every query, as a (rows, queries) array"""
+        if matrix.dtype == np.float32:
+            return matrix @ queries.T
+        scores = np.empty((len(matrix), len(queries)), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_rows):
+            block = matrix[start:start + self.block_rows].astype(np.float32)
+            scores[start:start + len(block)] = block @ queries.T
+        return scores
+
+    @staticmethod
+    def _top_k(similarities: np.ndarray, k: int) -> np.ndarray:
+        if len(similarities) > k:
+            top = np.argpartition(-similarities, k)[:k]
+        else:
+            top = np.arange(len(similarities))
+        return top[np.argsort(-similarities[top], kind="stable")]
+
+    def search(self, query_embedding, k: int, allowed_ids=None) -> List[Tuple[str, float]]:
+        """Nearest chunks as (chunk id, cosine distance), optionally only among allowed_ids"""
+        return self.search_batch([query_embedding], k, allowed_ids)[0]
+
+    def search_batch(self, query_embeddings, k: int, allowed_ids=None) -> List[List[Tuple[str, float]]]:
+        """Nearest chunks for each query with one matrix product or one HNSW call"""
+        queries = self._normalize(query_embeddings)
+        with self._lock:
+            # Rows below count stay valid: adds write past it, growth and compaction allocate new arrays,
+            # and a row removed meanwhile reads as None in ids
+            count, matrix, live, ids = len(self._ids), self._matrix, self._live, self._ids
+            live_count = len(self._rows)
+            rows = None
+            if allowed_ids is not None:
+                rows = np.fromiter(
+                    (self._rows[chunk_id] for chunk_id in allowed_ids if chunk_id in self._rows), dtype=np.int64
+                )
+            if k <= 0 or live_count == 0 or (rows is not None and len(rows) == 0):
+                return [[] for _ in queries]
+            
+            if rows is None and self._hnsw is not None:
+                # The graph is not safe to query while it is resized, so HNSW searches hold the lock
+                self.hnsw_searches += len(queries)
+                labels, distances = self._hnsw.knn_query(queries, k=min(k, live_count))
+                return [
+                    [(ids[label], float(distance)) for label, distance in zip(query_labels, query_distances)
+                     if ids[label] is not None]
+                    for query_labels, query_distances in zip(labels, distances)
+                ]
+        
+        self.exact_searches += len(queries)
+        if rows is None:
+            similarities = self._similarities(matrix[:count], queries)
+            if live_count < count:
+                similarities[~live[:count]] = -np.inf
+        else:
+            similarities = self._similarities(matrix[rows], queries)
+        results = []
+        for column in range(len(queries)):
+            scores = similarities[:, column]
+            top = self._top_k(scores, k)
+            neighbours = []
+            for row in top:
+                chunk_id = ids[row if rows is None else rows[row]]
+                if chunk_id is not None and np.isfinite(scores[row]):
+                    neighbours.append((chunk_id, float(1.0 - scores[row])))
+            results.append(neighbours)
+        return results
+
+    def memory_bytes(self) -> int:
+        """Matrix capacity plus an estimate of the HNSW graph (links and its float32 copy of the vectors)"""
+        size = self._matrix.nbytes + self._live.nbytes
+        if self._hnsw is not None:
+            size += self._hnsw.get_max_elements() * (self.dimension * 4 + self.hnsw_m * 2 * 4 + 16)
+        return size
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "hnsw_active": self._hnsw is not None,
+            "dtype": self.dtype.name,
+            "chunks": len(self._rows),
+            "removed_rows": self._dead,
+            "memory_mb": round(self.memory_bytes() / 1024 / 1024, 1),
+            "exact_searches": self.exact_searches,
+            "hnsw_searches": self.hnsw_searches,
+            "compactions": self.compactions,
+            "hnsw_builds": self.hnsw_builds
+        }
@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class AsyncVectorStore:
+    def __init__(self, collection, max_workers: int = 4):
+        """Wrap a ChromaDB collection so its blocking calls run off the event loop"""
+        self.collection = collection
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="vector-store"
+        )
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking collection call in the vector store executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def add(self, ids: List[str], embeddings: List[List[float]],
+                  documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Add embeddings and documents to the collection"""
+        return await self._run(
+            self.collection.add,
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    async def get(self, where: Optional[Dict[str, Any]] = None, ids: Optional[List[str]] = None,
+                  include: Optional[List[str]] = None, limit: Optional[int] = None,
+                  offset: Optional[int] = None):
+        """Fetch entries by id or metadata filter"""
+        return await self._run(
+            self.collection.get,
+            ids=ids,
+            where=where,
+            include=include if include is not None else ["metadatas"],
+            limit=limit,
+            offset=offset
+        )
+
+    async def update(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of existing entries"""
+        return await self._run(self.collection.update, ids=ids, metadatas=metadatas)
+
+    async def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """Delete entries by id or metadata filter"""
+        return await self._run(self.collection.delete, ids=ids, where=where)
+
+    async def query(self, query_embeddings: List[List[float]], n_results: int,
+                    include: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """Run a nearest-neighbour query against the collection"""
+        kwargs = {
+            "query_embeddings": query_embeddings,
+            "n_results": n_results,
+            "include": include or ["documents", "metadatas", "distances"],
+        }
+        if where:
+            kwargs["where"] = where
+        return await self._run(self.collection.query, **kwargs)
+
+    async def count(self) -> int:
+        """Return the number of embeddings in the collection"""
+        return await self._run(self.collection.count)
+
+    def shutdown(self):
+        """Stop the executor once pending calls have finished"""
+        self._executor.shutdown(wait=True)
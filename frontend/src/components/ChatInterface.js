@@ -7,6 +7,8 @@ const ChatInterface = () => {
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef(null);
+  // One conversation per page load, so follow-up questions keep their context
+  const sessionId = useRef(`chat-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -30,7 +32,8 @@ const ChatInterface = () => {
 
     try {
       const response = await axios.post('/chat', {
-        message: userMessage
+        message: userMessage,
+        session_id: sessionId.current
       });
 
       // Add assistant response to chat
@@ -57,8 +57,22 @@ const DocumentUpload = ({ onUploadSuccess }) => {
         },
       });
 
+      // Ingestion runs in the background; poll the job until it finishes
+      let job = { status: response.data.status };
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`/jobs/${response.data.job_id}`)).data;
+        if (job.pages_total > 0) {
+          setUploadMessage(`Processing document... ${job.pages_done}/${job.pages_total} pages`);
+        }
+      }
+
+      if (job.status !== 'completed') {
+        throw new Error(job.error || `Document processing ${job.status}`);
+      }
+
       setUploadStatus('success');
-      setUploadMessage(response.data.message);
+      setUploadMessage(`Document '${response.data.filename}' has been successfully added to the knowledge base`);
       
       // Reload documents list
       await loadDocuments();
@@ -78,7 +92,7 @@ const DocumentUpload = ({ onUploadSuccess }) => {
       console.error('Upload error:', error);
       setUploadStatus('error');
       setUploadMessage(
-        error.response?.data?.detail || 'Failed to upload document. Please try again.'
+        error.response?.data?.detail || error.message || 'Failed to upload document. Please try again.'
       );
     }
   }, [onUploadSuccess]);